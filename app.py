@@ -3,6 +3,10 @@ from flask import Flask
 from flask_cors import CORS
 
 from routes.smartapi_routes import smartapi_bp
+from services.tickerdata_service import ensure_indexes
+from services.quote_stream import ensure_stream
+from services.watchlists import ensure_watchlist_indexes, get_watchlists
+from config.settings import STREAM_ENABLED
 
 # creates an instance of a class
 app = Flask(__name__)  
@@ -10,6 +14,13 @@ CORS(app)
 
 app.register_blueprint(smartapi_bp, url_prefix="/api") 
 
+ensure_indexes()
+ensure_watchlist_indexes()
+
+# Live quotes for every watchlist, following edits to them (gunicorn workers start their own on first request)
+if STREAM_ENABLED:
+    get_watchlists().track(ensure_stream)
+
 if __name__ == "__main__":
     print("Flask server is starting on http://0.0.0.0:5001")
     app.run(debug=True, host='0.0.0.0', port=5001)
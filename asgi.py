@@ -0,0 +1,82 @@
+# ASGI entry point: uvicorn asgi:app --workers N
+#
+# The routes in ASYNC_ROUTES run on the event loop with the async service layer,
+# so one process holds many broker calls in flight. Every other request goes to
+# the Flask app (smartapi_bp and all), run in a thread pool by asgiref.
+import time
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import parse_accept_header
+
+from app import app as flask_app
+import controllers.async_controllers as actrl
+from services.async_smartapi_service import close_client
+from utils.json_response import dumps, compress
+from utils.logger import get_logger
+from utils.metrics import HTTP_REQUEST_SECONDS
+
+log = get_logger("asgi")
+
+ASYNC_ROUTES = {
+    ("GET", "/api/combined_data"): actrl.combined_data,
+    ("GET", "/api/ticker_data"): actrl.ticker_data,
+}
+
+_flask = WsgiToAsgi(flask_app)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _respond(scope, send, payload, status):
+    headers = dict((k.decode("latin-1").lower(), v.decode("latin-1")) for k, v in scope["headers"])
+    body = dumps(payload)
+    response_headers = [(b"content-type", b"application/json")]
+    # What CORS(app) in app.py sends for the Flask routes: the caller's origin echoed, otherwise *
+    origin = headers.get("origin")
+    if origin:
+        response_headers += [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Accept-Encoding, Origin")]
+    else:
+        response_headers += [(b"access-control-allow-origin", b"*"), (b"vary", b"Accept-Encoding")]
+    if status == 200:
+        body, encoding = compress(body, parse_accept_header(headers.get("accept-encoding")))
+        if encoding:
+            response_headers.append((b"content-encoding", encoding.encode()))
+    response_headers.append((b"content-length", str(len(body)).encode()))
+
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if handler is None:
+        return await _flask(scope, receive, send)
+
+    started = time.perf_counter()
+    # First value per key, like request.args.get
+    args = {}
+    for key, value in parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True):
+        args.setdefault(key, value)
+
+    try:
+        payload, status = await handler(args)
+    except Exception as e:
+        log.error("Error in %s: %s", scope["path"], e)
+        payload, status = {"error": str(e)}, 500
+
+    await _respond(scope, send, payload, status)
+    # Route label as the Flask rule would have it (the blueprint is mounted at /api)
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=scope["path"], method=scope["method"], status=status)
@@ -0,0 +1,214 @@
+"""
+Bulk-load candle history for the watchlists into the local candle store.
+
+    python backfill.py --interval ONE_MINUTE --from 2024-01-01 [--to 2024-12-31]
+                       [--list default] [--symbols RELIANCE-EQ,TCS-EQ] [--workers 3] [--restart]
+
+Each symbol's missing range is split into broker-sized windows, fetched
+oldest to newest through the shared rate limiter, and written to the store in
+one go. Symbols run in parallel on a bounded pool. Every window is checkpointed
+as it arrives, so an interrupted run picks up where it stopped.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from config.settings import BACKFILL_DIR
+from services.candle_store import (
+    IST,
+    INTERVAL_SECONDS,
+    CANDLE_DTYPE,
+    broker_windows,
+    fetch_range,
+    final_before,
+    merge,
+    missing_ranges,
+    store_range,
+)
+from services.smartapi_service import resolve_symboltoken
+from services.watchlists import tracked_stocks
+from utils.logger import get_logger
+
+log = get_logger("backfill")
+
+# Attempts per window before the symbol is marked failed
+WINDOW_ATTEMPTS = 4
+
+
+class Checkpoint:
+    """
+    JSON state per symbol ({"status", "next", "error"}) plus the bars fetched so
+    far, one .npy per window in a directory per symbol. A window only adds its
+    own file, so checkpointing costs the same at the end of a long run as at
+    the start.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "state.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.state = {}
+
+    def _bars_dir(self, key):
+        return os.path.join(self.directory, key.replace(":", "_"))
+
+    def get(self, key):
+        return self.state.get(key, {})
+
+    def bars(self, key):
+        try:
+            names = sorted(n for n in os.listdir(self._bars_dir(key)) if n.endswith(".npy"))
+        except FileNotFoundError:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return merge(*(np.load(os.path.join(self._bars_dir(key), n)) for n in names))
+
+    def update(self, key, bars=None, **fields):
+        with self._lock:
+            if bars is not None:
+                # Named after the window end: a window fetched again after a crash replaces its file
+                os.makedirs(self._bars_dir(key), exist_ok=True)
+                path = os.path.join(self._bars_dir(key), f"{fields['next']:012d}.npy")
+                with open(f"{path}.tmp", "wb") as f:
+                    np.save(f, bars)
+                os.replace(f"{path}.tmp", path)
+            elif fields.get("status") == "done":
+                # Bars are in the store now
+                shutil.rmtree(self._bars_dir(key), ignore_errors=True)
+
+            self.state.setdefault(key, {}).update(fields)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.state, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+def _fetch_window(exchange, symboltoken, interval, start, end):
+    for attempt in range(1, WINDOW_ATTEMPTS + 1):
+        try:
+            return fetch_range(exchange, symboltoken, interval, start, end - 1)
+        except Exception as e:
+            if attempt == WINDOW_ATTEMPTS:
+                raise
+            # Broker-side throttling shows up as errors; back off and retry
+            log.warning("%s:%s window %s-%s failed (%s), retry %d", exchange, symboltoken, start, end, e, attempt)
+            time.sleep(2 ** attempt)
+
+
+def backfill_symbol(stock, interval, from_ts, to_ts, checkpoint):
+    exchange, tradingsymbol = stock["exchange"], stock["tradingsymbol"]
+    key = f"{exchange}:{tradingsymbol}:{interval}"
+    progress = checkpoint.get(key)
+    if progress.get("status") == "done":
+        return key, "skipped", 0
+
+    symboltoken = resolve_symboltoken(tradingsymbol, exchange)
+
+    # Resume: bars and position from the last run, otherwise start at the oldest gap
+    parts = [checkpoint.bars(key)] if progress.get("status") == "partial" else []
+    ranges = missing_ranges(exchange, symboltoken, interval, from_ts, to_ts)
+    windows = [w for start, end in ranges for w in broker_windows(interval, start, end)]
+    resume_from = progress.get("next", 0) if progress.get("status") == "partial" else 0
+
+    calls = 0
+    for start, end in windows:
+        if end <= resume_from:
+            continue
+        window = _fetch_window(exchange, symboltoken, interval, start, end)
+        parts.append(window)
+        calls += 1
+        checkpoint.update(key, bars=window, status="partial", next=end)
+    bars = merge(*parts)
+
+    # One bulk write per contiguous range
+    for start, end in ranges:
+        part = bars[(bars["ts"] >= start) & (bars["ts"] < end)]
+        store_range(exchange, symboltoken, interval, part, start, end)
+
+    checkpoint.update(key, status="done", rows=int(len(bars)), error=None)
+    return key, "done", calls
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=IST)
+
+
+def run_backfill(stocks, interval, from_ts, to_ts, run_dir, workers=3):
+    """Backfill `stocks` into the store, checkpointing under run_dir. Returns the number of failed symbols."""
+    # Only complete bars are persisted
+    to_ts = min(to_ts, final_before(interval))
+    checkpoint = Checkpoint(run_dir)
+
+    started = time.monotonic()
+    failed = 0
+    calls = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+        futures = {pool.submit(backfill_symbol, s, interval, from_ts, to_ts, checkpoint): s for s in stocks}
+        for future in as_completed(futures):
+            stock = futures[future]
+            key = f"{stock['exchange']}:{stock['tradingsymbol']}:{interval}"
+            try:
+                _, status, made = future.result()
+                calls += made
+                log.info("%s %s (%d calls)", key, status, made)
+            except Exception as e:
+                failed += 1
+                checkpoint.update(key, status=checkpoint.get(key).get("status", "failed"), error=str(e))
+                log.error("%s failed: %s", key, e)
+
+    log.info(
+        "Backfilled %d/%d symbols, %d broker calls in %.1fs",
+        len(stocks) - failed, len(stocks), calls, time.monotonic() - started,
+    )
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", default="ONE_DAY", choices=list(INTERVAL_SECONDS))
+    parser.add_argument("--from", dest="from_date", required=True, help="YYYY-MM-DD (IST)")
+    parser.add_argument("--to", dest="to_date", help="YYYY-MM-DD (IST), default now")
+    parser.add_argument("--list", help="Watchlist to backfill, default every symbol of every watchlist")
+    parser.add_argument("--symbols", help="Comma-separated tradingsymbols, default the whole list")
+    parser.add_argument("--workers", type=int, default=3, help="Symbols fetched in parallel (the rate limit still applies)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous run")
+    args = parser.parse_args(argv)
+
+    from_ts = int(_parse_date(args.from_date).timestamp())
+    to_ts = int(_parse_date(args.to_date).timestamp()) if args.to_date else int(time.time())
+
+    try:
+        stocks = tracked_stocks(args.list)
+    except LookupError as e:
+        parser.error(str(e))
+    if args.symbols:
+        wanted = {s.strip().upper() for s in args.symbols.split(",")}
+        stocks = [s for s in stocks if s["tradingsymbol"] in wanted]
+
+    # An open-ended run is checkpointed per day, so tomorrow's run is not "done" already
+    to_label = args.to_date or datetime.now(IST).strftime("%Y-%m-%d")
+    run_dir = os.path.join(BACKFILL_DIR, f"{args.interval}_{args.from_date}_{to_label}")
+    if args.restart:
+        # State and the bars of unfinished symbols
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    print(f"📥 Backfilling {len(stocks)} symbols, {args.interval}, {args.from_date} → {args.to_date or 'now'}")
+    failed = run_backfill(stocks, args.interval, from_ts, to_ts, run_dir, args.workers)
+    print(f"❌ {failed} symbols failed, rerun to retry them" if failed else "🏁 Done")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+SmartConnect stand-in for benchmarks.
+
+FakeSmartConnect answers from recorded responses when it has one for the
+exact call, and otherwise synthesizes a response of the same shape from a
+deterministic instrument universe (the watchlist, index spots and NIFTY
+options). Every call sleeps for the profile's latency and may fail the way
+the broker does: an error payload, or a throttle that the SDK surfaces as an
+exception. Only methods the real SDK has exist here, so a route that calls
+anything else fails the same way it does in production.
+
+Record responses from the live API (uses key_secret.txt):
+
+    python -m benchmarks.fake_broker --record benchmarks/fixtures/smartapi.json [--symbols 5]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# latency_ms: median; jitter: sigma of the lognormal spread around it;
+# error_rate/throttle_rate: share of calls that fail that way
+PROFILES = {
+    "instant": {"latency_ms": 0, "jitter": 0.0, "error_rate": 0.0, "throttle_rate": 0.0},
+    "typical": {"latency_ms": 60, "jitter": 0.5, "error_rate": 0.002, "throttle_rate": 0.01},
+    "degraded": {"latency_ms": 250, "jitter": 0.8, "error_rate": 0.05, "throttle_rate": 0.1},
+}
+
+ERROR_RESPONSE = {"status": False, "message": "Something Went Wrong, Please Try After Sometime", "errorcode": "AB1004", "data": None}
+THROTTLE_MESSAGE = "Couldn't parse the JSON response received from the server: Access denied because of exceeding access rate"
+
+INDEX_SPOTS = {"NIFTY": ("NSE", "NIFTY 50", "99926000", 24000.0), "BANKNIFTY": ("NSE", "NIFTY BANK", "99926009", 52000.0)}
+
+_INDEX_PRICES = {token: spot for _, _, token, spot in INDEX_SPOTS.values()}
+
+_INTERVAL_MINUTES = {
+    "ONE_MINUTE": 1, "THREE_MINUTE": 3, "FIVE_MINUTE": 5, "TEN_MINUTE": 10, "FIFTEEN_MINUTE": 15,
+    "THIRTY_MINUTE": 30, "ONE_HOUR": 60, "ONE_DAY": 1440,
+}
+
+
+def _token_for(symbol):
+    return str(10000 + zlib.crc32(symbol.encode()) % 80000)
+
+
+def _base_price(token):
+    return 50 + zlib.crc32(str(token).encode()) % 4000
+
+
+def _expiries(today, count=2):
+    # Upcoming Thursdays
+    day = today + timedelta(days=(3 - today.weekday()) % 7)
+    return [day + timedelta(weeks=i) for i in range(count)]
+
+
+def universe(stocks, today=None):
+    """Scrip-master rows (as the broker's JSON dump) for everything the fake can quote."""
+    today = today or datetime.now(IST).date()
+    rows = []
+    for stock in stocks:
+        rows.append({
+            "token": _token_for(stock["tradingsymbol"]), "symbol": stock["tradingsymbol"],
+            "name": stock["tradingsymbol"].rsplit("-", 1)[0], "expiry": "", "strike": "-1.000000",
+            "lotsize": "1", "instrumenttype": "", "exch_seg": stock["exchange"], "tick_size": "5.000000",
+        })
+    for name, (exchange, symbol, token, spot) in INDEX_SPOTS.items():
+        rows.append({
+            "token": token, "symbol": symbol, "name": symbol, "expiry": "", "strike": "0.000000",
+            "lotsize": "1", "instrumenttype": "AMXIDX", "exch_seg": exchange, "tick_size": "0.000000",
+        })
+        step = 50 if name == "NIFTY" else 100
+        for expiry in _expiries(today):
+            label = expiry.strftime("%d%b%Y").upper()
+            for i in range(-20, 21):
+                strike = spot + i * step
+                for side in ("CE", "PE"):
+                    symbol_name = f"{name}{expiry:%d%b%y}{int(strike)}{side}".upper()
+                    rows.append({
+                        "token": _token_for(symbol_name), "symbol": symbol_name, "name": name, "expiry": label,
+                        "strike": f"{strike * 100:.6f}", "lotsize": "75", "instrumenttype": "OPTIDX",
+                        "exch_seg": "NFO", "tick_size": "5.000000",
+                    })
+    return rows
+
+
+def _call_key(args, kwargs):
+    return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+class BrokerStats:
+    """Call counts by method. Calls made from threads inside background() are counted apart."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.calls = Counter()
+        self.failures = Counter()
+        self.background_calls = 0
+
+    @contextmanager
+    def background(self):
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = False
+
+    def count(self, method, failure=None):
+        with self._lock:
+            if getattr(self._local, "background", False):
+                self.background_calls += 1
+                return
+            self.calls[method] += 1
+            if failure:
+                self.failures[f"{method}:{failure}"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "failures": dict(self.failures),
+                "total": sum(self.calls.values()),
+                "background": self.background_calls,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.failures.clear()
+            self.background_calls = 0
+
+
+class FakeSmartConnect:
+    """Drop-in for SmartApi.smartConnect.SmartConnect; configure() sets profile and recordings for all instances."""
+
+    profile = PROFILES["instant"]
+    recorded = {}
+    instruments = {}
+    _by_symbol = {}
+    stats = BrokerStats()
+    _rng = random.Random(0)
+    _rng_lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, profile="instant", recordings=None, rows=(), seed=0):
+        cls.profile = PROFILES[profile] if isinstance(profile, str) else profile
+        cls.recorded = {}
+        if recordings:
+            with open(recordings) as f:
+                cls.recorded = json.load(f)
+        cls.instruments = {(row["exch_seg"], row["token"]): row for row in rows}
+        cls._by_symbol = {(row["exch_seg"], row["symbol"]): row for row in rows}
+        cls._rng = random.Random(seed)
+        cls.stats.reset()
+
+    def __init__(self, api_key=None, access_token=None, refresh_token=None, feed_token=None, userId=None, **kwargs):
+        self.api_key = api_key
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.feed_token = feed_token
+        self.userId = userId
+
+    # ---------- call plumbing ----------
+
+    def _draw(self):
+        with self._rng_lock:
+            return self._rng.random(), self._rng.gauss(0, 1)
+
+    def _call(self, method, args, kwargs, synthesize):
+        profile = self.profile
+        roll, spread = self._draw()
+        if profile["latency_ms"]:
+            time.sleep(profile["latency_ms"] * math.exp(profile["jitter"] * spread) / 1000)
+
+        if roll < profile["throttle_rate"]:
+            self.stats.count(method, "throttled")
+            raise Exception(THROTTLE_MESSAGE)
+        if roll < profile["throttle_rate"] + profile["error_rate"]:
+            self.stats.count(method, "error")
+            return dict(ERROR_RESPONSE)
+
+        self.stats.count(method)
+        recorded = self.recorded.get(method, {}).get(_call_key(args, kwargs))
+        return recorded if recorded is not None else synthesize()
+
+    def _quote(self, exchange, token, mode):
+        row = self.instruments.get((exchange, str(token)))
+        if row is None:
+            return None
+        if row["exch_seg"] == "NFO":
+            base = 5 + zlib.crc32(row["symbol"].encode()) % 400
+        else:
+            base = _INDEX_PRICES.get(str(token)) or _base_price(token)
+        minute = time.time() / 60
+        ltp = round(base * (1 + 0.01 * math.sin(minute)), 2)
+        quote = {"exchange": exchange, "tradingSymbol": row["symbol"], "symbolToken": str(token), "ltp": ltp}
+        if mode in ("OHLC", "FULL"):
+            quote.update({"open": round(base, 2), "high": round(base * 1.02, 2), "low": round(base * 0.98, 2), "close": round(base, 2)})
+        if mode == "FULL":
+            quote.update({
+                "lastTradeQty": 25, "netChange": round(ltp - base, 2), "percentChange": round((ltp - base) / base * 100, 2),
+                "avgPrice": round(base, 2), "tradeVolume": 1000 + int(base) * 7, "opnInterest": 5000 + int(base) * 11,
+                "lowerCircuit": round(base * 0.9, 2), "upperCircuit": round(base * 1.1, 2),
+                "totBuyQuan": 1000, "totSellQuan": 1000, "52WeekLow": round(base * 0.7, 2), "52WeekHigh": round(base * 1.3, 2),
+                "exchFeedTime": datetime.now(IST).strftime("%d-%b-%Y %H:%M:%S"), "exchTradeTime": datetime.now(IST).strftime("%d-%b-%Y %H:%M:%S"),
+                "depth": {"buy": [], "sell": []},
+            })
+        return quote
+
+    # ---------- SDK methods ----------
+
+    def generateSession(self, clientCode, password, totp):
+        def synthesize():
+            return {"status": True, "message": "SUCCESS", "errorcode": "", "data": {
+                "clientcode": clientCode, "jwtToken": "Bearer fake-jwt", "refreshToken": "fake-refresh", "feedToken": "fake-feed",
+            }}
+        response = self._call("generateSession", [clientCode], {}, synthesize)
+        if response.get("status"):
+            self.access_token, self.refresh_token = "fake-jwt", "fake-refresh"
+            self.feed_token, self.userId = "fake-feed", clientCode
+        return response
+
+    def searchScrip(self, exchange, searchscrip):
+        def synthesize():
+            needle = searchscrip.upper()
+            data = [
+                {"exchange": ex, "tradingsymbol": symbol, "symboltoken": row["token"]}
+                for (ex, symbol), row in self._by_symbol.items() if ex == exchange and needle in symbol
+            ]
+            return {"status": True, "message": "SUCCESS", "errorcode": "", "data": data[:50]}
+        return self._call("searchScrip", [exchange, searchscrip], {}, synthesize)
+
+    def ltpData(self, exchange, tradingsymbol, symboltoken):
+        def synthesize():
+            quote = self._quote(exchange, symboltoken, "OHLC")
+            if quote is None:
+                return dict(ERROR_RESPONSE)
+            return {"status": True, "message": "SUCCESS", "errorcode": "", "data": {
+                "exchange": exchange, "tradingsymbol": tradingsymbol, "symboltoken": symboltoken,
+                **{k: quote[k] for k in ("open", "high", "low", "close", "ltp")},
+            }}
+        return self._call("ltpData", [exchange, tradingsymbol, symboltoken], {}, synthesize)
+
+    def getMarketData(self, mode, exchangeTokens):
+        def synthesize():
+            fetched, unfetched = [], []
+            for exchange, tokens in exchangeTokens.items():
+                for token in tokens:
+                    quote = self._quote(exchange, token, mode)
+                    if quote is None:
+                        unfetched.append({"exchange": exchange, "symbolToken": token, "message": "Invalid Token", "errorCode": "AB4008"})
+                    else:
+                        fetched.append(quote)
+            return {"status": True, "message": "SUCCESS", "errorcode": "", "data": {"fetched": fetched, "unfetched": unfetched}}
+        return self._call("getMarketData", [mode, exchangeTokens], {}, synthesize)
+
+    def getCandleData(self, historicDataParams):
+        params = historicDataParams
+
+        def synthesize():
+            step = _INTERVAL_MINUTES[params["interval"]]
+            start = datetime.strptime(params["fromdate"], "%Y-%m-%d %H:%M")
+            end = datetime.strptime(params["todate"], "%Y-%m-%d %H:%M")
+            base = _base_price(params["symboltoken"])
+            rows = []
+            day = start.date()
+            while day <= end.date():
+                if day.weekday() < 5:
+                    if step == 1440:
+                        bars = [datetime.combine(day, datetime.min.time())]
+                    else:
+                        first = datetime(day.year, day.month, day.day, 9, 15)
+                        bars = [first + timedelta(minutes=step * i) for i in range(375 // step)]
+                    for ts in bars:
+                        if start <= ts <= end or (step == 1440 and start.date() <= ts.date() <= end.date()):
+                            drift = math.sin(ts.timestamp() / 86400 / 7)
+                            close = round(base * (1 + 0.05 * drift), 2)
+                            rows.append([
+                                ts.replace(tzinfo=IST).isoformat(), round(close * 0.995, 2), round(close * 1.01, 2),
+                                round(close * 0.99, 2), close, 10000 + int(base),
+                            ])
+                day += timedelta(days=1)
+            return {"status": True, "message": "SUCCESS", "errorcode": "", "data": rows}
+        return self._call("getCandleData", [params], {}, synthesize)
+
+    def setAccessToken(self, access_token):
+        self.access_token = access_token
+
+    def setRefreshToken(self, refresh_token):
+        self.refresh_token = refresh_token
+
+    def setFeedToken(self, feedToken):
+        self.feed_token = feedToken
+
+    def setUserId(self, id):
+        self.userId = id
+
+    def getfeedToken(self):
+        return self.feed_token
+
+    def terminateSession(self, clientCode):
+        return self._call("terminateSession", [clientCode], {}, lambda: {"status": True, "message": "SUCCESS", "data": "Logout Successfully"})
+
+
+# ---------- recording ----------
+
+def record(path, symbols=5):
+    """Call each endpoint the services use against the live API and save the responses in replay format."""
+    from SmartApi.smartConnect import SmartConnect
+
+    from config.settings import load_keys
+    from utils.stock_list import WATCHSTOCKLIST
+    from utils.totp import get_totp_token
+
+    keys = load_keys()
+    recorded = {}
+
+    def keep(method, args, response):
+        recorded.setdefault(method, {})[_call_key(args, {})] = response
+        return response
+
+    obj = SmartConnect(api_key=keys["API_KEY"])
+    obj.generateSession(keys["USERNAME"], keys["PASSWORD"], get_totp_token(keys["QR_CODE_KEY"]))
+
+    tokens = {}
+    for stock in WATCHSTOCKLIST[:symbols]:
+        exchange, symbol = stock["exchange"], stock["tradingsymbol"]
+        found = keep("searchScrip", [exchange, symbol], obj.searchScrip(exchange, symbol))
+        for row in (found or {}).get("data") or []:
+            if row["tradingsymbol"] == symbol:
+                tokens[(exchange, symbol)] = row["symboltoken"]
+        time.sleep(1)
+
+    today = date.today()
+    for (exchange, symbol), token in tokens.items():
+        keep("ltpData", [exchange, symbol, token], obj.ltpData(exchange, symbol, token))
+        params = {
+            "exchange": exchange, "symboltoken": token, "interval": "ONE_DAY",
+            "fromdate": f"{today - timedelta(days=365)} 09:15", "todate": f"{today} 15:30",
+        }
+        keep("getCandleData", [params], obj.getCandleData(params))
+        time.sleep(1)
+
+    by_exchange = {}
+    for (exchange, _), token in tokens.items():
+        by_exchange.setdefault(exchange, []).append(token)
+    for mode in ("LTP", "OHLC", "FULL"):
+        keep("getMarketData", [mode, by_exchange], obj.getMarketData(mode, by_exchange))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(recorded, f, indent=1)
+    print(f"💾 Recorded {sum(len(v) for v in recorded.values())} responses to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", required=True, metavar="PATH")
+    parser.add_argument("--symbols", type=int, default=5)
+    args = parser.parse_args()
+    record(args.record, args.symbols)
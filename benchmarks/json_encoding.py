@@ -0,0 +1,96 @@
+"""
+Serialization cost per endpoint: Flask's stdlib jsonify vs utils.json_response.
+
+    python -m benchmarks.json_encoding [--repeat N]
+
+Payloads are synthetic but shaped like the real responses (sizes in the table).
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import Flask, jsonify as flask_jsonify
+
+from utils.json_response import ENCODER_NAME, jsonify
+
+
+def _ticker_data():
+    return [{"name": f"Stock {i}", "ltp": round(random.uniform(100, 5000), 2), "changePercent": round(random.uniform(-5, 5), 2)} for i in range(91)]
+
+
+def _combined_data():
+    data = {
+        "exchange": "NSE", "tradingsymbol": "RELIANCE-EQ", "symboltoken": "2885", "ltp": 2510.5,
+        "latest_candle": {"datetime": "2025-01-01T00:00:00+05:30", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 1000},
+    }
+    data.update({f"DMA_{n}": np.float64(random.uniform(100, 200)) for n in (5, 30, 50, 200)})
+    return data
+
+
+def _option_chain():
+    expiry = datetime(2025, 1, 30)
+    return {"status": True, "data": [
+        {
+            "strikePrice": 20000 + 50 * i, "expiry": expiry, "optionType": side,
+            "ltp": random.uniform(1, 500), "openInterest": random.randint(0, 10 ** 6), "changeinOpenInterest": random.randint(-10 ** 5, 10 ** 5),
+            "impliedVolatility": random.uniform(10, 40), "totalTradedVolume": random.randint(0, 10 ** 7),
+            "bidprice": random.uniform(1, 500), "askPrice": random.uniform(1, 500), "lastUpdated": expiry - timedelta(minutes=i),
+        }
+        for i in range(400) for side in ("CE", "PE")
+    ]}
+
+
+def _master_contract():
+    return [
+        {"token": str(40000 + i), "symbol": f"NIFTY25JAN{20000 + i}CE", "name": "NIFTY", "expiry": "30JAN2025",
+         "strike": float(20000 + i), "lotsize": 25, "instrumenttype": "OPTIDX", "exch_seg": "NFO", "tick_size": 5.0}
+        for i in range(100000)
+    ]
+
+
+PAYLOADS = {
+    "ticker_data": _ticker_data,
+    "combined_data": _combined_data,
+    "option_chain": _option_chain,
+    "master_contract": _master_contract,
+}
+
+
+def _stdlib_safe(payload):
+    # Flask's provider can't encode NumPy scalars; give it the Python equivalents
+    if isinstance(payload, dict):
+        return {k: float(v) if isinstance(v, np.generic) else v for k, v in payload.items()}
+    return payload
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    print(f"encoder: {ENCODER_NAME}")
+    print(f"{'endpoint':<16}{'bytes':>12}{'stdlib ms':>12}{'fast ms':>12}{'speedup':>10}")
+    with app.app_context():
+        for name, make in PAYLOADS.items():
+            payload = make()
+            baseline = _stdlib_safe(payload)
+            size = len(jsonify(payload).get_data())
+            slow = _time(lambda: flask_jsonify(baseline).get_data(), args.repeat)
+            fast = _time(lambda: jsonify(payload).get_data(), args.repeat)
+            print(f"{name:<16}{size:>12}{slow * 1000:>12.2f}{fast * 1000:>12.2f}{slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
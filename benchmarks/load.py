@@ -0,0 +1,366 @@
+"""
+Latency and throughput of every smartapi_bp route and of the ticker refresh
+cycle, against FakeSmartConnect and an in-memory Mongo.
+
+    python -m benchmarks.load [--profile instant|typical|degraded] [--concurrency 8]
+                              [--requests 200] [--routes ticker_data,combined_data]
+                              [--recordings benchmarks/fixtures/smartapi.json]
+                              [--cache on|off] [--rate-limits off|real] [--out results.json]
+
+    python -m benchmarks.load --compare base.json head.json [--threshold 0.10]
+
+Each scenario resets the broker call counters and the RSS peak, sends
+--warmup unmeasured requests, then --requests requests from --concurrency
+threads. The JSON report has p50/p95/p99 latency (ms), throughput, status
+codes, broker calls by method and peak RSS per scenario. --compare prints
+the p95/throughput change per scenario and exits 1 on a regression beyond
+--threshold. /ticker_stream is left out: it is an endless event stream.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Watchlist symbols the per-symbol routes rotate through
+SYMBOLS = 20
+
+
+# ---------- environment ----------
+
+def _prepare_env(args, workdir):
+    """Point every store and limiter at a scratch directory; must run before the app is imported."""
+    from benchmarks.fake_broker import universe
+    from utils.stock_list import WATCHSTOCKLIST
+
+    rows = universe(WATCHSTOCKLIST)
+    source = os.path.join(workdir, "scrip_master.json")
+    with open(source, "w") as f:
+        json.dump(rows, f)
+
+    env = {
+        "SMARTAPI_STREAMING": "0",
+        "SMARTAPI_RATE_LIMIT_DIR": os.path.join(workdir, "ratelimit"),
+        "RESPONSE_CACHE_BACKEND": "sqlite" if args.cache == "on" else "off",
+        "RESPONSE_CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+        "CANDLE_STORE_BACKEND": "file",
+        "CANDLE_STORE_DIR": os.path.join(workdir, "candles"),
+        "INSTRUMENT_MASTER_ENABLED": "1",
+        "INSTRUMENT_MASTER_SOURCE": source,
+        "INSTRUMENT_MASTER_DIR": os.path.join(workdir, "instruments"),
+        "BACKFILL_DIR": os.path.join(workdir, "backfill"),
+    }
+    # Keep the report on stdout clean; LOG_LEVEL=INFO to see the services' logs
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.rate_limits == "off":
+        for name in ("login", "ltp", "quote", "search", "candle", "default"):
+            env[f"SMARTAPI_RATE_{name.upper()}"] = "100000/100000"
+    os.environ.update(env)
+    return rows
+
+
+def _install_fakes(args, rows):
+    from benchmarks.fake_broker import FakeSmartConnect
+    from benchmarks.memory_mongo import MemoryDatabase
+
+    # Never reach the configured cluster: the services import db from here
+    db_config = types.ModuleType("config.db_config")
+    db_config.db = MemoryDatabase()
+    db_config.client = None
+    sys.modules["config.db_config"] = db_config
+
+    FakeSmartConnect.configure(args.profile, args.recordings, rows, seed=args.seed)
+    import services.session_manager as session_manager
+    session_manager.SmartConnect = FakeSmartConnect
+
+    from services import instrument_master
+    instrument_master.refresh(force=True)
+    return FakeSmartConnect.stats
+
+
+# ---------- measurement ----------
+
+class RssSampler:
+    """Peak resident set size, sampled from /proc every few milliseconds (ru_maxrss elsewhere)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def current(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page
+        except OSError:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def reset(self):
+        self.peak = self.current()
+
+    def start(self):
+        self.reset()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def _summarize(latencies, elapsed, statuses, broker, peak_rss):
+    ms = np.array(latencies) * 1000
+    ok = sum(n for code, n in statuses.items() if code < 400)
+    return {
+        "requests": len(latencies),
+        "ok": ok,
+        "errors": len(latencies) - ok,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+        "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 3) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 3) if len(ms) else None,
+        "mean_ms": round(float(ms.mean()), 3) if len(ms) else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "broker": broker,
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+    }
+
+
+def _run_load(call, count, concurrency):
+    """call(i) -> status code. Returns per-request latencies, status counts and wall time."""
+    latencies = [0.0] * count
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            status = call(i)
+        except Exception:
+            status = 599
+        latencies[i] = time.perf_counter() - started
+        with lock:
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        list(pool.map(one, range(count)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+# ---------- scenarios ----------
+
+def _scenarios(rows):
+    from utils.stock_list import WATCHSTOCKLIST
+
+    stocks = WATCHSTOCKLIST[:SYMBOLS]
+    tokens = {(row["exch_seg"], row["symbol"]): row["token"] for row in rows}
+
+    def symbol_args(i):
+        stock = stocks[i % len(stocks)]
+        symbol = stock["tradingsymbol"]
+        return f"exchange={stock['exchange']}&tradingsymbol={symbol}&symboltoken={tokens[(stock['exchange'], symbol)]}"
+
+    def search(i):
+        stock = stocks[i % len(stocks)]
+        return f"search_str={stock['tradingsymbol'].rsplit('-', 1)[0]}&exchange={stock['exchange']}"
+
+    return {
+        "market_data": ("GET", lambda i: f"/api/market_data?{symbol_args(i)}"),
+        "security_info": ("GET", lambda i: f"/api/security_info?{symbol_args(i)}"),
+        "option_chain": ("GET", lambda i: f"/api/option_chain?{symbol_args(i)}"),
+        "expiry_list": ("GET", lambda i: f"/api/expiry_list?{symbol_args(i)}"),
+        "option_analytics": ("GET", lambda i: "/api/option_analytics?name=" + ("NIFTY", "BANKNIFTY")[i % 2]),
+        "master_contract": ("GET", lambda i: "/api/master_contract?exchange=NSE"),
+        "master_contract_ndjson": ("GET", lambda i: "/api/master_contract?exchange=NFO&format=ndjson&limit=1000"),
+        "combined_data": ("GET", lambda i: f"/api/combined_data?{search(i)}"),
+        "combined_data_batch": ("GET", lambda i: "/api/combined_data/batch?symbols=" + ",".join(
+            stock["tradingsymbol"].rsplit("-", 1)[0] for stock in stocks
+        )),
+        "ticker_data": ("GET", lambda i: "/api/ticker_data"),
+        "indicators": ("GET", lambda i: "/api/indicators?indicators=SMA_50,RSI_14"),
+        "ticker_history": ("GET", lambda i: f"/api/ticker_history?exchange=NSE&tradingsymbol={stocks[i % len(stocks)]['tradingsymbol']}&minutes=60"),
+        "update_tickers_db": ("POST", lambda i: "/api/update_tickers_db"),
+    }
+
+
+# Scenarios measured one request at a time: concurrent POSTs only measure the job lock's 409s
+SERIAL = {"update_tickers_db"}
+
+
+def _route_call(app, method, path):
+    headers = {"Accept-Encoding": "gzip"}
+
+    def call(i):
+        response = app.test_client().open(path(i), method=method, headers=headers)
+        response.get_data()  # drain streamed bodies too
+        return response.status_code
+    return call
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="finbiznet-bench-")
+    rows = _prepare_env(args, workdir)
+    stats = _install_fakes(args, rows)
+
+    from app import app
+    from controllers.smartapi_controllers import update_ticker_data_to_db
+
+    scenarios = _scenarios(rows)
+    wanted = [s.strip() for s in args.routes.split(",")] if args.routes else list(scenarios) + ["update_ticker_cycle"]
+    unknown = set(wanted) - set(scenarios) - {"update_ticker_cycle"}
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    sampler = RssSampler()
+    sampler.start()
+    results = {}
+    for name in wanted:
+        if name == "update_ticker_cycle":
+            # The scheduler's cycle, run back to back while readers hit /ticker_data
+            call = lambda i: update_ticker_data_to_db() and 200
+            reader = _route_call(app, "GET", lambda i: "/api/ticker_data")
+            count, concurrency = args.cycles, 1
+        else:
+            method, path = scenarios[name]
+            call, reader = _route_call(app, method, path), None
+            count, concurrency = args.requests, 1 if name in SERIAL else args.concurrency
+
+        for i in range(args.warmup):
+            try:
+                call(i)
+            except Exception:
+                pass
+
+        stats.reset()
+        sampler.reset()
+        background = None
+        stop_readers = threading.Event()
+        if reader:
+            def read(i):
+                with stats.background():
+                    return reader(i)
+
+            def read_until_stopped():
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    while not stop_readers.is_set():
+                        list(pool.map(read, range(args.concurrency)))
+            background = threading.Thread(target=read_until_stopped, daemon=True)
+            background.start()
+
+        latencies, statuses, elapsed = _run_load(call, count, concurrency)
+        stop_readers.set()
+        if background:
+            background.join()
+
+        results[name] = _summarize(latencies, elapsed, statuses, stats.snapshot(), sampler.peak)
+        r = results[name]
+        print(f"{name:<24}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['throughput_rps']:>10.1f}"
+              f"{r['errors']:>8}{r['broker']['total']:>8}{r['peak_rss_mb']:>10.1f}", file=sys.stderr)
+    sampler.stop()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "profile": args.profile,
+            "recordings": args.recordings,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "cycles": args.cycles,
+            "warmup": args.warmup,
+            "cache": args.cache,
+            "rate_limits": args.rate_limits,
+        },
+        "scenarios": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ---------- comparison ----------
+
+def compare(base_path, head_path, threshold):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+
+    print(f"{'scenario':<24}{'p95 base':>10}{'p95 head':>10}{'change':>9}{'rps base':>10}{'rps head':>10}{'calls':>12}")
+    regressions = []
+    for name, new in head["scenarios"].items():
+        old = base["scenarios"].get(name)
+        if not old or not old["p95_ms"] or new["p95_ms"] is None:
+            continue
+        change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+        calls = f"{old['broker']['total']}→{new['broker']['total']}"
+        flag = "  ⚠️" if change > threshold else ""
+        print(f"{name:<24}{old['p95_ms']:>10.1f}{new['p95_ms']:>10.1f}{change:>+9.0%}"
+              f"{old['throughput_rps']:>10.1f}{new['throughput_rps']:>10.1f}{calls:>12}{flag}")
+        if change > threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(f"❌ p95 regressed more than {threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    from benchmarks.fake_broker import PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default="typical", choices=list(PROFILES))
+    parser.add_argument("--recordings", help="Responses saved by python -m benchmarks.fake_broker --record")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per route")
+    parser.add_argument("--cycles", type=int, default=20, help="Measured update_ticker_data_to_db cycles")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--routes", help="Comma-separated scenario names, default all")
+    parser.add_argument("--cache", choices=("on", "off"), default="on", help="Response cache (sqlite in the scratch dir)")
+    parser.add_argument("--rate-limits", choices=("off", "real"), default="off", help="'real' keeps the SmartAPI limits from settings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    print(f"{'scenario':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}{'errors':>8}{'calls':>8}{'rss MB':>10}", file=sys.stderr)
+    report = run(args)
+    output = json.dumps(report, indent=1)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
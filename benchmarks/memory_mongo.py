@@ -0,0 +1,282 @@
+"""
+In-process stand-in for the pymongo Database the services use, so benchmarks
+never touch the configured cluster. Covers what the repo calls: find (with
+projection/sort/limit), find_one, insert_many, update_one, bulk_write of
+UpdateOne/InsertOne, find_one_and_update, delete_one/many, and the
+$set/$setOnInsert/$inc/$max/$min/$unset updates. Unique indexes are
+enforced (inserts and upserts raise DuplicateKeyError, bulk_write a
+BulkWriteError); other index options are accepted and ignored.
+"""
+import copy
+import itertools
+import threading
+from types import SimpleNamespace
+
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+_ids = itertools.count(1)
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _set(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part, {})
+    doc.pop(parts[-1], None)
+
+
+_OPERATORS = {
+    "$eq": lambda v, arg: v == arg,
+    "$ne": lambda v, arg: v != arg,
+    "$gt": lambda v, arg: v is not None and v > arg,
+    "$gte": lambda v, arg: v is not None and v >= arg,
+    "$lt": lambda v, arg: v is not None and v < arg,
+    "$lte": lambda v, arg: v is not None and v <= arg,
+    "$in": lambda v, arg: v in arg,
+    "$nin": lambda v, arg: v not in arg,
+    "$exists": lambda v, arg: (v is not None) == bool(arg),
+}
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            value = _get(doc, key)
+            if not all(_OPERATORS[op](value, arg) for op, arg in condition.items()):
+                return False
+        elif _get(doc, key) != condition:
+            return False
+    return True
+
+
+def _apply_update(doc, update, inserting):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = _get(doc, path)
+            if op == "$set":
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set(doc, path, copy.deepcopy(value))
+            elif op == "$inc":
+                _set(doc, path, (current or 0) + value)
+            elif op == "$max":
+                _set(doc, path, value if current is None else max(current, value))
+            elif op == "$min":
+                _set(doc, path, value if current is None else min(current, value))
+            elif op == "$unset":
+                _unset(doc, path)
+            else:
+                raise NotImplementedError(f"Update operator {op}")
+
+
+def _seed_from_query(query):
+    # Upserts start from the equality parts of the filter
+    doc = {}
+    for key, value in query.items():
+        if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value)):
+            _set(doc, key, copy.deepcopy(value))
+    return doc
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+class Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda d: (_get(d, field) is None, _get(d, field)), reverse=order < 0)
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class MemoryCollection:
+    def __init__(self, name):
+        self.name = name
+        self._docs = {}
+        self._unique = []
+        self._lock = threading.RLock()
+
+    def create_index(self, keys, **kwargs):
+        if kwargs.get("unique"):
+            fields = tuple(k for k, _ in keys) if isinstance(keys, list) else (keys,)
+            with self._lock:
+                if fields not in self._unique:
+                    self._unique.append(fields)
+        return kwargs.get("name") or str(keys)
+
+    def _matching(self, query):
+        return [doc for doc in self._docs.values() if matches(doc, query or {})]
+
+    def find(self, query=None, projection=None, **kwargs):
+        with self._lock:
+            return Cursor([_project(doc, projection) for doc in self._matching(query)])
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        with self._lock:
+            found = self._matching(query)
+            return _project(found[0], projection) if found else None
+
+    def count_documents(self, query, **kwargs):
+        with self._lock:
+            return len(self._matching(query))
+
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", next(_ids))
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} _id: {doc['_id']!r}", 11000)
+        for fields in self._unique:
+            key = [_get(doc, f) for f in fields]
+            if any(all(_get(other, f) == v for f, v in zip(fields, key)) for other in self._docs.values()):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} {dict(zip(fields, key))!r}", 11000)
+        self._docs[doc["_id"]] = doc
+        return doc["_id"]
+
+    def insert_one(self, doc):
+        with self._lock:
+            return SimpleNamespace(inserted_id=self._insert(doc))
+
+    def insert_many(self, docs, ordered=True):
+        with self._lock:
+            return SimpleNamespace(inserted_ids=[self._insert(doc) for doc in docs])
+
+    def _update(self, query, update, upsert):
+        found = self._matching(query)
+        if found:
+            _apply_update(found[0], update, inserting=False)
+            return 1, None
+        if not upsert:
+            return 0, None
+        doc = _seed_from_query(query)
+        _apply_update(doc, update, inserting=True)
+        return 0, self._insert(doc)
+
+    def update_one(self, query, update, upsert=False):
+        with self._lock:
+            matched, upserted = self._update(query, update, upsert)
+            return SimpleNamespace(matched_count=matched, modified_count=matched, upserted_id=upserted)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE, projection=None):
+        with self._lock:
+            found = self._matching(query)
+            before = copy.deepcopy(found[0]) if found else None
+            _, upserted = self._update(query, update, upsert)
+            if return_document == ReturnDocument.AFTER:
+                doc = found[0] if found else self._docs.get(upserted)
+                return _project(doc, projection) if doc else None
+            return _project(before, projection) if before else None
+
+    def bulk_write(self, ops, ordered=True):
+        counts = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "upserted_count": 0, "upserted_ids": {}}
+        errors = []
+        with self._lock:
+            for i, op in enumerate(ops):
+                try:
+                    if isinstance(op, InsertOne):
+                        self._insert(op._doc)
+                        counts["inserted_count"] += 1
+                    elif isinstance(op, UpdateOne):
+                        matched, upserted = self._update(op._filter, op._doc, op._upsert)
+                        counts["matched_count"] += matched
+                        counts["modified_count"] += matched
+                        counts["upserted_count"] += upserted is not None
+                        if upserted is not None:
+                            counts["upserted_ids"][i] = upserted
+                    else:
+                        raise NotImplementedError(type(op).__name__)
+                except DuplicateKeyError as e:
+                    errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, **{k: v for k, v in counts.items() if k != "upserted_ids"}})
+        return SimpleNamespace(**counts)
+
+    def delete_one(self, query):
+        with self._lock:
+            found = self._matching(query)
+            if found:
+                del self._docs[found[0]["_id"]]
+            return SimpleNamespace(deleted_count=len(found[:1]))
+
+    def delete_many(self, query):
+        with self._lock:
+            found = self._matching(query)
+            for doc in found:
+                del self._docs[doc["_id"]]
+            return SimpleNamespace(deleted_count=len(found))
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name)
+            return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def create_collection(self, name, **kwargs):
+        with self._lock:
+            if name in self._collections:
+                raise CollectionInvalid(f"collection {name} already exists")
+        return self[name]
+
+    def list_collection_names(self, **kwargs):
+        return list(self._collections)
+
+    def command(self, *args, **kwargs):
+        return {"ok": 1.0}
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from datetime import date
 
 def load_keys():
     base_dir = os.path.dirname(os.path.dirname(__file__))  # Goes one level up (from config/ to python-api/)
@@ -14,3 +16,192 @@ def load_keys():
         "PASSWORD": lines[3],
         "QR_CODE_KEY": lines[4]
     }
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+def _rate(name, rate, burst):
+    # Override with e.g. SMARTAPI_RATE_CANDLE="3/3" (requests per second / burst)
+    override = os.environ.get(f"SMARTAPI_RATE_{name.upper()}")
+    if override:
+        rate, _, burst = override.partition("/")
+        return float(rate), float(burst or rate)
+    return float(rate), float(burst)
+
+
+# SmartAPI rate limits per endpoint class: (requests per second, burst size)
+RATE_LIMITS = {
+    "login": _rate("login", 1, 1),
+    "ltp": _rate("ltp", 10, 10),
+    "quote": _rate("quote", 10, 10),
+    "search": _rate("search", 1, 1),
+    "candle": _rate("candle", 3, 3),
+    "default": _rate("default", 5, 5),
+}
+
+# Directory holding the shared bucket files; set to "" to keep limits per process
+RATE_LIMIT_DIR = os.environ.get(
+    "SMARTAPI_RATE_LIMIT_DIR",
+    os.path.join(tempfile.gettempdir(), "finbiznet-ratelimit"),
+)
+
+# Wait for a free slot (True) or fail fast with RateLimitExceeded (False)
+RATE_LIMIT_BLOCKING = _env_flag("SMARTAPI_RATE_LIMIT_BLOCKING", True)
+
+# SmartAPI session: renew after SESSION_TTL seconds, starting SESSION_REFRESH_MARGIN
+# seconds early in the background. SESSION_POOL_SIZE > 1 clones the session onto
+# several clients for parallel calls.
+SESSION_TTL = int(os.environ.get("SMARTAPI_SESSION_TTL", 1200))
+SESSION_REFRESH_MARGIN = int(os.environ.get("SMARTAPI_SESSION_REFRESH_MARGIN", 120))
+SESSION_POOL_SIZE = int(os.environ.get("SMARTAPI_SESSION_POOL_SIZE", 1))
+
+# Local candle history: "file" (NumPy files under CANDLE_STORE_DIR) or "mongo"
+CANDLE_STORE_BACKEND = os.environ.get("CANDLE_STORE_BACKEND", "file")
+CANDLE_STORE_DIR = os.environ.get(
+    "CANDLE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "candles"),
+)
+# Seconds the still-forming bar is served from memory before it is refetched
+CANDLE_OVERLAY_TTL = int(os.environ.get("CANDLE_OVERLAY_TTL", 60))
+
+# Worker threads for concurrent broker calls, and how long a request waits for them
+BROKER_POOL_SIZE = int(os.environ.get("SMARTAPI_POOL_SIZE", 8))
+BROKER_CALL_TIMEOUT = float(os.environ.get("SMARTAPI_CALL_TIMEOUT", 10))
+
+# Async service layer (asgi.py): connections kept open to the SmartAPI host per
+# process, and seconds an idle one is kept alive for reuse
+ASYNC_POOL_SIZE = int(os.environ.get("SMARTAPI_ASYNC_POOL_SIZE", 200))
+ASYNC_KEEPALIVE = float(os.environ.get("SMARTAPI_ASYNC_KEEPALIVE", 60))
+
+# Ticker history: raw snapshots in a time-series collection plus pre-aggregated
+# rollups (name -> bucket seconds); both expire after the given number of seconds
+TICKER_HISTORY_TTL = int(os.environ.get("TICKER_HISTORY_TTL", 7 * 86400))
+TICKER_ROLLUP_TTL = int(os.environ.get("TICKER_ROLLUP_TTL", 90 * 86400))
+TICKER_ROLLUPS = {"1m": 60, "5m": 300}
+
+# Live quotes over the SmartAPI websocket instead of REST polling. STREAM_MODE is
+# LTP or QUOTE (QUOTE also carries the previous close). STREAM_REPLAY_PATH replays
+# recorded ticks instead of connecting; STREAM_RECORD_PATH records live ticks.
+STREAM_ENABLED = _env_flag("SMARTAPI_STREAMING", False)
+STREAM_MODE = os.environ.get("SMARTAPI_STREAM_MODE", "QUOTE").upper()
+STREAM_REPLAY_PATH = os.environ.get("SMARTAPI_STREAM_REPLAY")
+STREAM_RECORD_PATH = os.environ.get("SMARTAPI_STREAM_RECORD")
+# Seconds between publishing batched ticks into the quote table
+STREAM_PUBLISH_INTERVAL = float(os.environ.get("SMARTAPI_STREAM_PUBLISH_INTERVAL", 0.05))
+# Seconds between REST refreshes of the quote table when streaming is off
+STREAM_POLL_INTERVAL = float(os.environ.get("SMARTAPI_STREAM_POLL_INTERVAL", 5))
+# ...and polling pauses once nothing has read the table for this many seconds
+STREAM_IDLE_AFTER = float(os.environ.get("SMARTAPI_STREAM_IDLE_AFTER", 60))
+
+# /api/ticker_stream: seconds between coalesced delta events, and between
+# keep-alive comments when nothing changed
+SSE_TICK_INTERVAL = float(os.environ.get("SSE_TICK_INTERVAL", 1))
+SSE_HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", 15))
+
+# /api/screen: seconds between copying changed quotes into the screener table,
+# and between full recomputes of its indicator columns from the candle store
+SCREEN_QUOTE_INTERVAL = float(os.environ.get("SCREEN_QUOTE_INTERVAL", 1))
+SCREEN_INDICATOR_INTERVAL = float(os.environ.get("SCREEN_INDICATOR_INTERVAL", 300))
+
+# Watchlists live in Mongo (seeded from utils/stock_list.py into WATCHLIST_DEFAULT).
+# WATCHLIST_SYNC "auto" follows a change stream where the server has one and
+# polls every WATCHLIST_POLL_INTERVAL seconds otherwise; "stream" or "poll" forces one.
+WATCHLIST_DEFAULT = os.environ.get("WATCHLIST_DEFAULT", "default")
+WATCHLIST_SYNC = os.environ.get("WATCHLIST_SYNC", "auto").lower()
+WATCHLIST_POLL_INTERVAL = float(os.environ.get("WATCHLIST_POLL_INTERVAL", 10))
+
+# Local instrument master (token lookups without searchScrip). SOURCE is the
+# broker's scrip master URL or a local JSON file; it is re-downloaded once a day
+# after REFRESH_HOUR (IST).
+INSTRUMENT_MASTER_ENABLED = _env_flag("INSTRUMENT_MASTER_ENABLED", True)
+INSTRUMENT_MASTER_SOURCE = os.environ.get(
+    "INSTRUMENT_MASTER_SOURCE",
+    "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json",
+)
+INSTRUMENT_MASTER_DIR = os.environ.get(
+    "INSTRUMENT_MASTER_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "instruments"),
+)
+INSTRUMENT_MASTER_REFRESH_HOUR = int(os.environ.get("INSTRUMENT_MASTER_REFRESH_HOUR", 8))
+
+
+def _cache_ttl(name, ttl, stale):
+    # Override with e.g. RESPONSE_CACHE_TTL_MARKET_DATA="5/10" (fresh seconds / extra stale seconds)
+    override = os.environ.get(f"RESPONSE_CACHE_TTL_{name.upper()}")
+    if override:
+        ttl, _, stale = override.partition("/")
+        return float(ttl), float(stale or 0)
+    return float(ttl), float(stale)
+
+
+# Shared cache in front of the passthrough fetch_* calls: "sqlite" (file shared by
+# every worker on the box), "redis" (REDIS_URL) or "off"
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "sqlite")
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "finbiznet-cache.sqlite3"),
+)
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+# Entries kept before least-recently-used ones are evicted
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+
+# Per endpoint: (seconds fresh, seconds more a stale copy is served while it is refetched)
+RESPONSE_CACHE_TTLS = {
+    "market_data": _cache_ttl("market_data", 2, 10),
+    "option_analytics": _cache_ttl("option_analytics", 15, 15),
+}
+
+# Response encoding for smartapi_bp: JSON_ENCODER "auto" picks orjson, then
+# msgspec, then the stdlib; bodies of at least COMPRESS_MIN_BYTES are sent
+# brotli/gzip compressed when the client accepts it
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "auto")
+COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL = int(os.environ.get("RESPONSE_COMPRESS_LEVEL", 5))
+
+# Annual risk-free rate for option IV/Greeks (continuously compounded)
+OPTION_RISK_FREE_RATE = float(os.environ.get("OPTION_RISK_FREE_RATE", 0.065))
+
+# Checkpoints of backfill.py runs (one directory per interval and date range)
+BACKFILL_DIR = os.environ.get(
+    "BACKFILL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "backfill"),
+)
+
+# Extra market holidays (comma-separated YYYY-MM-DD) on top of the NSE list in
+# services/market_calendar.py, e.g. next year's before the list is updated
+NSE_EXTRA_HOLIDAYS = {
+    date.fromisoformat(day.strip())
+    for day in os.environ.get("NSE_EXTRA_HOLIDAYS", "").split(",")
+    if day.strip()
+}
+
+# scheduler.py cadences: quotes every SCHEDULE_QUOTES_SECONDS during market
+# hours, end-of-day candles and the instrument master once a day (HH:MM IST).
+# Today's daily bar is only stored once it is final, 10 minutes after the close
+# (15:40 IST), so SCHEDULE_CANDLES_AT should be later than that.
+SCHEDULE_QUOTES_SECONDS = float(os.environ.get("SCHEDULE_QUOTES_SECONDS", 5))
+SCHEDULE_CANDLES_AT = os.environ.get("SCHEDULE_CANDLES_AT", "15:45")
+SCHEDULE_CANDLES_DAYS = int(os.environ.get("SCHEDULE_CANDLES_DAYS", 400))
+SCHEDULE_MASTER_AT = os.environ.get("SCHEDULE_MASTER_AT", "08:30")
+# Longest pause between retries of a failing job
+SCHEDULE_MAX_BACKOFF = float(os.environ.get("SCHEDULE_MAX_BACKOFF", 300))
+# Seconds a job lock in Mongo is held without a heartbeat before another host may take it
+JOB_LOCK_TTL = float(os.environ.get("JOB_LOCK_TTL", 60))
+
+# Sharded ticker refresh: every scheduler.py process (any host) joins the ring
+# and refreshes only its share of the watchlist, with 1/N of the rate budget.
+# A worker whose heartbeat is older than SHARD_WORKER_TTL seconds is dropped
+# and its symbols move to the others.
+SHARD_REFRESH = _env_flag("SHARD_REFRESH", False)
+SHARD_WORKER_TTL = float(os.environ.get("SHARD_WORKER_TTL", 30))
+SHARD_VNODES = int(os.environ.get("SHARD_VNODES", 160))
+
+# Logging: LOG_LEVEL DEBUG/INFO/WARNING/ERROR, or OFF to drop log output
+# entirely; LOG_FORMAT "text" or "json" (one object per line, with fields)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+
+# Counters/histograms for /api/metrics (Prometheus text format, per process)
+METRICS_ENABLED = _env_flag("METRICS_ENABLED", True)
@@ -0,0 +1,81 @@
+import asyncio
+
+from services.async_smartapi_service import (
+    search_scrip_async,
+    resolve_symboltoken_async,
+    fetch_ltp_async,
+    fetch_quotes_batch_async,
+    gather_async,
+)
+from services.rate_limiter import RateLimitExceeded
+from controllers.smartapi_controllers import (
+    _load_candles,
+    _requested_stocks,
+    combined_payload,
+    streamed_quotes,
+    ticker_rows,
+)
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# Handlers for asgi.py: take the query args, return (payload, status).
+# Same responses as their Flask counterparts in smartapi_controllers.py.
+
+
+async def combined_data(args):
+    try:
+        search_str = args.get('search_str')
+        exchange = args.get('exchange')
+
+        # 1. Get scrip data
+        scrip = await search_scrip_async(search_str, exchange)
+        tradingsymbol = scrip.get("tradingsymbol")
+        symboltoken = scrip.get("symboltoken")
+
+        # 2-3. LTP on the event loop; candles come from the local store (disk/Mongo), so a thread
+        results, errors = await gather_async({
+            "ltp": fetch_ltp_async(exchange, tradingsymbol, symboltoken),
+            "candles": asyncio.to_thread(_load_candles, exchange, symboltoken),
+        })
+        if not results:
+            raise next(iter(errors.values()))
+
+        return combined_payload(scrip, results, errors), 200
+
+    except RateLimitExceeded as e:
+        return {"error": str(e)}, 429
+    except Exception as e:
+        log.error("Error in combined_data: %s", e)
+        return {"error": str(e)}, 400
+
+
+async def _resolve_watchlist(stocks):
+    # Every token lookup at once; a symbol that fails is logged and left out
+    tokens = await asyncio.gather(
+        *(resolve_symboltoken_async(stock["tradingsymbol"], stock["exchange"]) for stock in stocks),
+        return_exceptions=True,
+    )
+    resolved = []
+    for stock, token in zip(stocks, tokens):
+        if isinstance(token, Exception):
+            log.error("Error resolving %s (%s:%s): %s", stock["name"], stock["exchange"], stock["tradingsymbol"], token)
+        else:
+            resolved.append((stock, token))
+    return resolved
+
+
+async def ticker_data(args):
+    # The first watchlist load reads Mongo and the quote table takes a lock, so both on a thread
+    try:
+        stocks = await asyncio.to_thread(_requested_stocks, args)
+    except LookupError as e:
+        return {"error": str(e)}, 404
+    quotes, missing = await asyncio.to_thread(streamed_quotes, stocks)
+    if missing:
+        resolved = await _resolve_watchlist(missing)
+        quotes.update(await fetch_quotes_batch_async(
+            (stock["exchange"], stock["tradingsymbol"], symboltoken)
+            for stock, symboltoken in resolved
+        ))
+    return ticker_rows(quotes, stocks), 200
@@ -1,8 +1,16 @@
-from flask import request, jsonify
+import hashlib
+import json
+import math
+import time
+import zlib
+
+import numpy as np
+from flask import Response, request
 from services.smartapi_service import (
     search_scrip_and_extract,
     get_api_object,
     fetch_ltp,          
+    fetch_quotes_batch,
     resolve_symboltoken ,
     fetch_market_data,
     fetch_security_info,
@@ -11,49 +19,63 @@ from services.smartapi_service import (
     fetch_master_contract
 
 )
+from services.rate_limiter import RateLimitExceeded
+from services.instrument_master import get_master
+from services.option_analytics_service import get_option_analytics
+from services.candle_store import get_series, INTERVAL_SECONDS, IST
+from services.executor import submit, gather
+from services.tickerdata_service import write_ticker_snapshot, append_history, get_history
+from services.quote_stream import quote_table, ensure_stream, ensure_feed, touch as touch_quotes, is_live as stream_is_live
+from services.screener import ensure_screener, screen as run_screen
+from services.watchlists import (
+    get_watchlists,
+    tracked_stocks,
+    list_watchlists,
+    get_watchlist,
+    add_symbols,
+    remove_symbol,
+    delete_watchlist,
+)
+from config.settings import STREAM_ENABLED, SSE_TICK_INTERVAL, SSE_HEARTBEAT, BROKER_CALL_TIMEOUT, BROKER_POOL_SIZE
 from datetime import datetime, timedelta
-import time
-from config.db_config import db  
-from utils.stock_list import WATCHSTOCKLIST  # or whatever variable is used there
-import time
+from utils import indicators
+from utils.indicators import COMBINED_INDICATORS
+from utils.json_response import jsonify, dumps
+from utils.logger import get_logger
+from utils.metrics import render as render_metrics
+
+log = get_logger(__name__)
 
-def get_candle_data(exchange, tradingsymbol, symboltoken, interval="ONE_DAY", days=250):
-    obj = get_api_object()
 
-    to_date = datetime.now()
+def _load_candles(exchange, symboltoken, interval="ONE_DAY", days=250):
+    to_date = datetime.now(IST)
     from_date = to_date - timedelta(days=days)
 
-    try:
-        params = {
-            "exchange": exchange,
-            "symboltoken": symboltoken,
-            "interval": interval,
-            "fromdate": from_date.strftime('%Y-%m-%d %H:%M'),
-            "todate": to_date.strftime('%Y-%m-%d %H:%M')
-        }
+    # Served from the local candle store; only the missing tail is fetched
+    candles = get_series(exchange, symboltoken, interval, from_date, to_date)
+    if not len(candles):
+        raise ValueError("No candle data received")
+    return candles
+
 
-        candles = obj.getCandleData(params)
-        if not candles or "data" not in candles:
-            raise ValueError("No candle data received")
-
-        parsed = [
-            {
-                "datetime": c[0],
-                "open": c[1],
-                "high": c[2],
-                "low": c[3],
-                "close": c[4],
-                "volume": c[5]
-            }
-            for c in candles["data"]
-        ]
-        return parsed
+def get_candle_data(exchange, tradingsymbol, symboltoken, interval="ONE_DAY", days=250):
+    try:
+        return _load_candles(exchange, symboltoken, interval, days).to_rows()
 
     except Exception as e:
-        print("❌ Error in get_candle_data:", str(e))
+        log.error("Error in get_candle_data: %s", e)
         raise e
 
 
+def _indicator_fields(values, row=None):
+    # Returns are rounded to 2 places like before, levels are passed through
+    fields = {}
+    for field, spec in COMBINED_INDICATORS.items():
+        value = values[spec] if row is None else values[spec][row]
+        fields[field] = indicators.to_python(value, 2 if spec.startswith("RET") else None)
+    return fields
+
+
 def combined_data():
     try:
         search_str = request.args.get('search_str')
@@ -64,143 +86,379 @@ def combined_data():
         tradingsymbol = scrip.get("tradingsymbol")
         symboltoken = scrip.get("symboltoken")
 
-        # 2. LTP data
-        ltp_data = fetch_ltp(exchange, tradingsymbol, symboltoken)
-
-        # 3. Candles
-        candle_data = get_candle_data(exchange, tradingsymbol, symboltoken)
-        closes = [c['close'] for c in candle_data]
-
-        # 4. Moving Averages
-        dma_5 = sum(closes[-5:]) / 5 if len(closes) >= 5 else None
-        dma_30 = sum(closes[-30:]) / 30 if len(closes) >= 30 else None
-        dma_50 = sum(closes[-50:]) / 50 if len(closes) >= 50 else None
-        dma_200 = sum(closes[-200:]) / 200 if len(closes) >= 200 else None
-
-        # 5. Returns
-        def calc_return(days):
-            if len(candle_data) < days:
-                return None
-            past_close = candle_data[-days]['close']
-            current = candle_data[-1]['close']
-            return round((current - past_close) / past_close * 100, 2) if past_close != 0 else None
-
-        # 6. Add calculated values
-        ltp_data.update({
-            "DMA_5": dma_5,
-            "DMA_30": dma_30,
-            "DMA_50": dma_50,
-            "DMA_200": dma_200,
-            "1D%": calc_return(1),
-            "5D%": calc_return(5),
-            "30D%": calc_return(30),
-            "1Y%": calc_return(250),
-            "52W-High": max(c['high'] for c in candle_data),
-            "52W-Low": min(c['low'] for c in candle_data),
+        # 2-3. LTP and candles are independent once the token is known, fetch them concurrently
+        results, errors = gather({
+            "ltp": submit(fetch_ltp, exchange, tradingsymbol, symboltoken),
+            "candles": submit(_load_candles, exchange, symboltoken),
         })
+        if not results:
+            raise next(iter(errors.values()))
 
-        # ✅ 7. Add extra useful data from scrip (only useful keys)
-        extra_info = {
-            "symboltoken": scrip.get("symboltoken"),
-            "tradingsymbol": scrip.get("tradingsymbol"),
-            "exchange": scrip.get("exchange"),
-            "name": scrip.get("name"),
-            "instrumenttype": scrip.get("instrumenttype"),
-            "lotsize": scrip.get("lotsize"),
-            "ticksize": scrip.get("ticksize"),
-            "expiry": scrip.get("expiry"),
-            "strikeprice": scrip.get("strikeprice"),
-            "optiontype": scrip.get("optiontype"),
-            "isin": scrip.get("isin"),
-        }
-        ltp_data.update(extra_info)
+        return jsonify(combined_payload(scrip, results, errors))
 
-        # ✅ 8. Add latest candle snapshot (for frontend highlights)
-        latest_candle = candle_data[-1] if candle_data else {}
-        ltp_data["latest_candle"] = latest_candle
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        log.error("Error in combined_data: %s", e)
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify(ltp_data)
 
-    except Exception as e:
-        print("❌ Error in combined_data:", str(e))
+def combined_payload(scrip, results, errors, fields=None):
+    # Shared with the async and batch combined_data; `fields` when the indicators
+    # were already computed for a whole batch
+    ltp_data = results.get("ltp") or {}
+    candles = results.get("candles")
+
+    # 4-6. Moving averages, returns and 52W range in one vectorized pass
+    if fields is None:
+        if candles is not None:
+            fields = _indicator_fields(indicators.compute(candles, COMBINED_INDICATORS.values()))
+        else:
+            fields = {field: None for field in COMBINED_INDICATORS}
+    ltp_data.update(fields)
+
+    # Partial result: report which leg failed instead of failing the request
+    if errors:
+        for name, e in errors.items():
+            log.error("%s failed in combined_data: %s", name, e)
+        ltp_data["errors"] = {name: str(e) for name, e in errors.items()}
+
+    # ✅ 7. Add extra useful data from scrip (only useful keys)
+    extra_info = {
+        "symboltoken": scrip.get("symboltoken"),
+        "tradingsymbol": scrip.get("tradingsymbol"),
+        "exchange": scrip.get("exchange"),
+        "name": scrip.get("name"),
+        "instrumenttype": scrip.get("instrumenttype"),
+        "lotsize": scrip.get("lotsize"),
+        "ticksize": scrip.get("ticksize"),
+        "expiry": scrip.get("expiry"),
+        "strikeprice": scrip.get("strikeprice"),
+        "optiontype": scrip.get("optiontype"),
+        "isin": scrip.get("isin"),
+    }
+    ltp_data.update(extra_info)
+
+    # ✅ 8. Add latest candle snapshot (for frontend highlights)
+    latest_candle = candles[-1:].to_rows()[0] if candles is not None and len(candles) else {}
+    ltp_data["latest_candle"] = latest_candle
+    return ltp_data
+
+
+# Most symbols one /combined_data/batch request may ask for
+COMBINED_BATCH_LIMIT = 100
+
+
+def _batch_symbols():
+    """
+    [(search_str, exchange)] from ?symbols=SBIN,TCS&exchange=NSE or a JSON body
+    {"symbols": ["SBIN", {"search_str": "TCS", "exchange": "BSE"}], "exchange": "NSE"}.
+    """
+    body = (request.get_json(silent=True) or {}) if request.method == "POST" else {}
+    if not isinstance(body, dict):
+        raise ValueError("The body must be a JSON object")
+    exchange = body.get("exchange") or request.args.get("exchange", "NSE")
+    if not isinstance(exchange, str):
+        raise ValueError("exchange must be a string")
+    items = body.get("symbols")
+    if items is None:
+        items = [s.strip() for s in request.args.get("symbols", "").split(",") if s.strip()]
+    elif not isinstance(items, list):
+        raise ValueError('symbols must be a list of strings or {"search_str", "exchange"} objects')
+
+    symbols = []
+    for item in items:
+        if isinstance(item, dict):
+            symbol = (item.get("search_str"), item.get("exchange") or exchange)
+        else:
+            symbol = (item, exchange)
+        if not isinstance(symbol[0], str) or not symbol[0].strip() or not isinstance(symbol[1], str):
+            raise ValueError(f'Every symbol needs a search_str (and exchange) string, got {item!r}')
+        symbol = (symbol[0].strip(), symbol[1])
+        if symbol not in symbols:
+            symbols.append(symbol)
+
+    if not symbols:
+        raise ValueError("symbols is required")
+    if len(symbols) > COMBINED_BATCH_LIMIT:
+        raise ValueError(f"At most {COMBINED_BATCH_LIMIT} symbols per request")
+    return symbols
+
+
+def _quote_as_ltp(scrip, quote):
+    # Same shape as an ltpData response, so batch rows match /combined_data
+    return {
+        "status": True,
+        "message": "SUCCESS",
+        "errorcode": "",
+        "data": {
+            "exchange": scrip["exchange"],
+            "tradingsymbol": scrip["tradingsymbol"],
+            "symboltoken": scrip["symboltoken"],
+            **{field: quote.get(field) for field in ("open", "high", "low", "close", "ltp")},
+        },
+    }
+
+
+def combined_data_batch():
+    """
+    /combined_data for many symbols: tokens resolved together, quotes in one
+    batched getMarketData, candles fetched concurrently from the candle store,
+    and the indicators computed for every symbol in one pass. Rows come back in
+    request order; a symbol that can't be served lands in "errors" instead.
+    """
+    try:
+        symbols = _batch_symbols()
+    except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
+    def label(symbol):
+        return f"{symbol[1]}:{symbol[0]}"
+
+    # The pool works through the symbols in waves; each wave gets the usual deadline
+    timeout = BROKER_CALL_TIMEOUT * math.ceil((len(symbols) + 1) / BROKER_POOL_SIZE)
+
+    # 1) Tokens: instrument master or cached searches, searchScrip only for the rest
+    scrip_results, scrip_errors = gather({
+        symbol: submit(search_scrip_and_extract, *symbol) for symbol in symbols
+    }, timeout)
+    errors = {label(symbol): str(e) for symbol, e in scrip_errors.items()}
+    scrips = [(symbol, scrip_results[symbol]) for symbol in symbols if symbol in scrip_results]
+
+    # 2) One batched quote call and every symbol's candles, all in flight together
+    futures = {"quotes": submit(fetch_quotes_batch, [
+        (scrip["exchange"], scrip["tradingsymbol"], scrip["symboltoken"]) for _, scrip in scrips
+    ])}
+    for symbol, scrip in scrips:
+        futures[symbol] = submit(_load_candles, scrip["exchange"], scrip["symboltoken"])
+    results, leg_errors = gather(futures, timeout)
+    quotes = results.get("quotes") or {}
+
+    # 3) Moving averages, returns and 52W range for the whole batch at once
+    with_candles = [symbol for symbol, _ in scrips if symbol in results]
+    batch_rows = {symbol: i for i, symbol in enumerate(with_candles)}
+    if with_candles:
+        series = [results[symbol] for symbol in with_candles]
+        batch = {field: indicators.stack(series, field) for field in ("open", "high", "low", "close", "volume")}
+        values = indicators.compute(batch, COMBINED_INDICATORS.values())
+
+    data = []
+    for symbol, scrip in scrips:
+        quote = quotes.get((scrip["exchange"], scrip["tradingsymbol"]))
+        legs, failed = {}, {}
+        if quote is not None:
+            legs["ltp"] = _quote_as_ltp(scrip, quote)
+        else:
+            failed["ltp"] = leg_errors.get("quotes") or ValueError("No quote returned")
+        if symbol in batch_rows:
+            legs["candles"] = results[symbol]
+        else:
+            failed["candles"] = leg_errors[symbol]
+
+        if not legs:
+            errors[label(symbol)] = "; ".join(f"{name}: {e}" for name, e in failed.items())
+            continue
 
-WATCHLIST = [
-    {"name": "RELIANCE", "exchange": "NSE", "tradingsymbol": "RELIANCE-EQ", "symboltoken": "2885"},
-    {"name": "TCS", "exchange": "NSE", "tradingsymbol": "TCS-EQ", "symboltoken": "11536"},
-    {"name": "HDFCBANK", "exchange": "NSE", "tradingsymbol": "HDFCBANK-EQ", "symboltoken": "1333"},
-    {"name": "INFY", "exchange": "NSE", "tradingsymbol": "INFY-EQ", "symboltoken": "1594"},
-    {"name": "ICICIBANK", "exchange": "NSE", "tradingsymbol": "ICICIBANK-EQ", "symboltoken": "4963"},
-    {"name": "TATAMOTORS", "exchange": "NSE", "tradingsymbol": "TATAMOTORS-EQ", "symboltoken": "3456"},
-    {"name": "BHARTIARTL", "exchange": "NSE", "tradingsymbol": "BHARTIARTL-EQ", "symboltoken": "10604"},
-    {"name": "MARUTI", "exchange": "NSE", "tradingsymbol": "MARUTI-EQ", "symboltoken": "10999"},
-    {"name": "ITC", "exchange": "NSE", "tradingsymbol": "ITC-EQ", "symboltoken": "1660"},
-    {"name": "KOTAKBANK", "exchange": "NSE", "tradingsymbol": "KOTAKBANK-EQ", "symboltoken": "10847"},
-    {"name": "SBIN", "exchange": "NSE", "tradingsymbol": "SBIN-EQ", "symboltoken": "3045"},
-    {"name": "HCLTECH", "exchange": "NSE", "tradingsymbol": "HCLTECH-EQ", "symboltoken": "7229"},
-    {"name": "AXISBANK", "exchange": "NSE", "tradingsymbol": "AXISBANK-EQ", "symboltoken": "212"},
-    {"name": "SUNPHARMA", "exchange": "NSE", "tradingsymbol": "SUNPHARMA-EQ", "symboltoken": "1348"},
-    {"name": "LT", "exchange": "NSE", "tradingsymbol": "LT-EQ", "symboltoken": "11483"},
-]
+        fields = _indicator_fields(values, batch_rows[symbol]) if symbol in batch_rows else None
+        data.append(combined_payload(scrip, legs, failed, fields))
 
-def ticker_data():
-    stocks = []
-    for stock in WATCHSTOCKLIST:
-        try:
-            exchange = stock["exchange"]
-            tradingsymbol = stock["tradingsymbol"]
+    return jsonify({"data": data, "errors": errors})
+
+
+def _track(ensure):
+    # Quote feeds and the screener start on every tracked symbol and follow watchlist edits from then on
+    return get_watchlists().track(ensure)
 
+
+def _requested_stocks(params=None):
+    # ?list=<name> narrows a watchlist endpoint to one list (LookupError if there is none), default every list
+    return tracked_stocks((request.args if params is None else params).get("list"))
+
+
+def _resolve_watchlist(stocks):
+    # Resolve tokens up front so quotes can be fetched in one batch
+    resolved = []
+    for stock in stocks:
+        exchange = stock["exchange"]
+        tradingsymbol = stock["tradingsymbol"]
+        try:
             symboltoken = get_symboltoken_with_log(tradingsymbol, exchange)
-            ltp_response = fetch_ltp(exchange, tradingsymbol, symboltoken)
-            
-            ltp_data = ltp_response.get("data", {}) or {}
+            resolved.append((stock, symboltoken))
+        except Exception as e:
+            log.error("Error resolving %s (%s:%s): %s", stock["name"], exchange, tradingsymbol, e)
+    return resolved
+
+
+def _fetch_watchlist_quotes(stocks):
+    resolved = _resolve_watchlist(stocks)
+    quotes = fetch_quotes_batch(
+        (stock["exchange"], stock["tradingsymbol"], symboltoken)
+        for stock, symboltoken in resolved
+    )
+    return resolved, quotes
+
+
+def streamed_quotes(stocks):
+    # Live quote table first when streaming: (quotes, stocks it doesn't have yet)
+    quotes, missing = {}, stocks
+    if STREAM_ENABLED:
+        _track(ensure_stream)
+        if stream_is_live():
+            table = quote_table.snapshot()
+            missing = []
+            for stock in stocks:
+                key = (stock["exchange"], stock["tradingsymbol"])
+                if key in table:
+                    quotes[key] = table[key]
+                else:
+                    missing.append(stock)
+    return quotes, missing
+
+
+def _watchlist_quotes(stocks):
+    # REST batch only for what the live quote table doesn't have
+    quotes, missing = streamed_quotes(stocks)
+    if missing:
+        _, fetched = _fetch_watchlist_quotes(missing)
+        quotes.update(fetched)
+    return quotes
+
+
+def _ticker_row(stock, quote):
+    ltp = float(quote.get("ltp", 0))
+    # LTP-mode ticks carry no close: unknown, so no change either (not a change against 1)
+    close = float(quote.get("close") or 0)
+    change_percent = ((ltp - close) / close * 100) if close else 0
+    return {
+        "name": stock["name"],
+        "ltp": round(ltp, 2),
+        "changePercent": round(change_percent, 2),
+    }
 
-            ltp = float(ltp_data.get("ltp", 0))
-            close = float(ltp_data.get("close", 1)) or 0
-            change_percent = ((ltp - close) / close * 100) if close else 0
 
-            stocks.append({
-                "name": stock["name"],
-                "ltp": round(ltp, 2),
-                "changePercent": round(change_percent, 2),
-            })
+def ticker_data():
+    # ?list=<watchlist>, default every tracked symbol
+    try:
+        stocks = _requested_stocks()
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(ticker_rows(_watchlist_quotes(stocks), stocks))
 
-            time.sleep(2)  # ✅ avoid rate limit
+
+def ticker_rows(quotes, watchlist):
+    stocks = []
+    for stock in watchlist:
+        exchange = stock["exchange"]
+        tradingsymbol = stock["tradingsymbol"]
+        try:
+            ltp_data = quotes.get((exchange, tradingsymbol))
+            if not ltp_data:
+                raise ValueError("No quote returned")
+            stocks.append(_ticker_row(stock, ltp_data))
 
         except Exception as e:
-            print(f"❌ Error fetching {stock['name']} ({exchange}:{tradingsymbol}): {e}")
+            log.error("Error fetching %s (%s:%s): %s", stock["name"], exchange, tradingsymbol, e)
             continue
 
-    return jsonify(stocks)
+    return stocks
+
+
+# (quote_table version, {name: row}) shared by every /ticker_stream client
+_ticker_rows_cache = (None, {})
+
+
+def _ticker_rows():
+    # Rows are rebuilt once per table version, not once per connected client
+    global _ticker_rows_cache
+    version = quote_table.version
+    if _ticker_rows_cache[0] != version:
+        table = quote_table.snapshot()
+        rows = {}
+        for stock in tracked_stocks():
+            quote = table.get((stock["exchange"], stock["tradingsymbol"]))
+            if quote:
+                rows[stock["name"]] = _ticker_row(stock, quote)
+        _ticker_rows_cache = (version, rows)
+    return _ticker_rows_cache
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+def ticker_stream():
+    """
+    Server-Sent Events: one `snapshot` event with every row, then `delta`
+    events with only the rows whose ltp/changePercent changed, at most one per
+    SSE_TICK_INTERVAL, and `remove` events with the names of rows that left
+    the watchlists.
+
+    The generator only runs when the server asks for the next chunk, i.e. once
+    the previous one was written to the socket. A slow client therefore never
+    queues events; it just gets the diff against the newest rows next time.
+    """
+    _track(ensure_feed)
+
+    def events():
+        version, rows = _ticker_rows()
+        yield "retry: 3000\n" + _sse("snapshot", list(rows.values()))
+        sent, last_version = rows, version
+        last_write = time.monotonic()
+
+        while True:
+            time.sleep(SSE_TICK_INTERVAL)
+            # A connected client keeps the quote poller going
+            touch_quotes()
+            version, rows = _ticker_rows()
+            if version != last_version:
+                changed = [row for name, row in rows.items() if sent.get(name) != row]
+                removed = [name for name in sent if name not in rows]
+                sent, last_version = rows, version
+                if changed or removed:
+                    yield (_sse("remove", removed) if removed else "") + (_sse("delta", changed) if changed else "")
+                    last_write = time.monotonic()
+                    continue
+            if time.monotonic() - last_write >= SSE_HEARTBEAT:
+                # Comment line, keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 def get_symboltoken_with_log(tradingsymbol: str, exchange: str = "NSE") -> str:
     # We can't peek into lru_cache directly anymore
-    print(f"🔄 Checking token for {exchange}:{tradingsymbol} ...")
+    log.debug("Checking token for %s:%s", exchange, tradingsymbol)
     return resolve_symboltoken(tradingsymbol, exchange)
 
 
 
-def update_ticker_data_to_db():
-    for stock in WATCHSTOCKLIST:
-        try:
-            exchange = stock["exchange"]
-            tradingsymbol = stock["tradingsymbol"]
-
-            # 1) Resolve token dynamically
-            symboltoken = get_symboltoken_with_log(tradingsymbol, exchange)
+def collect_ticker_snapshot(stocks):
+    # Quotes for the whole list first; persistence happens separately in one bulk write
+    resolved, quotes = _fetch_watchlist_quotes(stocks)
+    updated_at = datetime.utcnow()
 
-            # 2) Fetch LTP using the wrapper
-            ltp_response = fetch_ltp(exchange, tradingsymbol, symboltoken)
+    snapshot, seen = [], set()
+    for stock, symboltoken in resolved:
+        exchange = stock["exchange"]
+        tradingsymbol = stock["tradingsymbol"]
+        if (exchange, tradingsymbol) in seen:
+            continue
+        seen.add((exchange, tradingsymbol))
 
-            ltp_data = ltp_response.get("data", {}) or {}
+        try:
+            ltp_data = quotes.get((exchange, tradingsymbol))
+            if not ltp_data:
+                raise ValueError("No quote returned")
 
             ltp = float(ltp_data.get("ltp", 0))
-            close = float(ltp_data.get("close", 1))
+            close = float(ltp_data.get("close") or 0)
             change_percent = ((ltp - close) / close * 100) if close else 0
 
-            # 3) Upsert payload
-            data = {
+            snapshot.append({
                 "name": stock["name"],
                 "ltp": round(ltp, 2),
                 "close": round(close, 2),
@@ -208,23 +466,180 @@ def update_ticker_data_to_db():
                 "symboltoken": symboltoken,
                 "tradingsymbol": tradingsymbol,
                 "exchange": exchange,
-                "updatedAt": datetime.utcnow(),
-            }
+                "updatedAt": updated_at,
+            })
+
+        except Exception as e:
+            log.error("Error fetching %s (%s:%s): %s", stock["name"], exchange, tradingsymbol, e)
+
+    return snapshot
 
-            db.tickerdata.update_one(
-                {"exchange": exchange, "tradingsymbol": tradingsymbol},
-                {"$set": data},
-                upsert=True
-            )
 
-            print(f"✅ Updated {stock['name']} ({exchange}:{tradingsymbol}, token={symboltoken})")
+# Job lock shared by scheduler.py and POST /update_tickers_db
+UPDATE_TICKERS_JOB = "update_tickers"
 
-            time.sleep(2)  # ✅ avoid rate limit
 
+def update_ticker_data_to_db(stocks=None):
+    # stocks: this worker's shard when the refresh is sharded, else every tracked symbol
+    snapshot = collect_ticker_snapshot(tracked_stocks() if stocks is None else stocks)
+    report = write_ticker_snapshot(snapshot)
+
+    for symbol, error in report["errors"].items():
+        log.error("Error updating %s: %s", symbol, error)
+    log.info("tickerdata updated", extra={k: report[k] for k in ("written", "skipped", "failed")})
+
+    # Every refresh also lands in the history time series, changed or not
+    report["history"] = append_history(snapshot)
+    for error in report["history"]["errors"]:
+        log.error("Error appending ticker history: %s", error)
+    return report
+
+
+def ticker_history():
+    # ?exchange=NSE&tradingsymbol=SBIN-EQ&minutes=60&resolution=raw|1m|5m
+    exchange = request.args.get("exchange", "NSE")
+    tradingsymbol = request.args.get("tradingsymbol")
+    resolution = request.args.get("resolution", "raw")
+    try:
+        minutes = int(request.args.get("minutes", 60))
+        if not tradingsymbol:
+            raise ValueError("tradingsymbol is required")
+
+        rows = get_history(exchange, tradingsymbol, minutes, resolution)
+        for row in rows:
+            for field in ("updatedAt", "bucket"):
+                if field in row:
+                    row[field] = row[field].isoformat() + "Z"
+
+        return jsonify({"exchange": exchange, "tradingsymbol": tradingsymbol, "resolution": resolution, "data": rows})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def watchlist_indicators():
+    # ?indicators=SMA_50,RSI_14&interval=ONE_DAY&days=250&list=<watchlist>
+    specs = [s.strip() for s in request.args.get("indicators", "").split(",") if s.strip()]
+    specs = specs or list(COMBINED_INDICATORS.values())
+    interval = request.args.get("interval", "ONE_DAY")
+
+    try:
+        days = request.args.get("days", "250")
+        if not days.isdigit() or int(days) <= 0:
+            raise ValueError(f"days must be a positive integer, got '{days}'")
+        days = int(days)
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Unknown interval '{interval}', expected one of {list(INTERVAL_SECONDS)}")
+        for spec in specs:
+            indicators.parse_spec(spec)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        stocks = _requested_stocks()
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+    rows, series, errors = [], [], {}
+    for stock, symboltoken in _resolve_watchlist(stocks):
+        try:
+            series.append(_load_candles(stock["exchange"], symboltoken, interval, days))
+            rows.append(stock)
         except Exception as e:
-            print(f"❌ Error updating {stock['name']} ({exchange}:{tradingsymbol}): {e}")\
-            
+            errors[stock["tradingsymbol"]] = str(e)
+
+    # One pass over the whole watchlist as a 2-D batch
+    batch = {field: indicators.stack(series, field) for field in ("open", "high", "low", "close", "volume")}
+    values = indicators.compute(batch, specs) if rows else {}
+
+    result = []
+    for i, stock in enumerate(rows):
+        item = {
+            "name": stock["name"],
+            "exchange": stock["exchange"],
+            "tradingsymbol": stock["tradingsymbol"],
+        }
+        for spec in specs:
+            item[spec] = indicators.to_python(values[spec][i], 2 if spec.upper().startswith("RET") else None)
+        result.append(item)
+
+    return jsonify({"data": result, "errors": errors})
+
+
+# Rows /api/screen returns when no limit is given
+SCREEN_DEFAULT_LIMIT = 100
+
+
+def screen():
+    # ?where=above DMA_200 and 5D% > 3&sort=-5D%&limit=20&fields=ltp,DMA_200,5D%&list=<watchlist>
+    # (or the same keys in a JSON body; "%" has to be sent as %25 in a URL)
+    params = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args
+    if not isinstance(params, dict):
+        return jsonify({"error": "The body must be a JSON object"}), 400
+    _track(ensure_feed)
+    _track(ensure_screener)
+
+    try:
+        stocks = _requested_stocks(params) if params.get("list") else None
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    try:
+        limit = params.get("limit", SCREEN_DEFAULT_LIMIT)
+        if isinstance(limit, bool) or not isinstance(limit, (int, str)):
+            raise ValueError("limit must be a number")
+        limit = int(limit)
+        if limit < 0:
+            raise ValueError("limit must be 0 or more")
+        fields = params.get("fields")
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(",") if f.strip()]
+        if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+            raise ValueError("fields must be a string or a list of strings")
+        for key in ("where", "sort"):
+            if params.get(key) is not None and not isinstance(params.get(key), str):
+                raise ValueError(f"{key} must be a string")
+        result = run_screen(params.get("where"), params.get("sort"), limit, fields, stocks)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+def watchlists():
+    return jsonify({"data": list_watchlists()})
+
+
+def watchlist(name):
+    # GET: entries; POST {"symbols": ["SBIN", "TCS-EQ", {"exchange": "BSE", "tradingsymbol": "..."}],
+    # "exchange": "NSE"}: add (list created on first use); DELETE: the whole list.
+    # Running feeds, the screener and the scheduler pick changes up from Mongo.
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return jsonify({"error": "The body must be a JSON object"}), 400
+        symbols = body.get("symbols")
+        if not isinstance(symbols, list) or not symbols:
+            return jsonify({"error": "symbols must be a non-empty list"}), 400
+        if not isinstance(body.get("exchange", "NSE"), str):
+            return jsonify({"error": "exchange must be a string"}), 400
+        report = add_symbols(name, symbols, body.get("exchange", "NSE"))
+        return jsonify(report), 200 if report["added"] or report["existing"] else 400
 
+    if request.method == "DELETE":
+        deleted = delete_watchlist(name)
+        if not deleted:
+            return jsonify({"error": f"No watchlist named {name}"}), 404
+        return jsonify({"deleted": deleted})
+
+    entries = get_watchlist(name)
+    if not entries:
+        return jsonify({"error": f"No watchlist named {name}"}), 404
+    return jsonify({"name": name, "data": entries})
+
+
+def watchlist_symbol(name, symbol):
+    # DELETE /watchlists/<name>/NSE:SBIN-EQ (exchange defaults to NSE)
+    exchange, _, tradingsymbol = symbol.rpartition(":")
+    if not remove_symbol(name, exchange or "NSE", tradingsymbol.upper()):
+        return jsonify({"error": f"{symbol} is not in watchlist {name}"}), 404
+    return jsonify({"deleted": 1})
 
 
 def market_data():
@@ -234,6 +649,8 @@ def market_data():
     try:
         data = fetch_market_data(exchange, tradingsymbol, symboltoken)
         return jsonify(data)
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -244,6 +661,8 @@ def security_info():
     try:
         data = fetch_security_info(exchange, tradingsymbol, symboltoken)
         return jsonify(data)
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -254,9 +673,26 @@ def option_chain():
     try:
         data = fetch_option_chain(exchange, tradingsymbol, symboltoken)
         return jsonify(data)
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+def option_analytics():
+    name = request.args.get("name")
+    expiry = request.args.get("expiry")
+    exchange = request.args.get("exchange", "NFO")
+    try:
+        if not name:
+            raise ValueError("name is required, e.g. NIFTY")
+        spot = float(request.args["spot"]) if request.args.get("spot") else None
+        return jsonify(get_option_analytics(name, expiry, exchange, spot))
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        log.error("Error in option_analytics: %s", e)
+        return jsonify({"error": str(e)}), 400
+
 def expiry_list():
     exchange = request.args.get("exchange")
     tradingsymbol = request.args.get("tradingsymbol")
@@ -264,13 +700,97 @@ def expiry_list():
     try:
         data = fetch_expiry_list(exchange, tradingsymbol, symboltoken)
         return jsonify(data)
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+def metrics():
+    # Prometheus scrape target; counters are per worker process
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 def master_contract():
     exchange = request.args.get("exchange")
+    if request.args.get("format") == "ndjson":
+        return _stream_master_contract(exchange)
     try:
         data = fetch_master_contract(exchange)
         return jsonify(data)
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
\ No newline at end of file
+        return jsonify({"error": str(e)}), 400
+
+MASTER_CONTRACT_PAGE_LIMIT = 100000
+
+
+def _stream_master_contract(exchange):
+    """
+    NDJSON from the local instrument master, one instrument per line.
+
+    Filters (instrumenttype, name prefix, expiry_from/expiry_to as YYYY-MM-DD)
+    and the cursor/limit page are applied to the memory-mapped columns before
+    anything is serialized. The ETag covers the master version plus every
+    parameter, so an unchanged download is a bodyless 304. Bodies are gzipped
+    chunk by chunk when the client accepts it.
+    """
+    master = get_master()
+    if master is None:
+        return jsonify({"error": "Instrument master is still loading, try again shortly"}), 503, {"Retry-After": "30"}
+
+    args = request.args
+    try:
+        limit = int(args.get("limit", MASTER_CONTRACT_PAGE_LIMIT))
+        if limit < 1:
+            raise ValueError("limit must be 1 or more")
+        idx = master.select(
+            exchange=exchange,
+            instrumenttype=args.get("instrumenttype"),
+            name_prefix=args.get("name"),
+            expiry_from=args.get("expiry_from"),
+            expiry_to=args.get("expiry_to"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Cursor = "<master version tag>.<last row sent>"; row numbers change when the master is refreshed
+    version_tag = hashlib.sha1(master.version.encode()).hexdigest()[:12]
+    cursor = args.get("cursor")
+    if cursor:
+        tag, _, row = cursor.partition(".")
+        if tag != version_tag or not row.isdigit():
+            return jsonify({"error": "Cursor is invalid or from an older instrument master, start again"}), 409
+        idx = idx[np.searchsorted(idx, int(row), side="right"):]
+
+    page, more = idx[:limit], len(idx) > limit
+    use_gzip = "gzip" in request.accept_encodings
+
+    etag = hashlib.sha1(json.dumps(
+        [master.version, exchange, sorted(args.items(multi=True)), use_gzip]
+    ).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    def body():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        for records in master.records(page):
+            chunk = b"".join(dumps(record) + b"\n" for record in records)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+
+    headers = {"X-Result-Count": str(len(page)), "Vary": "Accept-Encoding"}
+    if more:
+        headers["X-Next-Cursor"] = f"{version_tag}.{int(page[-1])}"
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    response = Response(body(), mimetype="application/x-ndjson", headers=headers)
+    response.set_etag(etag)
+    return response
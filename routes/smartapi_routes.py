@@ -1,25 +1,45 @@
 # this is used inorder to organise our codes
 from flask import Blueprint
 import controllers.smartapi_controllers as ctrl
+from services.job_lock import job_lock
+from utils.json_response import jsonify, compress_response
+from utils.metrics import start_request_timer, observe_request
 
 smartapi_bp = Blueprint("smartapi", __name__)
+smartapi_bp.before_request(start_request_timer)
+# after_request hooks run last-registered first: the timer is registered first so it includes compression
+smartapi_bp.after_request(observe_request)
+smartapi_bp.after_request(compress_response)
 
 
 smartapi_bp.route('/market_data', methods=['GET'])(ctrl.market_data)
 smartapi_bp.route('/security_info', methods=['GET'])(ctrl.security_info)
 smartapi_bp.route('/option_chain', methods=['GET'])(ctrl.option_chain)
+smartapi_bp.route('/option_analytics', methods=['GET'])(ctrl.option_analytics)
 smartapi_bp.route('/expiry_list', methods=['GET'])(ctrl.expiry_list)
 smartapi_bp.route('/master_contract', methods=['GET'])(ctrl.master_contract)
 
 
 
 smartapi_bp.route('/combined_data', methods=['GET'])(ctrl.combined_data)
+smartapi_bp.route('/combined_data/batch', methods=['GET', 'POST'])(ctrl.combined_data_batch)
 smartapi_bp.route('/ticker_data', methods=['GET'])(ctrl.ticker_data)
+smartapi_bp.route('/ticker_stream', methods=['GET'])(ctrl.ticker_stream)
+smartapi_bp.route('/indicators', methods=['GET'])(ctrl.watchlist_indicators)
+smartapi_bp.route('/ticker_history', methods=['GET'])(ctrl.ticker_history)
+smartapi_bp.route('/screen', methods=['GET', 'POST'])(ctrl.screen)
+smartapi_bp.route('/watchlists', methods=['GET'])(ctrl.watchlists)
+smartapi_bp.route('/watchlists/<name>', methods=['GET', 'POST', 'DELETE'])(ctrl.watchlist)
+smartapi_bp.route('/watchlists/<name>/<symbol>', methods=['DELETE'])(ctrl.watchlist_symbol)
+smartapi_bp.route('/metrics', methods=['GET'])(ctrl.metrics)
 @smartapi_bp.route('/update_tickers_db', methods=['POST'])
 def update_tickers():
-    from controllers import smartapi_controller as ctrl
-    ctrl.update_ticker_data_to_db()
-    return jsonify({"status": "success", "message": "Ticker data updated in DB"})
+    # Same lock as the scheduler's job, so a manual run never overlaps a scheduled one
+    with job_lock(ctrl.UPDATE_TICKERS_JOB) as acquired:
+        if not acquired:
+            return jsonify({"status": "skipped", "message": "A ticker update is already running"}), 409
+        report = ctrl.update_ticker_data_to_db()
+    return jsonify({"status": "success", "message": "Ticker data updated in DB", "report": report})
 
 
 
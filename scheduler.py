@@ -1,25 +1,152 @@
-import schedule
+"""
+Background jobs:
+
+    update_tickers      quotes -> tickerdata/history, every SCHEDULE_QUOTES_SECONDS in market hours
+    candles_eod         today's daily bars into the candle store, at SCHEDULE_CANDLES_AT on trading days
+    instrument_master   scrip master download, daily at SCHEDULE_MASTER_AT
+
+Any number of hosts can run this; update_tickers (and candles_eod with the
+mongo candle store) take a Mongo lock per run so only one of them does.
+With SHARD_REFRESH=1 update_tickers is split instead: every process refreshes
+its own consistent-hash shard of the watchlists (services/shard_ring.py).
+
+Every run reads the symbol universe from the Mongo watchlists as they are
+then; symbols added in between get their daily history backfilled right away
+and removed ones lose their tickerdata document (services/watchlists.py).
+"""
+import hashlib
+import os
+import threading
 import time
-from controllers.smartapi_controllers import update_ticker_data_to_db
+from datetime import datetime, timedelta
+
+from backfill import run_backfill
+from config.settings import (
+    BACKFILL_DIR,
+    CANDLE_STORE_BACKEND,
+    INSTRUMENT_MASTER_ENABLED,
+    SCHEDULE_CANDLES_AT,
+    SCHEDULE_CANDLES_DAYS,
+    SCHEDULE_MASTER_AT,
+    SCHEDULE_QUOTES_SECONDS,
+    SHARD_REFRESH,
+)
+from controllers.smartapi_controllers import UPDATE_TICKERS_JOB, update_ticker_data_to_db
+from services import instrument_master
+from services.job_lock import ensure_lock_indexes, job_lock
+from services.candle_store import final_before
+from services.job_scheduler import Job, Scheduler
+from services.market_calendar import IST
+from services.shard_ring import ShardMember
+from services.tickerdata_service import ensure_indexes, remove_tickers
+from services.watchlists import ensure_watchlist_indexes, get_watchlists, tracked_stocks
+from utils.logger import get_logger
+
+log = get_logger("scheduler")
+
+
+def candles_eod():
+    today = datetime.now(IST)
+    from_ts = int((today - timedelta(days=SCHEDULE_CANDLES_DAYS)).timestamp())
+    # Checkpointed per last final bar, not per run date: a run before today's bar
+    # has settled (see final_before) doesn't mark the symbols done for a later one
+    final = datetime.fromtimestamp(final_before("ONE_DAY"), IST)
+    run_dir = os.path.join(BACKFILL_DIR, f"eod_before_{final:%Y-%m-%d}")
+    failed = run_backfill(tracked_stocks(), "ONE_DAY", from_ts, int(time.time()), run_dir)
+    if failed:
+        # The retry skips the symbols that are done
+        raise RuntimeError(f"{failed} symbols failed")
+
+
+def update_ticker_shard(member):
+    universe = tracked_stocks()
+    stocks = member.shard(universe)
+    log.info("Refreshing %d/%d symbols", len(stocks), len(universe))
+    return update_ticker_data_to_db(stocks)
 
-def job():
-    try:
-        print("🔁 Updating ticker data to DB...")
-        update_ticker_data_to_db()
-        print("✅ DB update successful.")
-    except Exception as e:
-        print(f"❌ Error updating DB: {e}")
 
+class WatchlistChanges:
+    """
+    Follows the watchlists: history for symbols added, tickerdata dropped for
+    symbols removed. Every scheduler process sees the same change, so each
+    action runs under a job lock named after the symbols it covers and only one
+    host does it. History goes to every host when each keeps its own file
+    store, like candles_eod.
+    """
 
-# Run the job once on script start (for immediate testing)
-print("🔥 Running job manually to test DB update now...")
-job()
+    def update(self, added, removed):
+        if added:
+            # Off the sync thread; a backfill of a few hundred symbols takes a while
+            threading.Thread(target=self._backfill, args=(added,), name="watchlist-backfill", daemon=True).start()
+        if removed:
+            self._once("watchlist_remove", removed, self._remove)
 
-# Schedule the job every 5 minutes
-schedule.every(30).minutes.do(job)
+    @staticmethod
+    def _once(job, stocks, action):
+        symbols = ",".join(sorted(f"{s['exchange']}:{s['tradingsymbol']}" for s in stocks))
+        name = f"{job}:{hashlib.sha1(symbols.encode()).hexdigest()[:16]}"
+        with job_lock(name) as acquired:
+            if not acquired:
+                log.info("%s for %d symbols is running on another host", job, len(stocks))
+                return
+            action(stocks)
 
-# Keep running and waiting
-while True:
-    print("⏳ Waiting to run scheduled job...")
-    schedule.run_pending()
-    time.sleep(10)
+    @staticmethod
+    def _remove(stocks):
+        log.info("Dropped tickerdata of %d removed symbols", remove_tickers(stocks))
+
+    @classmethod
+    def _backfill(cls, stocks):
+        if CANDLE_STORE_BACKEND == "mongo":
+            # A host that gets the change after the lock was released finds nothing missing
+            cls._once("watchlist_backfill", stocks, cls._run_backfill)
+        else:
+            cls._run_backfill(stocks)
+
+    @staticmethod
+    def _run_backfill(stocks):
+        today = datetime.now(IST)
+        from_ts = int((today - timedelta(days=SCHEDULE_CANDLES_DAYS)).timestamp())
+        run_dir = os.path.join(BACKFILL_DIR, f"added_{today:%Y-%m-%d}")
+        failed = run_backfill(stocks, "ONE_DAY", from_ts, int(time.time()), run_dir)
+        if failed:
+            # candles_eod picks them up at the end of the day
+            log.error("History backfill failed for %d of %d new watchlist symbols", failed, len(stocks))
+
+
+def refresh_instrument_master():
+    # No-op when today's copy is already there
+    instrument_master.refresh()
+
+
+if SHARD_REFRESH:
+    _member = ShardMember(UPDATE_TICKERS_JOB)
+    _tickers_job = Job(UPDATE_TICKERS_JOB, lambda: update_ticker_shard(_member), every=SCHEDULE_QUOTES_SECONDS,
+                       market_hours=True, run_on_start=True, jitter=0.5, distributed=False)
+else:
+    _tickers_job = Job(UPDATE_TICKERS_JOB, update_ticker_data_to_db, every=SCHEDULE_QUOTES_SECONDS,
+                       market_hours=True, run_on_start=True, jitter=0.5)
+
+JOBS = [
+    _tickers_job,
+    Job("candles_eod", candles_eod, at=SCHEDULE_CANDLES_AT, trading_days=True, jitter=30,
+        distributed=CANDLE_STORE_BACKEND == "mongo"),
+]
+if INSTRUMENT_MASTER_ENABLED:
+    # Every host keeps its own copy of the master files
+    JOBS.append(Job("instrument_master", refresh_instrument_master, at=SCHEDULE_MASTER_AT, run_on_start=True,
+                    jitter=60, distributed=False))
+
+
+if __name__ == "__main__":
+    ensure_indexes()
+    ensure_lock_indexes()
+    ensure_watchlist_indexes()
+    _changes = WatchlistChanges()
+    get_watchlists().track(lambda stocks: _changes)
+    try:
+        Scheduler(JOBS).run_forever()
+    finally:
+        if SHARD_REFRESH:
+            # Hand our shard over now instead of after SHARD_WORKER_TTL
+            _member.leave()
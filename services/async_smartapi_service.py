@@ -0,0 +1,324 @@
+import asyncio
+import json
+import weakref
+from collections import defaultdict
+from functools import wraps
+from urllib.parse import urljoin
+
+try:
+    import aiohttp
+except ImportError:  # only the ASGI app (asgi.py) needs it
+    aiohttp = None
+
+from SmartApi import smartExceptions
+from SmartApi.smartConnect import SmartConnect
+
+from config.settings import ASYNC_POOL_SIZE, ASYNC_KEEPALIVE, BROKER_CALL_TIMEOUT
+from services.rate_limiter import acquire_async
+from services.instrument_master import lookup_token, lookup_scrip
+from services.smartapi_service import (
+    get_api_object,
+    session_ready,
+    renew_session,
+    _is_invalid_token,
+    MARKET_DATA_BATCH_SIZE,
+    BROKER_CALLS,
+    BROKER_CALL_SECONDS,
+    RATE_LIMIT_WAIT_SECONDS,
+    FETCH_SECONDS,
+    TOKEN_RENEWALS,
+)
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# SmartConnect method -> its route in the SDK's route table
+ROUTES = {
+    "ltpData": "api.ltp.data",
+    "getMarketData": "api.market.data",
+    "getCandleData": "api.candle.data",
+    "searchScrip": "api.search.scrip",
+}
+
+# Same bound as search_scrip_and_extract's lru_cache
+SCRIP_CACHE_SIZE = 1000
+
+
+class AsyncBrokerClient:
+    """
+    Pooled aiohttp session to the SmartAPI REST host, for one event loop.
+
+    Requests carry the same headers as SmartConnect (requestHeaders() plus the
+    session's Bearer token), so auth, errors and responses match the SDK.
+    Connections are kept alive and reused; past `pool_size` open connections
+    further calls queue in the connector instead of opening more.
+    """
+
+    def __init__(self, pool_size=ASYNC_POOL_SIZE, keepalive=ASYNC_KEEPALIVE, timeout=BROKER_CALL_TIMEOUT):
+        if aiohttp is None:
+            raise RuntimeError("The async service layer needs aiohttp (pip install aiohttp)")
+        connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=keepalive, ttl_dns_cache=300)
+        self._http = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+        # In-flight lookups shared by every coroutine asking for the same key
+        self._inflight = {}
+
+    @property
+    def closed(self):
+        return self._http.closed
+
+    async def post(self, obj, method, params):
+        url = urljoin(obj.root, SmartConnect._routes[ROUTES[method]])
+        headers = obj.requestHeaders()
+        if obj.access_token:
+            headers["Authorization"] = f"Bearer {obj.access_token}"
+
+        async with self._http.post(url, data=json.dumps(params), headers=headers) as r:
+            body = await r.read()
+            status = r.status
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise smartExceptions.DataException(f"Couldn't parse the JSON response received from the server: {body!r}")
+
+        # Same mapping as SmartConnect._request: error_type names the exception class
+        if data.get("error_type"):
+            exception = getattr(smartExceptions, data["error_type"], smartExceptions.GeneralException)
+            raise exception(data["message"], code=status)
+        return data
+
+    async def shared(self, key, factory):
+        """Await factory() once for concurrent callers with the same key."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def close(self):
+        await self._http.close()
+
+
+# One client per event loop: aiohttp sessions can't be shared across loops
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.closed:
+        client = _clients[loop] = AsyncBrokerClient()
+    return client
+
+
+async def close_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def _api_object():
+    # Logging in is blocking (TOTP + SDK call), keep it off the event loop
+    if session_ready():
+        return get_api_object()
+    return await asyncio.to_thread(get_api_object)
+
+
+async def _call_api_async(endpoint_class, method, params):
+    """
+    _call_api for coroutines: same rate limits, same session, and the same
+    single re-login on an "Invalid Token" failure.
+    """
+    await _acquire(endpoint_class)
+    obj = await _api_object()
+    try:
+        response = await _timed_post(obj, method, params)
+        if not _is_invalid_token(response):
+            return response
+    except Exception as e:
+        if not _is_invalid_token(e):
+            raise e
+
+    log.warning("Token expired, re-authenticating", extra={"method": method})
+    TOKEN_RENEWALS.inc()
+    obj = await asyncio.to_thread(renew_session, obj)
+    await _acquire(endpoint_class)
+    return await _timed_post(obj, method, params)
+
+
+async def _acquire(endpoint_class):
+    with RATE_LIMIT_WAIT_SECONDS.time(endpoint_class=endpoint_class):
+        await acquire_async(endpoint_class)
+
+
+async def _timed_post(obj, method, params):
+    with BROKER_CALL_SECONDS.time(method=method):
+        try:
+            response = await get_client().post(obj, method, params)
+        except Exception:
+            BROKER_CALLS.inc(method=method, outcome="exception")
+            raise
+    failed = isinstance(response, dict) and response.get("status") is False
+    BROKER_CALLS.inc(method=method, outcome="error" if failed else "ok")
+    return response
+
+
+def _timed(fn):
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with FETCH_SECONDS.time(fetch=fn.__name__):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+async def gather_async(coroutines, timeout=None):
+    """
+    executor.gather for coroutines: run a {name: coroutine} dict concurrently
+    with one overall deadline. Returns (results, errors).
+    """
+    timeout = BROKER_CALL_TIMEOUT if timeout is None else timeout
+    names = list(coroutines)
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines.values()]
+    done, pending = await asyncio.wait(tasks, timeout=timeout) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+
+    results, errors = {}, {}
+    for name, task in zip(names, tasks):
+        if task in pending:
+            errors[name] = TimeoutError(f"'{name}' did not finish within {timeout}s")
+        elif task.exception() is not None:
+            errors[name] = task.exception()
+        else:
+            results[name] = task.result()
+    return results, errors
+
+
+# ---------- symbols ----------
+
+_scrips = {}
+
+
+def _eq_scrip(items):
+    scrip_data = next((item for item in items if item["tradingsymbol"].endswith("-EQ")), None)
+    if scrip_data:
+        return {
+            "exchange": scrip_data["exchange"],
+            "tradingsymbol": scrip_data["tradingsymbol"],
+            "symboltoken": scrip_data["symboltoken"],
+        }
+    return None
+
+
+async def search_scrip_async(search_str, exchange):
+    """search_scrip_and_extract for coroutines; one searchScrip per symbol however many callers wait on it."""
+    if not exchange or not search_str:
+        raise ValueError("exchange and search_str are required")
+
+    # Exact symbol only, like search_scrip_and_extract. On a thread: the first
+    # lookup (and the periodic reload check) reads the master from disk
+    row = await asyncio.to_thread(lookup_scrip, exchange, search_str)
+    if row:
+        return {"exchange": row["exchange"], "tradingsymbol": row["tradingsymbol"], "symboltoken": row["symboltoken"]}
+
+    key = (exchange, search_str)
+    if key in _scrips:
+        return _scrips[key]
+
+    async def search():
+        log.info("Searching for scrip %s on %s", search_str, exchange)
+        result = await _call_api_async("search", "searchScrip", {"exchange": exchange, "searchscrip": search_str})
+        if not result or not result.get("data"):
+            raise ValueError("No matching scrip found")
+        scrip = _eq_scrip(result["data"])
+        if not scrip:
+            raise ValueError("Matching EQ tradingsymbol not found in search results.")
+
+        # Oldest entry out first once full
+        if len(_scrips) >= SCRIP_CACHE_SIZE:
+            _scrips.pop(next(iter(_scrips)))
+        _scrips[key] = scrip
+        return scrip
+
+    return await get_client().shared(("search",) + key, search)
+
+
+async def resolve_symboltoken_async(tradingsymbol, exchange="NSE"):
+    token = await asyncio.to_thread(lookup_token, exchange, tradingsymbol)
+    if token:
+        return token
+
+    scrip = await search_scrip_async(tradingsymbol, exchange)
+    token = scrip.get("symboltoken")
+    if not token:
+        raise ValueError(f"Could not resolve symboltoken for {exchange}:{tradingsymbol}")
+    return str(token)
+
+
+# ---------- fetches ----------
+
+@_timed
+async def fetch_ltp_async(exchange, tradingsymbol, symboltoken):
+    return await _call_api_async("ltp", "ltpData", {
+        "exchange": exchange,
+        "tradingsymbol": tradingsymbol,
+        "symboltoken": symboltoken,
+    })
+
+
+@_timed
+async def fetch_quotes_batch_async(instruments, mode="OHLC"):
+    """
+    fetch_quotes_batch for coroutines: the same chunks of MARKET_DATA_BATCH_SIZE
+    tokens, but every chunk is in flight at once (each still takes a quote
+    rate limit slot). Returns {(exchange, tradingsymbol): quote}.
+    """
+    # 1) Group tokens by exchange and remember which tradingsymbol each token belongs to
+    tokens_by_exchange = defaultdict(list)
+    symbol_by_token = {}
+    for exchange, tradingsymbol, symboltoken in instruments:
+        symboltoken = str(symboltoken)
+        if (exchange, symboltoken) in symbol_by_token:
+            continue
+        tokens_by_exchange[exchange].append(symboltoken)
+        symbol_by_token[(exchange, symboltoken)] = tradingsymbol
+
+    # 2) All chunks concurrently
+    chunks = [
+        (exchange, tokens[i:i + MARKET_DATA_BATCH_SIZE])
+        for exchange, tokens in tokens_by_exchange.items()
+        for i in range(0, len(tokens), MARKET_DATA_BATCH_SIZE)
+    ]
+    responses = await asyncio.gather(*(
+        _call_api_async("quote", "getMarketData", {"mode": mode, "exchangeTokens": {exchange: chunk}})
+        for exchange, chunk in chunks
+    ), return_exceptions=True)
+
+    # Fail like the sync version, but only once every chunk has settled
+    for response in responses:
+        if isinstance(response, BaseException):
+            raise response
+
+    quotes = {}
+    for (exchange, _), response in zip(chunks, responses):
+        data = (response or {}).get("data") or {}
+        for quote in data.get("fetched") or []:
+            tradingsymbol = symbol_by_token.get((exchange, str(quote.get("symbolToken"))))
+            if tradingsymbol:
+                quotes[(exchange, tradingsymbol)] = quote
+
+        for miss in data.get("unfetched") or []:
+            log.warning("Quote not fetched for %s: %s", exchange, miss)
+
+    return quotes
+
+
+@_timed
+async def fetch_candle_data_async(exchange, symboltoken, interval, from_date, to_date):
+    return await _call_api_async("candle", "getCandleData", {
+        "exchange": exchange,
+        "symboltoken": symboltoken,
+        "interval": interval,
+        "fromdate": from_date,
+        "todate": to_date,
+    })
@@ -0,0 +1,390 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config.settings import CANDLE_STORE_BACKEND, CANDLE_STORE_DIR, CANDLE_OVERLAY_TTL
+from services.market_calendar import MARKET_CLOSE
+from services.smartapi_service import fetch_candle_data
+from utils.candle_series import CandleSeries
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# Bar length per SmartAPI interval, in seconds
+INTERVAL_SECONDS = {
+    "ONE_MINUTE": 60,
+    "THREE_MINUTE": 180,
+    "FIVE_MINUTE": 300,
+    "TEN_MINUTE": 600,
+    "FIFTEEN_MINUTE": 900,
+    "THIRTY_MINUTE": 1800,
+    "ONE_HOUR": 3600,
+    "ONE_DAY": 86400,
+}
+
+# Largest date range the broker accepts in one getCandleData call, in days
+MAX_WINDOW_DAYS = {
+    "ONE_MINUTE": 30,
+    "THREE_MINUTE": 60,
+    "FIVE_MINUTE": 100,
+    "TEN_MINUTE": 100,
+    "FIFTEEN_MINUTE": 200,
+    "THIRTY_MINUTE": 200,
+    "ONE_HOUR": 400,
+    "ONE_DAY": 2000,
+}
+
+CANDLE_DTYPE = np.dtype([
+    ("ts", "<i8"),       # bar start, epoch seconds
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<i8"),
+])
+
+_EMPTY = np.empty(0, dtype=CANDLE_DTYPE)
+
+_SETTLE_SECONDS = 60
+# A daily bar is final this long after the close (the closing session ends at 15:40)
+_DAILY_SETTLE = timedelta(minutes=10)
+
+
+# ---------- conversions ----------
+
+def rows_to_array(rows):
+    """Broker rows [[datetime, o, h, l, c, v], ...] -> structured array sorted by ts."""
+    if not rows:
+        return _EMPTY.copy()
+    return CandleSeries.from_rows(rows).to_array(CANDLE_DTYPE)
+
+
+def array_to_rows(arr):
+    """Structured array -> list of dicts in the shape get_candle_data has always returned."""
+    return CandleSeries.from_array(arr).to_rows()
+
+
+def merge(*arrays):
+    """Concatenate candle arrays; on duplicate timestamps the later array wins."""
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        return _EMPTY.copy()
+    combined = np.concatenate(arrays)
+    # Reverse so np.unique keeps the last occurrence of each ts
+    reversed_ = combined[::-1]
+    _, idx = np.unique(reversed_["ts"], return_index=True)
+    return reversed_[idx]
+
+
+def _broker_time(ts):
+    return datetime.fromtimestamp(ts, IST).strftime('%Y-%m-%d %H:%M')
+
+
+# ---------- storage backends ----------
+
+class FileCandleStore:
+    """
+    One .npy file of CANDLE_DTYPE rows per (exchange, symboltoken, interval),
+    memory-mapped on read, plus a small JSON sidecar with the covered range.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, key):
+        name = "_".join(str(part) for part in key)
+        return os.path.join(self.root, f"{name}.npy"), os.path.join(self.root, f"{name}.json")
+
+    def load(self, key):
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arr = np.load(data_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return _EMPTY, None
+        return arr, meta
+
+    def save(self, key, arr, meta, changed_from=None):
+        # The whole file is rewritten; changed_from only matters to bucketed backends
+        data_path, meta_path = self._paths(key)
+        # Write to temp files and rename so readers in other workers never see a partial file
+        tmp_data = f"{data_path}.{os.getpid()}.tmp"
+        with open(tmp_data, "wb") as f:
+            np.save(f, np.ascontiguousarray(arr, dtype=CANDLE_DTYPE))
+        os.replace(tmp_data, data_path)
+
+        tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+
+
+class MongoCandleStore:
+    """
+    Same contract backed by Mongo: the covered range lives in `candle_meta`,
+    bars live in `candles` as columnar bucket documents of BUCKET_BARS bars each,
+    so a tail update only rewrites the last bucket.
+    """
+
+    BUCKET_BARS = 5000
+
+    def __init__(self, db):
+        self.meta = db.candle_meta
+        self.buckets = db.candles
+        self.buckets.create_index([("key", 1), ("start", 1)], unique=True)
+
+    @staticmethod
+    def _key(key):
+        return ":".join(str(part) for part in key)
+
+    def _bucket_start(self, key, ts):
+        span = INTERVAL_SECONDS[key[2]] * self.BUCKET_BARS
+        return int(ts - ts % span)
+
+    def load(self, key):
+        meta = self.meta.find_one({"_id": self._key(key)}, {"_id": 0})
+        if not meta:
+            return _EMPTY, None
+
+        parts = []
+        for doc in self.buckets.find({"key": self._key(key)}).sort("start", 1):
+            part = np.empty(len(doc["ts"]), dtype=CANDLE_DTYPE)
+            for field in CANDLE_DTYPE.names:
+                part[field] = doc[field]
+            parts.append(part)
+        return (np.concatenate(parts) if parts else _EMPTY), meta
+
+    def save(self, key, arr, meta, changed_from=None):
+        from pymongo import UpdateOne
+
+        if changed_from is not None:
+            arr = arr[arr["ts"] >= self._bucket_start(key, changed_from)]
+
+        ops = []
+        if len(arr):
+            starts = arr["ts"] - arr["ts"] % (INTERVAL_SECONDS[key[2]] * self.BUCKET_BARS)
+            for start in np.unique(starts):
+                part = arr[starts == start]
+                doc = {field: part[field].tolist() for field in CANDLE_DTYPE.names}
+                ops.append(UpdateOne(
+                    {"key": self._key(key), "start": int(start)},
+                    {"$set": doc},
+                    upsert=True,
+                ))
+        if ops:
+            self.buckets.bulk_write(ops, ordered=False)
+        self.meta.update_one({"_id": self._key(key)}, {"$set": meta}, upsert=True)
+
+
+def _make_store():
+    if CANDLE_STORE_BACKEND == "mongo":
+        from config.db_config import db
+        return MongoCandleStore(db)
+    return FileCandleStore(CANDLE_STORE_DIR)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _make_store()
+    return _store
+
+
+# ---------- change listeners ----------
+
+_listeners = []
+
+
+def on_change(callback):
+    """callback(exchange, symboltoken, interval) whenever new bars land for a key in this process."""
+    _listeners.append(callback)
+
+
+def _notify(key):
+    for callback in _listeners:
+        try:
+            callback(*key)
+        except Exception:
+            pass  # a listener must never fail a candle fetch
+
+
+# ---------- incremental fetch ----------
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+# key -> (expires_at, covered_to, bars that may still change)
+_overlay = {}
+
+
+def _lock_for(key):
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def fetch_range(exchange, symboltoken, interval, from_ts, to_ts):
+    """Bars for [from_ts, to_ts] straight from the broker in one call, bypassing the store."""
+    response = fetch_candle_data(exchange, symboltoken, interval, _broker_time(from_ts), _broker_time(to_ts))
+    if not response or response.get("status") is False:
+        raise ValueError((response or {}).get("message") or "No candle data received")
+    return rows_to_array(response.get("data") or [])
+
+
+def _fetch_span(exchange, symboltoken, interval, from_ts, to_ts):
+    # fetch_range over as many broker-sized windows as [from_ts, to_ts] needs
+    return merge(*(
+        fetch_range(exchange, symboltoken, interval, start, end - 1)
+        for start, end in broker_windows(interval, from_ts, to_ts + 1)
+    ))
+
+
+def get_candles(exchange, symboltoken, interval="ONE_DAY", from_date=None, to_date=None):
+    """
+    Candles for [from_date, to_date] as a structured array.
+
+    The store holds every final bar in [meta["from"], meta["to"]); only the
+    missing head/tail ranges are fetched from the broker. Bars from meta["to"]
+    on may still change, so they are kept in a short-TTL in-memory overlay.
+    """
+    key = (exchange, str(symboltoken), interval)
+    now = time.time()
+    to_ts = int((to_date or datetime.now(IST)).timestamp())
+    from_ts = int(from_date.timestamp()) if from_date else to_ts - 250 * 86400
+    # Bars starting before this can't change any more (with a grace period for the broker to settle)
+    settled_before = final_before(interval, min(to_ts, now))
+
+    store = get_store()
+    with _lock_for(key):
+        stored, meta = store.load(key)
+        head = tail = _EMPTY
+        changed_from = None
+        fetched_tail = False
+
+        # 1) Head: nothing stored yet, or the request reaches further back than the store
+        if meta is None:
+            tail = _fetch_span(exchange, symboltoken, interval, from_ts, to_ts)
+            fetched_tail = True
+            meta = {"from": from_ts, "to": from_ts}
+            covered_to = settled_before
+        else:
+            covered_to = meta["to"]
+            if from_ts < meta["from"]:
+                head = _fetch_span(exchange, symboltoken, interval, from_ts, meta["from"])
+            else:
+                changed_from = meta["to"]
+
+            # 2) Tail: reuse the overlay while it is fresh, otherwise fetch the delta
+            if to_ts > meta["to"]:
+                overlay = _overlay.get(key)
+                if overlay and overlay[0] > now and to_ts <= overlay[1] + CANDLE_OVERLAY_TTL:
+                    tail = overlay[2]
+                else:
+                    tail = _fetch_span(exchange, symboltoken, interval, meta["to"], to_ts)
+                    fetched_tail = True
+                    covered_to = settled_before
+
+            if not len(head) and not fetched_tail:
+                # Served entirely from the store + overlay, nothing to persist
+                combined = merge(stored, tail)
+                return combined[(combined["ts"] >= from_ts) & (combined["ts"] <= to_ts)]
+
+        # 3) Persist bars that became final, keep the rest in the overlay
+        new_from = min(meta["from"], from_ts)
+        new_to = max(meta["to"], covered_to)
+        combined = merge(head, stored, tail)
+        completed = combined[combined["ts"] < new_to]
+        current = combined[combined["ts"] >= new_to]
+
+        new_meta = {"from": new_from, "to": new_to}
+        if new_meta != meta or len(completed) != len(stored):
+            store.save(key, completed, new_meta, changed_from=changed_from)
+        if fetched_tail:
+            _overlay[key] = (now + CANDLE_OVERLAY_TTL, to_ts, current)
+
+    _notify(key)
+    return combined[(combined["ts"] >= from_ts) & (combined["ts"] <= to_ts)]
+
+
+def get_series(exchange, symboltoken, interval="ONE_DAY", from_date=None, to_date=None):
+    """get_candles() as a CandleSeries (one contiguous array per field)."""
+    return CandleSeries.from_array(get_candles(exchange, symboltoken, interval, from_date, to_date))
+
+
+def peek_series(exchange, symboltoken, interval="ONE_DAY", from_ts=None):
+    """What the store and the in-memory overlay already hold, never calling the broker."""
+    key = (exchange, str(symboltoken), interval)
+    stored, _ = get_store().load(key)
+    overlay = _overlay.get(key)
+    combined = merge(stored, overlay[2]) if overlay else stored
+    if from_ts is not None:
+        combined = combined[combined["ts"] >= from_ts]
+    return CandleSeries.from_array(combined)
+
+
+# ---------- bulk backfill ----------
+
+def final_before(interval, now=None):
+    """Bars starting before this epoch second are complete and safe to persist."""
+    now = now or time.time()
+    if interval == "ONE_DAY":
+        # Daily bars are stamped 00:00 IST: today's is final once the session has
+        # closed and settled, not a full day after it started
+        moment = datetime.fromtimestamp(now, IST)
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        closed = datetime.combine(moment.date(), MARKET_CLOSE, IST) + _DAILY_SETTLE
+        return int((midnight + timedelta(days=1) if moment >= closed else midnight).timestamp())
+    return int(now - INTERVAL_SECONDS[interval] - _SETTLE_SECONDS)
+
+
+def missing_ranges(exchange, symboltoken, interval, from_ts, to_ts):
+    """Parts of [from_ts, to_ts) the store doesn't cover yet, oldest first."""
+    _, meta = get_store().load((exchange, str(symboltoken), interval))
+    if meta is None:
+        return [(from_ts, to_ts)] if from_ts < to_ts else []
+    ranges = []
+    if from_ts < meta["from"]:
+        ranges.append((from_ts, meta["from"]))
+    if to_ts > meta["to"]:
+        ranges.append((meta["to"], to_ts))
+    return ranges
+
+
+def broker_windows(interval, from_ts, to_ts):
+    """Split [from_ts, to_ts) into consecutive ranges the broker accepts in one call."""
+    span = MAX_WINDOW_DAYS[interval] * 86400
+    return [(start, min(start + span, to_ts)) for start in range(int(from_ts), int(to_ts), span)]
+
+
+def store_range(exchange, symboltoken, interval, arr, from_ts, to_ts):
+    """
+    Persist bars fetched for [from_ts, to_ts) in one write. The range must
+    touch or overlap what is stored (missing_ranges() guarantees that), so the
+    store keeps covering one contiguous span.
+    """
+    key = (exchange, str(symboltoken), interval)
+    store = get_store()
+    with _lock_for(key):
+        stored, meta = store.load(key)
+        if meta is not None and (to_ts < meta["from"] or from_ts > meta["to"]):
+            raise ValueError(f"Range {from_ts}-{to_ts} leaves a gap next to the stored {meta['from']}-{meta['to']}")
+
+        new_meta = {
+            "from": min(from_ts, meta["from"]) if meta else from_ts,
+            "to": max(to_ts, meta["to"]) if meta else to_ts,
+        }
+        combined = merge(stored, arr)
+        store.save(key, combined[combined["ts"] < new_meta["to"]], new_meta)
+        _overlay.pop(key, None)
+    _notify(key)
+    return new_meta
@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from config.settings import BROKER_POOL_SIZE, BROKER_CALL_TIMEOUT
+
+# Bounded pool for independent broker calls. Every call still goes through the
+# shared rate limiter, so the pool only bounds how many wait at once.
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor, _executor_pid
+    # Pool threads don't survive a fork, so each gunicorn worker gets its own
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=BROKER_POOL_SIZE, thread_name_prefix="broker")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+def gather(futures, timeout=None):
+    """
+    Wait for a {name: future} dict with one overall deadline.
+    Returns (results, errors); a leg that fails or times out only lands in errors.
+    """
+    timeout = BROKER_CALL_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    results, errors = {}, {}
+
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            errors[name] = TimeoutError(f"'{name}' did not finish within {timeout}s")
+        except Exception as e:
+            errors[name] = e
+
+    return results, errors
@@ -0,0 +1,425 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config.settings import (
+    INSTRUMENT_MASTER_ENABLED,
+    INSTRUMENT_MASTER_SOURCE,
+    INSTRUMENT_MASTER_DIR,
+    INSTRUMENT_MASTER_REFRESH_HOUR,
+)
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+try:
+    import fcntl  # one worker downloads, the others wait and reuse its file
+except ImportError:
+    fcntl = None
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# Fixed-width rows so the whole master is one memory-mappable array
+MASTER_DTYPE = np.dtype([
+    ("token", "S16"),
+    ("symbol", "S40"),
+    ("name", "S40"),
+    ("exchange", "S8"),
+    ("instrumenttype", "S12"),
+    ("expiry", "S12"),
+    ("strike", "<f8"),
+    ("lotsize", "<i4"),
+    ("tick_size", "<f8"),
+])
+
+# Seconds between checks whether another worker replaced the files
+_RELOAD_CHECK = 60
+
+
+# ---------- building ----------
+
+def _download(source):
+    # A local path (tests, air-gapped boxes) or the broker's scrip master URL
+    if os.path.exists(source):
+        with open(source) as f:
+            return json.load(f)
+    import requests
+
+    response = requests.get(source, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_array(records):
+    """Scrip master records ({"token", "symbol", "name", "exch_seg", ...}) -> MASTER_DTYPE array."""
+    rows, skipped = [], 0
+    for r in records:
+        row = (
+            str(r.get("token", "")).encode(),
+            str(r.get("symbol", "")).upper().encode(),
+            str(r.get("name", "")).upper().encode(),
+            str(r.get("exch_seg", "")).encode(),
+            str(r.get("instrumenttype", "")).encode(),
+            str(r.get("expiry", "")).encode(),
+            _float(r.get("strike"), -1.0),
+            int(_float(r.get("lotsize"), 1)),
+            _float(r.get("tick_size")),
+        )
+        # Fixed-width fields truncate silently; a truncated symbol would resolve wrongly
+        if len(row[0]) > 16 or len(row[1]) > 40 or len(row[3]) > 8:
+            skipped += 1
+            continue
+        rows.append(row)
+    if skipped:
+        log.warning("Instrument master: skipped %d rows with oversized fields", skipped)
+    return np.array(rows, dtype=MASTER_DTYPE)
+
+
+def _sort_keys(arr, field):
+    # "EXCH|VALUE" so one searchsorted finds a prefix within an exchange
+    return np.char.add(np.char.add(arr["exchange"], b"|"), arr[field])
+
+
+def _save(path, arr):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _paths(root):
+    return {
+        "master": os.path.join(root, "master.npy"),
+        "by_symbol": os.path.join(root, "by_symbol.npy"),
+        "by_name": os.path.join(root, "by_name.npy"),
+        "meta": os.path.join(root, "master.json"),
+        "lock": os.path.join(root, "master.lock"),
+    }
+
+
+def refresh(root=INSTRUMENT_MASTER_DIR, source=INSTRUMENT_MASTER_SOURCE, force=False):
+    """
+    Download the scrip master and rewrite the on-disk master plus its sorted
+    prefix indexes. Holds a file lock so concurrent workers download it once.
+    """
+    os.makedirs(root, exist_ok=True)
+    paths = _paths(root)
+
+    with open(paths["lock"], "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Someone else may have refreshed while we waited for the lock
+            if not force and not _refresh_due(_read_meta(paths["meta"])):
+                return False
+
+            started = time.monotonic()
+            arr = build_array(_download(source))
+            if not len(arr):
+                raise ValueError("Instrument master download is empty")
+
+            _save(paths["master"], arr)
+            _save(paths["by_symbol"], np.argsort(_sort_keys(arr, "symbol"), kind="stable").astype("<i4"))
+            _save(paths["by_name"], np.argsort(_sort_keys(arr, "name"), kind="stable").astype("<i4"))
+
+            # Meta last: readers reload when it changes
+            meta = {"fetched_at": datetime.now(IST).isoformat(), "rows": int(len(arr)), "source": source}
+            tmp = f"{paths['meta']}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, paths["meta"])
+
+            log.info("Instrument master refreshed: %d rows in %.1fs", len(arr), time.monotonic() - started)
+            return True
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_meta(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _refresh_due(meta):
+    # The broker publishes a new dump every morning; anything older than today's cutoff is stale
+    if not meta:
+        return True
+    now = datetime.now(IST)
+    cutoff = now.replace(hour=INSTRUMENT_MASTER_REFRESH_HOUR, minute=0, second=0, microsecond=0)
+    if now < cutoff:
+        cutoff -= timedelta(days=1)
+    return datetime.fromisoformat(meta["fetched_at"]) < cutoff
+
+
+# ---------- lookups ----------
+
+class InstrumentMaster:
+    """
+    Memory-mapped master with:
+      - hash indexes on (exchange, symbol) and (exchange, token), built on load
+      - sorted "EXCH|SYMBOL" / "EXCH|NAME" orders for prefix search (searchsorted)
+      - per-exchange trigram postings for fuzzy name search, built on first use
+    """
+
+    def __init__(self, root):
+        paths = _paths(root)
+        self.meta = _read_meta(paths["meta"])
+        self.arr = np.load(paths["master"], mmap_mode="r")
+        self._orders = {
+            "symbol": np.load(paths["by_symbol"], mmap_mode="r"),
+            "name": np.load(paths["by_name"], mmap_mode="r"),
+        }
+        self._sorted = {}
+        self._expiries = None
+        self._trigrams = {}
+        self._trigram_lock = threading.Lock()
+
+        exchanges = self.arr["exchange"].tolist()
+        rows = range(len(self.arr))
+        self._by_symbol = dict(zip(zip(exchanges, self.arr["symbol"].tolist()), rows))
+        self._by_token = dict(zip(zip(exchanges, self.arr["token"].tolist()), rows))
+
+    def __len__(self):
+        return len(self.arr)
+
+    @property
+    def version(self):
+        return self.meta["fetched_at"] if self.meta else ""
+
+    def expiry_dates(self):
+        # A few hundred distinct "26DEC2024" strings; parse each once, blanks -> NaT
+        if self._expiries is None:
+            values, inverse = np.unique(self.arr["expiry"], return_inverse=True)
+            parsed = []
+            for value in values.tolist():
+                try:
+                    parsed.append(np.datetime64(datetime.strptime(value.decode(), "%d%b%Y").date()))
+                except ValueError:
+                    parsed.append(np.datetime64("NaT"))
+            self._expiries = np.array(parsed, dtype="datetime64[D]")[inverse]
+        return self._expiries
+
+    def select(self, exchange=None, instrumenttype=None, name_prefix=None, expiry_from=None, expiry_to=None, name=None):
+        """Row numbers matching every given filter, ascending. Expiry bounds are dates, inclusive."""
+        idx = np.arange(len(self.arr))
+        if exchange:
+            idx = idx[self.arr["exchange"][idx] == exchange.encode()]
+        if instrumenttype:
+            idx = idx[self.arr["instrumenttype"][idx] == instrumenttype.upper().encode()]
+        if name:
+            idx = idx[self.arr["name"][idx] == name.upper().encode()]
+        if name_prefix:
+            idx = idx[np.char.startswith(self.arr["name"][idx], name_prefix.upper().encode())]
+        if expiry_from or expiry_to:
+            expiries = self.expiry_dates()[idx]
+            keep = ~np.isnat(expiries)
+            if expiry_from:
+                keep &= expiries >= np.datetime64(expiry_from, "D")
+            if expiry_to:
+                keep &= expiries <= np.datetime64(expiry_to, "D")
+            idx = idx[keep]
+        return idx
+
+    def records(self, idx, chunk=2000):
+        """Rows in scrip master shape, a list of dicts per chunk (columns are converted in bulk)."""
+        for start in range(0, len(idx), chunk):
+            part = self.arr[idx[start:start + chunk]]
+            columns = [part[field].tolist() for field in MASTER_DTYPE.names]
+            yield [
+                {
+                    "token": token.decode(),
+                    "symbol": symbol.decode(),
+                    "name": name.decode(),
+                    "expiry": expiry.decode(),
+                    "strike": strike,
+                    "lotsize": lotsize,
+                    "instrumenttype": instrumenttype.decode(),
+                    "exch_seg": exchange.decode(),
+                    "tick_size": tick_size,
+                }
+                for token, symbol, name, exchange, instrumenttype, expiry, strike, lotsize, tick_size in zip(*columns)
+            ]
+
+    @staticmethod
+    def row_dict(row):
+        return {
+            "exchange": row["exchange"].decode(),
+            "tradingsymbol": row["symbol"].decode(),
+            "symboltoken": row["token"].decode(),
+            "name": row["name"].decode(),
+            "instrumenttype": row["instrumenttype"].decode(),
+            "expiry": row["expiry"].decode(),
+            "strike": float(row["strike"]),
+            "lotsize": int(row["lotsize"]),
+            "tick_size": float(row["tick_size"]),
+        }
+
+    def by_symbol(self, exchange, tradingsymbol):
+        idx = self._by_symbol.get((exchange.encode(), tradingsymbol.upper().encode()))
+        return None if idx is None else self.row_dict(self.arr[idx])
+
+    def by_token(self, exchange, symboltoken):
+        idx = self._by_token.get((exchange.encode(), str(symboltoken).encode()))
+        return None if idx is None else self.row_dict(self.arr[idx])
+
+    def _sorted_keys(self, field):
+        # Materialized once; the order itself comes from disk
+        if field not in self._sorted:
+            self._sorted[field] = _sort_keys(self.arr, field)[self._orders[field]]
+        return self._sorted[field]
+
+    def prefix(self, exchange, prefix, field="symbol", limit=50):
+        """Rows of `exchange` whose symbol (or name) starts with `prefix`, in sorted order."""
+        keys = self._sorted_keys(field)
+        start = f"{exchange}|{prefix.upper()}".encode()
+        lo = np.searchsorted(keys, start, side="left")
+        hi = np.searchsorted(keys, start + b"\xff", side="left")
+        return [self.row_dict(self.arr[i]) for i in self._orders[field][lo:min(hi, lo + limit)]]
+
+    @staticmethod
+    def _grams(text):
+        text = f"  {text.upper()} "
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _trigram_index(self, exchange):
+        with self._trigram_lock:
+            if exchange not in self._trigrams:
+                rows = np.flatnonzero(self.arr["exchange"] == exchange.encode())
+                postings = {}
+                for row, name, symbol in zip(rows.tolist(), self.arr["name"][rows].tolist(), self.arr["symbol"][rows].tolist()):
+                    for gram in self._grams(name.decode()) | self._grams(symbol.decode()):
+                        postings.setdefault(gram, []).append(row)
+                self._trigrams[exchange] = {g: np.array(r, dtype=np.int32) for g, r in postings.items()}
+            return self._trigrams[exchange]
+
+    def fuzzy(self, exchange, query, limit=20, min_score=0.5):
+        """Rows whose name/symbol share the most trigrams with `query`, best first."""
+        index = self._trigram_index(exchange)
+        grams = self._grams(query)
+        hits = [index[g] for g in grams if g in index]
+        if not hits:
+            return []
+
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.arr))
+        candidates = np.flatnonzero(counts >= max(1, int(len(grams) * min_score)))
+        if not len(candidates):
+            return []
+        top = candidates[np.argsort(-counts[candidates], kind="stable")[:limit]]
+        return [self.row_dict(self.arr[i]) for i in top]
+
+    def search(self, exchange, query, limit=20):
+        """Exact symbol, then symbol prefix, then name prefix, then fuzzy name."""
+        exact = self.by_symbol(exchange, query)
+        results = [exact] if exact else []
+        seen = {r["symboltoken"] for r in results}
+        for finder in (
+            lambda: self.prefix(exchange, query, "symbol", limit),
+            lambda: self.prefix(exchange, query, "name", limit),
+            lambda: self.fuzzy(exchange, query, limit),
+        ):
+            if len(results) >= limit:
+                break
+            for row in finder():
+                if row["symboltoken"] not in seen:
+                    seen.add(row["symboltoken"])
+                    results.append(row)
+        return results[:limit]
+
+
+_master = None
+_master_mtime = None
+_checked_at = 0
+_master_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def _refresh_in_background():
+    if _refreshing.is_set():
+        return
+
+    def run():
+        try:
+            refresh()
+        except Exception as e:
+            log.error("Instrument master refresh failed: %s", e)
+        finally:
+            _refreshing.clear()
+
+    _refreshing.set()
+    threading.Thread(target=run, name="instrument-master", daemon=True).start()
+
+
+def get_master():
+    """
+    The loaded master, or None while the first download is still running.
+    A stale master keeps serving while the daily refresh runs in the background;
+    workers pick up the new files on their next check.
+    """
+    global _master, _master_mtime, _checked_at
+    if not INSTRUMENT_MASTER_ENABLED:
+        return None
+
+    now = time.monotonic()
+    if _master is not None and now - _checked_at < _RELOAD_CHECK:
+        return _master
+
+    with _master_lock:
+        if _master is not None and now - _checked_at < _RELOAD_CHECK:
+            return _master
+        _checked_at = now
+
+        paths = _paths(INSTRUMENT_MASTER_DIR)
+        try:
+            mtime = os.stat(paths["meta"]).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is not None and mtime != _master_mtime:
+            try:
+                _master, _master_mtime = InstrumentMaster(INSTRUMENT_MASTER_DIR), mtime
+                log.info("Instrument master loaded: %d rows", len(_master))
+            except (FileNotFoundError, ValueError) as e:
+                log.error("Could not load instrument master: %s", e)
+
+        if _refresh_due(_master.meta if _master is not None else None):
+            _refresh_in_background()
+
+    return _master
+
+
+def lookup_token(exchange, tradingsymbol):
+    """symboltoken from the local master, or None if it isn't loaded or doesn't know the symbol."""
+    master = get_master()
+    row = master.by_symbol(exchange, tradingsymbol) if master is not None and exchange and tradingsymbol else None
+    return row["symboltoken"] if row else None
+
+
+def lookup_scrip(exchange, search_str):
+    """
+    Row of exactly `search_str`, or of its equity series (SBIN -> SBIN-EQ), or
+    None. No prefix or fuzzy matching: a near miss must not resolve to another
+    company (InstrumentMaster.search is for browsing).
+    """
+    master = get_master()
+    if master is None or not exchange or not search_str:
+        return None
+    return master.by_symbol(exchange, search_str) or master.by_symbol(exchange, f"{search_str}-EQ")
+
+
+if __name__ == "__main__":
+    refresh(force=True)
@@ -0,0 +1,121 @@
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from config.db_config import db
+from config.settings import JOB_LOCK_TTL
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+# Locks held by this process: the Mongo owner is per process, so threads of one
+# process are kept apart here
+_held = set()
+_held_lock = threading.Lock()
+
+
+def owner_id():
+    # This process as a lock holder (pid read per call, so forked workers differ)
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_lock_indexes():
+    # Expired locks are taken over by acquire(); the TTL index only tidies up
+    try:
+        db.job_locks.create_index("expiresAt", expireAfterSeconds=3600, name="expiresAt_ttl")
+    except PyMongoError as e:
+        log.error("Could not create job_locks index: %s", e)
+
+
+def acquire(name, ttl=JOB_LOCK_TTL, owner=None):
+    """
+    Take the lock `name` for `ttl` seconds. One document per lock: it is free
+    when missing or expired, and the holder can re-acquire to extend it. When
+    somebody else holds it, the upsert collides on _id and we get False.
+    """
+    owner = owner or owner_id()
+    now = datetime.utcnow()
+    try:
+        db.job_locks.find_one_and_update(
+            {"_id": name, "$or": [{"expiresAt": {"$lte": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=ttl), "acquiredAt": now}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def renew(name, ttl=JOB_LOCK_TTL, owner=None):
+    owner = owner or owner_id()
+    result = db.job_locks.update_one(
+        {"_id": name, "owner": owner},
+        {"$set": {"expiresAt": datetime.utcnow() + timedelta(seconds=ttl)}},
+    )
+    return result.modified_count > 0
+
+
+def release(name, owner=None):
+    owner = owner or owner_id()
+    try:
+        db.job_locks.delete_one({"_id": name, "owner": owner})
+    except PyMongoError as e:
+        # Expires on its own
+        log.warning("Could not release job lock %s: %s", name, e)
+
+
+def _forget(name):
+    with _held_lock:
+        _held.discard(name)
+
+
+@contextmanager
+def job_lock(name, ttl=JOB_LOCK_TTL):
+    """
+    with job_lock("update_tickers") as acquired: ...
+
+    Yields False (and runs nothing on our side) when another process holds the
+    lock. While the body runs, a heartbeat extends the lock every ttl/3 seconds
+    so long jobs keep it and a crashed host loses it after ttl.
+    """
+    with _held_lock:
+        busy = name in _held
+        _held.add(name)
+    if busy:
+        yield False
+        return
+
+    try:
+        acquired = acquire(name, ttl)
+    except BaseException:
+        _forget(name)
+        raise
+    if not acquired:
+        _forget(name)
+        yield False
+        return
+
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(ttl / 3):
+            try:
+                if not renew(name, ttl):
+                    log.warning("Lost job lock %s", name)
+                    return
+            except PyMongoError as e:
+                log.warning("Job lock heartbeat failed for %s: %s", name, e)
+
+    beat = threading.Thread(target=heartbeat, name=f"lock-{name}", daemon=True)
+    beat.start()
+    try:
+        yield True
+    finally:
+        done.set()
+        release(name)
+        _forget(name)
@@ -0,0 +1,158 @@
+import random
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from config.settings import JOB_LOCK_TTL, SCHEDULE_MAX_BACKOFF
+from services.job_lock import job_lock
+from services.market_calendar import (
+    IST,
+    is_market_open,
+    is_trading_day,
+    next_open,
+    next_trading_day,
+    now_ist,
+)
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class Job:
+    """
+    A named, periodic job.
+
+      every=5, market_hours=True   every 5 seconds while the NSE session is open
+      at="15:45", trading_days=True   once a day at 15:45 IST on trading days
+
+    Runs are slotted on a fixed cadence (a slow run does not push the next one
+    back; missed slots are skipped, never queued). `jitter` seconds of random
+    delay spread hosts apart. A failure retries after an exponential backoff
+    capped at `max_backoff`. `distributed` jobs take a Mongo lock per run so
+    only one host runs them at a time; the rest (work on host-local files)
+    run everywhere.
+    """
+
+    def __init__(self, name, func, every=None, at=None, market_hours=False, trading_days=False,
+                 run_on_start=False, jitter=0.0, distributed=True, lock_ttl=JOB_LOCK_TTL,
+                 max_backoff=SCHEDULE_MAX_BACKOFF):
+        if (every is None) == (at is None):
+            raise ValueError(f"Job {name}: pass exactly one of every= or at=")
+        self.name = name
+        self.func = func
+        self.every = every
+        self.at = dtime.fromisoformat(at) if at else None
+        self.market_hours = market_hours
+        self.trading_days = trading_days or market_hours
+        self.run_on_start = run_on_start
+        self.jitter = jitter
+        self.distributed = distributed
+        self.lock_ttl = lock_ttl
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.last_run = None
+        self.last_error = None
+
+    def allowed(self, moment):
+        if self.market_hours:
+            return is_market_open(moment)
+        return not self.trading_days or is_trading_day(moment.date())
+
+    def next_run(self, after):
+        """First slot strictly after `after` (an aware datetime) that the calendar allows."""
+        if self.every:
+            slot = after + timedelta(seconds=self.every)
+            if self.market_hours and not is_market_open(slot):
+                # Closed: the open of the next session
+                slot = next_open(slot)
+            return slot
+
+        day = after.date()
+        slot = datetime.combine(day, self.at, IST)
+        if slot <= after:
+            slot = datetime.combine(day + timedelta(days=1), self.at, IST)
+        while self.trading_days and not is_trading_day(slot.date()):
+            slot = datetime.combine(next_trading_day(slot.date()), self.at, IST)
+        return slot
+
+    def first_run(self, now):
+        if self.run_on_start and self.allowed(now):
+            return now
+        return self.next_run(now)
+
+    def backoff(self):
+        base = self.every or 30
+        return min(base * 2 ** (self.failures - 1), self.max_backoff)
+
+
+class Scheduler:
+    """Runs every job on its own thread, so a slow job never delays the others."""
+
+    def __init__(self, jobs):
+        self.jobs = {job.name: job for job in jobs}
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run_once(self, job):
+        """One run under the job's locks; True when it ran and succeeded."""
+        if job.distributed:
+            with job_lock(job.name, job.lock_ttl) as acquired:
+                if not acquired:
+                    log.info("%s: running elsewhere, skipped", job.name)
+                    return True
+                return self._call(job)
+        return self._call(job)
+
+    def _call(self, job):
+        started = time.monotonic()
+        try:
+            job.func()
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            log.error("%s failed (%d in a row): %s", job.name, job.failures, e)
+            return False
+        job.failures = 0
+        job.last_error = None
+        job.last_run = now_ist()
+        log.info("%s done in %.1fs", job.name, time.monotonic() - started)
+        return True
+
+    def _loop(self, job):
+        slot = job.first_run(now_ist())
+        while not self._stop.is_set():
+            delay = (slot - now_ist()).total_seconds() + random.uniform(0, job.jitter)
+            if delay > 0 and self._stop.wait(delay):
+                return
+
+            if self.run_once(job):
+                now = now_ist()
+                slot = job.next_run(slot)
+                if slot <= now:
+                    # Overran one or more slots: skip them
+                    slot = job.next_run(now)
+            else:
+                slot = now_ist() + timedelta(seconds=job.backoff())
+                if not job.allowed(slot):
+                    slot = job.next_run(slot)
+                log.info("%s: retry at %s", job.name, slot.isoformat(timespec="seconds"))
+
+    def start(self):
+        for job in self.jobs.values():
+            log.info("%s: first run at %s", job.name, job.first_run(now_ist()).isoformat(timespec="seconds"))
+            thread = threading.Thread(target=self._loop, args=(job,), name=f"job-{job.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
@@ -0,0 +1,53 @@
+from datetime import date, datetime, time, timedelta, timezone
+
+from config.settings import NSE_EXTRA_HOLIDAYS
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# NSE equity session (normal market, IST)
+MARKET_OPEN = time(9, 15)
+MARKET_CLOSE = time(15, 30)
+
+# Trading holidays from the NSE circulars. Add next year's (or a surprise
+# closure) through NSE_EXTRA_HOLIDAYS until this list is updated.
+NSE_HOLIDAYS = {
+    # 2025
+    date(2025, 2, 26), date(2025, 3, 14), date(2025, 3, 31), date(2025, 4, 10),
+    date(2025, 4, 14), date(2025, 4, 18), date(2025, 5, 1), date(2025, 8, 15),
+    date(2025, 8, 27), date(2025, 10, 2), date(2025, 10, 21), date(2025, 10, 22),
+    date(2025, 11, 5), date(2025, 12, 25),
+    # 2026
+    date(2026, 1, 26), date(2026, 3, 3), date(2026, 3, 26), date(2026, 3, 31),
+    date(2026, 4, 3), date(2026, 4, 14), date(2026, 5, 1), date(2026, 5, 28),
+    date(2026, 6, 26), date(2026, 9, 14), date(2026, 10, 2), date(2026, 10, 20),
+    date(2026, 11, 10), date(2026, 11, 24), date(2026, 12, 25),
+} | NSE_EXTRA_HOLIDAYS
+
+
+def now_ist():
+    return datetime.now(IST)
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in NSE_HOLIDAYS
+
+
+def is_market_open(moment=None):
+    moment = (moment or now_ist()).astimezone(IST)
+    return is_trading_day(moment.date()) and MARKET_OPEN <= moment.time() < MARKET_CLOSE
+
+
+def next_trading_day(day):
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def next_open(moment=None):
+    """Start of the current session if it's before today's open, else of the next trading day."""
+    moment = (moment or now_ist()).astimezone(IST)
+    day = moment.date()
+    if not is_trading_day(day) or moment.time() >= MARKET_OPEN:
+        day = next_trading_day(day)
+    return datetime.combine(day, MARKET_OPEN, IST)
@@ -0,0 +1,138 @@
+from datetime import datetime, time as dtime
+
+import numpy as np
+
+from config.settings import OPTION_RISK_FREE_RATE
+from services.instrument_master import get_master, IST
+from services.response_cache import cached
+from services.smartapi_service import fetch_quotes_batch
+from utils import option_analytics
+from utils.indicators import to_python
+
+# Spot instrument of each index underlying (symbol as in the scrip master)
+INDEX_SPOT = {
+    "NIFTY": ("NSE", "NIFTY 50"),
+    "BANKNIFTY": ("NSE", "NIFTY BANK"),
+    "FINNIFTY": ("NSE", "NIFTY FIN SERVICE"),
+    "MIDCPNIFTY": ("NSE", "NIFTY MID SELECT"),
+    "SENSEX": ("BSE", "SENSEX"),
+    "BANKEX": ("BSE", "BANKEX"),
+}
+
+# Options expire at the close
+_EXPIRY_TIME = dtime(15, 30)
+
+# Output rounding per field
+_DIGITS = {"iv": 4, "delta": 4, "gamma": 6, "theta": 2, "vega": 2}
+
+
+def _parse_expiry(expiry):
+    # "30JAN2025" as in the scrip master, or "2025-01-30"
+    for fmt in ("%d%b%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(expiry.upper() if fmt == "%d%b%Y" else expiry, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid expiry '{expiry}', expected e.g. 30JAN2025 or 2025-01-30")
+
+
+def _master():
+    master = get_master()
+    if master is None:
+        raise ValueError("Instrument master is still loading, try again shortly")
+    return master
+
+
+def nearest_expiry(name, exchange="NFO"):
+    master = _master()
+    idx = master.select(exchange=exchange, name=name)
+    expiries = master.expiry_dates()[idx]
+    today = np.datetime64(datetime.now(IST).date(), "D")
+    upcoming = expiries[~np.isnat(expiries) & (expiries >= today)]
+    if not len(upcoming):
+        raise ValueError(f"No upcoming expiry for {exchange}:{name}")
+    return upcoming.min().astype(object)
+
+
+def _spot_instrument(master, name):
+    exchange, symbol = INDEX_SPOT.get(name, ("NSE", f"{name}-EQ"))
+    row = master.by_symbol(exchange, symbol)
+    if row is None:
+        raise ValueError(f"No spot instrument {exchange}:{symbol} for {name}, pass spot explicitly")
+    return exchange, row["tradingsymbol"], row["symboltoken"]
+
+
+def get_option_analytics(name, expiry=None, exchange="NFO", spot=None):
+    """IV, Greeks, max pain and PCR for one underlying and expiry (nearest upcoming by default)."""
+    name = name.upper()
+    expiry_date = _parse_expiry(expiry) if expiry else nearest_expiry(name, exchange)
+    return _option_analytics(name, expiry_date.isoformat(), exchange, spot)
+
+
+@cached("option_analytics")
+def _option_analytics(name, expiry, exchange, spot):
+    master = _master()
+
+    # 1) Contracts of this expiry from the local master
+    idx = master.select(exchange=exchange, name=name, expiry_from=expiry, expiry_to=expiry)
+    contracts = [
+        row for rows in master.records(idx) for row in rows
+        if row["instrumenttype"].startswith("OPT") and row["symbol"][-2:] in ("CE", "PE")
+    ]
+    if not contracts:
+        raise ValueError(f"No option contracts for {exchange}:{name} expiring {expiry}")
+
+    # 2) One batched FULL quote call for the chain (+ the spot unless given)
+    instruments = [(exchange, row["symbol"], row["token"]) for row in contracts]
+    spot_instrument = None if spot else _spot_instrument(master, name)
+    if spot_instrument:
+        instruments.append(spot_instrument)
+    quotes = fetch_quotes_batch(instruments, mode="FULL")
+
+    if spot_instrument:
+        spot_quote = quotes.get(spot_instrument[:2])
+        if not spot_quote:
+            raise ValueError(f"No quote for spot {spot_instrument[0]}:{spot_instrument[1]}")
+        spot = float(spot_quote.get("ltp"))
+
+    def column(field):
+        return np.array([float((quotes.get((exchange, row["symbol"])) or {}).get(field) or np.nan) for row in contracts])
+
+    # The scrip master keeps option strikes in paise
+    chain = {
+        "strike": np.array([row["strike"] for row in contracts]) / 100,
+        "is_call": np.array([row["symbol"].endswith("CE") for row in contracts]),
+        "ltp": column("ltp"),
+        "oi": column("opnInterest"),
+        "volume": column("tradeVolume"),
+    }
+
+    # 3) Everything in one vectorized pass
+    expires_at = datetime.combine(_parse_expiry(expiry), _EXPIRY_TIME, IST)
+    t = max((expires_at - datetime.now(IST)).total_seconds(), 60) / (365 * 86400)
+    result = option_analytics.analyze(chain, spot, t, OPTION_RISK_FREE_RATE)
+
+    strikes = {}
+    for i, row in enumerate(contracts):
+        strike = float(chain["strike"][i])
+        entry = strikes.setdefault(strike, {"strike": strike})
+        entry["CE" if chain["is_call"][i] else "PE"] = {
+            "tradingsymbol": row["symbol"],
+            "symboltoken": row["token"],
+            "ltp": to_python(chain["ltp"][i]),
+            "oi": to_python(chain["oi"][i]),
+            "volume": to_python(chain["volume"][i]),
+            **{field: to_python(values[i], _DIGITS[field]) for field, values in result["options"].items()},
+        }
+
+    return {
+        "name": name,
+        "exchange": exchange,
+        "expiry": expiry,
+        "spot": spot,
+        "timeToExpiryYears": round(t, 6),
+        "riskFreeRate": OPTION_RISK_FREE_RATE,
+        "maxPain": result["maxPain"],
+        "pcr": {k: to_python(v, 4) for k, v in result["pcr"].items()},
+        "strikes": [strikes[k] for k in sorted(strikes)],
+    }
@@ -0,0 +1,474 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from config.settings import (
+    STREAM_ENABLED,
+    STREAM_IDLE_AFTER,
+    STREAM_MODE,
+    STREAM_POLL_INTERVAL,
+    STREAM_PUBLISH_INTERVAL,
+    STREAM_REPLAY_PATH,
+    STREAM_RECORD_PATH,
+)
+from services.market_calendar import is_market_open
+from services.smartapi_service import keys, get_login_data, resolve_symboltoken, fetch_quotes_batch
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# SmartAPI websocket exchange types
+EXCHANGE_TYPES = {"NSE": 1, "NFO": 2, "BSE": 3, "BFO": 4, "MCX": 5, "NCDEX": 7, "CDS": 13}
+MODES = {"LTP": 1, "QUOTE": 2, "SNAP_QUOTE": 3}
+
+# Tokens per subscribe message
+SUBSCRIBE_CHUNK = 500
+
+
+class QuoteTable:
+    """
+    Latest quote per (exchange, tradingsymbol), copy-on-write.
+
+    Readers grab the current dict with snapshot() and never lock; it is never
+    mutated after publication. Writers build a new dict and swap the reference,
+    bumping `version` so pollers can tell something changed, and which keys
+    changed is kept for the last CHANGE_LOG versions (see changed_since).
+    """
+
+    CHANGE_LOG = 1024
+
+    def __init__(self):
+        self._snapshot = {}
+        self._lock = threading.Lock()
+        self._changes = deque(maxlen=self.CHANGE_LOG)  # (version, keys)
+        self.version = 0
+
+    def snapshot(self):
+        return self._snapshot
+
+    def get(self, key):
+        return self._snapshot.get(key)
+
+    def publish(self, updates):
+        if not updates:
+            return
+        with self._lock:
+            table = dict(self._snapshot)
+            table.update(updates)
+            self._snapshot = table
+            self.version += 1
+            self._changes.append((self.version, tuple(updates)))
+
+    def remove(self, keys_):
+        keys_ = set(keys_)
+        with self._lock:
+            table = {k: v for k, v in self._snapshot.items() if k not in keys_}
+            self._snapshot = table
+            self.version += 1
+            self._changes.append((self.version, tuple(keys_)))
+
+    def changed_since(self, version):
+        """
+        (current version, keys published or removed after `version`). Keys is
+        None when the log no longer reaches back that far: reread everything.
+        """
+        with self._lock:
+            current, changes = self.version, list(self._changes)
+        if version == current:
+            return current, set()
+        if not changes or changes[0][0] > version + 1:
+            return current, None
+        return current, {key for v, keys_ in changes if v > version for key in keys_}
+
+
+quote_table = QuoteTable()
+
+
+class ReplayFeed:
+    """
+    Local stand-in for SmartWebSocketV2 that replays recorded ticks.
+
+    The file is JSON lines, each a tick as SmartWebSocketV2 hands it to
+    on_data (token, exchange_type, last_traded_price, ...), optionally with a
+    "delay" in seconds before it. A line {"event": "disconnect"} drops the
+    connection so reconnect/resubscribe can be exercised.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.subscribed = set()
+        self._closed = threading.Event()
+
+    def subscribe(self, correlation_id, mode, token_list):
+        for group in token_list:
+            for token in group["tokens"]:
+                self.subscribed.add((group["exchangeType"], str(token)))
+
+    def unsubscribe(self, correlation_id, mode, token_list):
+        for group in token_list:
+            for token in group["tokens"]:
+                self.subscribed.discard((group["exchangeType"], str(token)))
+
+    def close_connection(self):
+        self._closed.set()
+
+    def connect(self):
+        self.on_open(None)
+        while not self._closed.is_set():
+            with open(self.path) as f:
+                for line in f:
+                    if self._closed.is_set():
+                        break
+                    if not line.strip():
+                        continue
+                    tick = json.loads(line)
+                    delay = tick.pop("delay", 0) / self.speed
+                    if delay and self._closed.wait(delay):
+                        break
+                    if tick.get("event") == "disconnect":
+                        self.on_close(None)
+                        return
+                    if (tick.get("exchange_type"), str(tick.get("token"))) in self.subscribed:
+                        self.on_data(None, tick)
+            if not self.loop:
+                break
+        self.on_close(None)
+
+
+class QuoteStream:
+    """
+    Background websocket subscription for a list of instruments, feeding quote_table.
+
+    Ticks are collected in a pending dict and published to the table every
+    STREAM_PUBLISH_INTERVAL seconds, so one copy-on-write covers many ticks.
+    The connection is re-established with backoff and every instrument is
+    resubscribed on each (re)connect.
+    """
+
+    def __init__(self, table, mode=STREAM_MODE, replay_path=STREAM_REPLAY_PATH, record_path=STREAM_RECORD_PATH):
+        self.table = table
+        self.mode = MODES[mode]
+        self.replay_path = replay_path
+        self.record_path = record_path
+
+        self._instruments = {}   # (exchange_type, token) -> (exchange, tradingsymbol)
+        self._unresolved = []
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._feed = None
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._record = None
+
+    # ---------- subscriptions ----------
+
+    def set_instruments(self, instruments):
+        """instruments: iterable of (exchange, tradingsymbol, symboltoken). Returns the feed keys added."""
+        added = {}
+        for exchange, tradingsymbol, symboltoken in instruments:
+            exchange_type = EXCHANGE_TYPES.get(exchange)
+            if exchange_type is None:
+                log.warning("No websocket feed for exchange %s, skipping %s", exchange, tradingsymbol)
+                continue
+            added[(exchange_type, str(symboltoken))] = (exchange, tradingsymbol)
+        # Swapped, not mutated: _on_data and _subscribe_all read it from the feed thread
+        self._instruments = {**self._instruments, **added}
+        return list(added)
+
+    def watch(self, stocks):
+        """Watchlist entries ({"exchange", "tradingsymbol"}) to resolve and subscribe on connect."""
+        self._unresolved.extend(stocks)
+
+    def update(self, added, removed):
+        """
+        Watchlist change: subscribe `added` and unsubscribe `removed` on the
+        live connection (stock dicts), leaving every other subscription alone.
+        """
+        with self._update_lock:
+            gone = {(s["exchange"], s["tradingsymbol"]) for s in removed}
+            dropped = [key for key, symbol in self._instruments.items() if symbol in gone]
+            self._instruments = {key: symbol for key, symbol in self._instruments.items() if symbol not in gone}
+            self._unresolved = [s for s in self._unresolved if (s["exchange"], s["tradingsymbol"]) not in gone]
+
+            self._unresolved.extend(added)
+            subscribed = self._resolve()
+
+            feed = self._feed if self._connected.is_set() else None
+            if feed is not None:
+                # Whatever fails here is picked up by the full resubscribe on the next reconnect
+                try:
+                    if dropped:
+                        feed.unsubscribe("fbnunsub", self.mode, self._token_list(dropped))
+                    self._subscribe(feed, subscribed)
+                except Exception as e:
+                    log.error("Quote stream subscription change failed: %s", e)
+        if gone:
+            with self._pending_lock:
+                self._pending = {key: quote for key, quote in self._pending.items() if key not in gone}
+            self.table.remove(gone)
+        log.info("Quote stream: %d instruments subscribed, %d unsubscribed", len(subscribed), len(dropped))
+
+    def _resolve(self):
+        instruments, failed = [], []
+        for stock in self._unresolved:
+            try:
+                token = resolve_symboltoken(stock["tradingsymbol"], stock["exchange"])
+                instruments.append((stock["exchange"], stock["tradingsymbol"], token))
+            except Exception as e:
+                log.error("Quote stream can't resolve %s:%s: %s", stock["exchange"], stock["tradingsymbol"], e)
+                failed.append(stock)
+        # Retried on the next reconnect
+        self._unresolved = failed
+        return self.set_instruments(instruments)
+
+    def _token_list(self, keys_):
+        grouped = {}
+        for exchange_type, token in keys_:
+            grouped.setdefault(exchange_type, []).append(token)
+        return [{"exchangeType": t, "tokens": tokens} for t, tokens in grouped.items()]
+
+    def _subscribe(self, feed, instruments):
+        for i in range(0, len(instruments), SUBSCRIBE_CHUNK):
+            chunk = instruments[i:i + SUBSCRIBE_CHUNK]
+            feed.subscribe(f"fbn{i // SUBSCRIBE_CHUNK:07d}", self.mode, self._token_list(chunk))
+
+    def _subscribe_all(self, feed):
+        self._subscribe(feed, list(self._instruments))
+
+    # ---------- feed callbacks ----------
+
+    def _on_open(self, wsapp):
+        log.info("Quote stream connected, subscribing %d instruments", len(self._instruments))
+        self._connected.set()
+        self._subscribe_all(self._feed)
+
+    def _on_data(self, wsapp, tick):
+        key = self._instruments.get((tick.get("exchange_type"), str(tick.get("token"))))
+        if key is None or "last_traded_price" not in tick:
+            return
+
+        quote = {"ltp": tick["last_traded_price"] / 100, "updatedAt": time.time()}
+        if "closed_price" in tick:
+            quote["close"] = tick["closed_price"] / 100
+        else:
+            previous = self.table.get(key)
+            if previous and "close" in previous:
+                quote["close"] = previous["close"]
+
+        with self._pending_lock:
+            self._pending[key] = quote
+
+        if self._record:
+            self._record.write(json.dumps(tick) + "\n")
+
+    def _on_error(self, *args):
+        log.error("Quote stream error: %s", args)
+        self._connected.clear()
+
+    def _on_close(self, wsapp):
+        log.warning("Quote stream disconnected")
+        self._connected.clear()
+
+    # ---------- loops ----------
+
+    def _make_feed(self):
+        if self.replay_path:
+            feed = ReplayFeed(self.replay_path)
+        else:
+            from SmartApi.smartWebSocketV2 import SmartWebSocketV2
+
+            # Fresh tokens on every (re)connect, the session may have been renewed
+            login = get_login_data()
+            feed = SmartWebSocketV2(
+                login["jwtToken"],
+                keys["API_KEY"],
+                login.get("clientcode") or keys["USERNAME"],
+                login["feedToken"],
+                max_retry_attempt=0,  # reconnects are handled in _run
+            )
+            feed.input_request_dict = {}  # class-level in the SDK, don't share it
+        feed.on_open = self._on_open
+        feed.on_data = self._on_data
+        feed.on_error = self._on_error
+        feed.on_close = self._on_close
+        return feed
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                # Token lookups are REST calls, keep them off the request path
+                if self._unresolved:
+                    with self._update_lock:
+                        self._resolve()
+                self._feed = self._make_feed()
+                self._feed.connect()  # blocks until the connection drops
+            except Exception as e:
+                log.error("Quote stream connection failed: %s", e)
+            self._connected.clear()
+
+            if self._stop.is_set():
+                return
+            # A connection that stayed up for a while resets the backoff
+            backoff = 1 if time.monotonic() - started > 60 else min(backoff * 2, 60)
+            self._stop.wait(backoff)
+
+    def _publish_loop(self):
+        while not self._stop.wait(STREAM_PUBLISH_INTERVAL):
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            self.table.publish(pending)
+
+    def start(self):
+        if self.record_path:
+            self._record = open(self.record_path, "a", buffering=1)
+        for target, name in ((self._run, "quote-stream"), (self._publish_loop, "quote-publish")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        if self._feed:
+            self._feed.close_connection()
+        if self._record:
+            self._record.close()
+
+    def is_live(self):
+        return self._connected.is_set()
+
+
+class QuotePoller:
+    """
+    REST stand-in for QuoteStream when streaming is off: refreshes quote_table
+    from the batched quote endpoint every STREAM_POLL_INTERVAL seconds, so
+    readers of the table don't care where the quotes come from.
+
+    Only polls while somebody reads the table (see touch) and the market is
+    open; outside market hours just the symbols without a price yet are fetched
+    once, prices don't move until the next session.
+    """
+
+    def __init__(self, table, interval=STREAM_POLL_INTERVAL):
+        self.table = table
+        self.interval = interval
+        self._stocks = []
+        self._live = threading.Event()
+        self._stop = threading.Event()
+
+    def watch(self, stocks):
+        self._stocks = self._stocks + list(stocks)
+
+    def update(self, added, removed):
+        """Watchlist change: poll `added` from the next pass on, stop polling `removed`."""
+        gone = {(s["exchange"], s["tradingsymbol"]) for s in removed}
+        self._stocks = [s for s in self._stocks if (s["exchange"], s["tradingsymbol"]) not in gone] + list(added)
+        if gone:
+            self.table.remove(gone)
+
+    def _due(self):
+        if time.monotonic() - _last_read > STREAM_IDLE_AFTER:
+            return []
+        if is_market_open():
+            return self._stocks
+        table = self.table.snapshot()
+        return [s for s in self._stocks if (s["exchange"], s["tradingsymbol"]) not in table]
+
+    def _poll(self, stocks):
+        instruments = []
+        for stock in stocks:
+            try:
+                token = resolve_symboltoken(stock["tradingsymbol"], stock["exchange"])
+                instruments.append((stock["exchange"], stock["tradingsymbol"], token))
+            except Exception as e:
+                log.error("Quote poller can't resolve %s:%s: %s", stock["exchange"], stock["tradingsymbol"], e)
+
+        now = time.time()
+        updates = {}
+        quotes = fetch_quotes_batch(instruments)
+        # Symbols removed from the watchlist while the batch was out aren't written back
+        tracked = {(s["exchange"], s["tradingsymbol"]) for s in self._stocks}
+        for key, quote in quotes.items():
+            if key not in tracked:
+                continue
+            updates[key] = {"ltp": float(quote.get("ltp", 0)), "close": float(quote.get("close", 0)), "updatedAt": now}
+        self.table.publish(updates)
+
+    def _run(self):
+        while not self._stop.is_set():
+            stocks = self._due()
+            if stocks:
+                try:
+                    self._poll(stocks)
+                    self._live.set()
+                except Exception as e:
+                    log.error("Quote poll failed: %s", e)
+                    self._live.clear()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        threading.Thread(target=self._run, name="quote-poll", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_live(self):
+        return self._live.is_set()
+
+
+_feeds = {}
+_feeds_pid = None
+_feeds_lock = threading.Lock()
+_last_read = time.monotonic()
+
+
+def touch():
+    """A reader wants the table kept current (the poller idles STREAM_IDLE_AFTER seconds after the last one)."""
+    global _last_read
+    _last_read = time.monotonic()
+
+
+def _ensure(kind, factory, stocks):
+    # One feed of each kind per process (gunicorn workers each need their own,
+    # threads don't survive the fork)
+    global _feeds, _feeds_pid
+    touch()
+    if _feeds_pid == os.getpid() and kind in _feeds:
+        return _feeds[kind]
+
+    with _feeds_lock:
+        if _feeds_pid != os.getpid():
+            _feeds, _feeds_pid = {}, os.getpid()
+        if kind not in _feeds:
+            feed = factory(quote_table)
+            feed.watch(stocks)
+            feed.start()
+            _feeds[kind] = feed
+        return _feeds[kind]
+
+
+def ensure_stream(stocks):
+    """
+    Start the websocket quote stream for a watchlist once per process.
+    Returns immediately; callers fall back to REST until is_live().
+    """
+    return _ensure("stream", QuoteStream, stocks)
+
+
+def ensure_feed(stocks):
+    """Keep quote_table filled for a watchlist: websocket when streaming is on, REST polling otherwise."""
+    if STREAM_ENABLED:
+        return ensure_stream(stocks)
+    return _ensure("poll", QuotePoller, stocks)
+
+
+def is_live():
+    feed = _feeds.get("stream") if _feeds_pid == os.getpid() else None
+    return feed is not None and feed.is_live()
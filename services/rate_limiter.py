@@ -0,0 +1,185 @@
+import asyncio
+import os
+import struct
+import threading
+import time
+
+from config.settings import RATE_LIMITS, RATE_LIMIT_DIR, RATE_LIMIT_BLOCKING
+
+try:
+    import fcntl  # file locks are how buckets are shared between gunicorn workers
+except ImportError:  # Windows: fall back to per-process buckets
+    fcntl = None
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+_STATE = struct.Struct("dd")  # (tokens, updated_at)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `burst`.
+    With a state_dir the bucket lives in a small locked file so every worker
+    process on the host draws from the same budget.
+    """
+
+    def __init__(self, name, rate, burst, state_dir=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._path = None
+        self._shared_path = None
+        self._fd = None
+        self._fd_pid = None
+
+        if state_dir and fcntl:
+            os.makedirs(state_dir, exist_ok=True)
+            self._path = self._shared_path = os.path.join(state_dir, f"{name}.bucket")
+
+    def rescale(self, rate, burst, private=False):
+        with self._lock:
+            self.rate = float(rate)
+            self.burst = float(burst)
+            self._tokens = min(self._tokens, self.burst)
+            self._path = None if private else self._shared_path
+
+    def _open(self):
+        # File descriptors don't survive a fork cleanly, reopen per process
+        if self._fd is None or self._fd_pid != os.getpid():
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    def _refill(self, tokens, updated, now):
+        elapsed = max(0.0, now - updated)
+        return min(self.burst, tokens + elapsed * self.rate)
+
+    def _take(self, tokens_needed=1):
+        """Take tokens if available. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            now = time.time()
+
+            if not self._path:
+                self._tokens = self._refill(self._tokens, self._updated, now)
+                self._updated = now
+                if self._tokens >= tokens_needed:
+                    self._tokens -= tokens_needed
+                    return 0
+                return (tokens_needed - self._tokens) / self.rate
+
+            fd = self._open()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(fd, _STATE.size, 0)
+                if len(raw) == _STATE.size:
+                    tokens, updated = _STATE.unpack(raw)
+                else:
+                    tokens, updated = self.burst, now
+
+                tokens = self._refill(tokens, updated, now)
+                wait = 0
+                if tokens >= tokens_needed:
+                    tokens -= tokens_needed
+                else:
+                    wait = (tokens_needed - tokens) / self.rate
+
+                os.pwrite(fd, _STATE.pack(tokens, now), 0)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+        Take one token. Non-blocking mode returns False straight away when the
+        bucket is empty; blocking mode sleeps until a token frees up or timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def acquire_async(self, blocking=True, timeout=None):
+        """acquire() for coroutines: waits with asyncio.sleep instead of blocking the loop."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+# Fraction of RATE_LIMITS this process may use (see set_rate_share)
+_share = 1.0
+
+
+def _budget(endpoint_class):
+    rate, burst = RATE_LIMITS.get(endpoint_class, RATE_LIMITS["default"])
+    return rate * _share, max(1.0, burst * _share)
+
+
+def set_rate_share(share):
+    """
+    Limit this process to `share` of every endpoint budget, e.g. 1/N for one of
+    N sharded refresh workers. The buckets then stop using the per-host files:
+    every worker holds its own slice, wherever it runs.
+    """
+    global _share
+    with _buckets_lock:
+        _share = float(share)
+        for name, bucket in _buckets.items():
+            bucket.rescale(*_budget(name), private=_share < 1)
+
+
+def get_bucket(endpoint_class):
+    bucket = _buckets.get(endpoint_class)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(endpoint_class)
+            if bucket is None:
+                rate, burst = _budget(endpoint_class)
+                bucket = TokenBucket(endpoint_class, rate, burst, RATE_LIMIT_DIR)
+                if _share < 1:
+                    bucket.rescale(rate, burst, private=True)
+                _buckets[endpoint_class] = bucket
+    return bucket
+
+
+def acquire(endpoint_class, blocking=None, timeout=None):
+    """Wait for (or fail fast on) a slot in the endpoint class's budget."""
+    if blocking is None:
+        blocking = RATE_LIMIT_BLOCKING
+    if not get_bucket(endpoint_class).acquire(blocking=blocking, timeout=timeout):
+        raise RateLimitExceeded(f"Rate limit reached for '{endpoint_class}' calls")
+
+
+async def acquire_async(endpoint_class, blocking=None, timeout=None):
+    """acquire() for the async service layer; draws from the same buckets."""
+    if blocking is None:
+        blocking = RATE_LIMIT_BLOCKING
+    if not await get_bucket(endpoint_class).acquire_async(blocking=blocking, timeout=timeout):
+        raise RateLimitExceeded(f"Rate limit reached for '{endpoint_class}' calls")
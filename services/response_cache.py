@@ -0,0 +1,318 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from config.settings import (
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTLS,
+    REDIS_URL,
+    BROKER_CALL_TIMEOUT,
+)
+from services.executor import submit
+from utils.logger import get_logger
+from utils.metrics import Counter
+
+log = get_logger(__name__)
+
+CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Cached fetch_* calls by result: hit, stale (served while refetching), miss, bypass (cache off)",
+    ("endpoint", "result"),
+)
+
+# How long one process may hold the fetch lease for a key before others take over
+LEASE_SECONDS = 30
+# How often a process that lost the lease checks whether the value has landed
+_LEASE_POLL = 0.05
+# How long the lease holder's "failed" marker tells waiters not to keep waiting
+FAILED_SECONDS = 1
+
+
+class SQLiteCache:
+    """
+    Cache in one SQLite file (WAL mode), shared by every worker on the machine.
+    Entries carry fresh/stale deadlines; the least recently read ones are
+    evicted past max_entries. Leases are rows with an expiry, taken with an
+    upsert that only succeeds when the previous lease has run out.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        db = self._db()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                fresh_until REAL NOT NULL,
+                stale_until REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+
+    def _db(self):
+        # sqlite3 connections can't cross threads or forks
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.db.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def get(self, key):
+        now = time.time()
+        db = self._db()
+        row = db.execute(
+            "SELECT value, fresh_until, stale_until FROM entries WHERE key = ? AND stale_until > ?",
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key, value, ttl, stale):
+        now = time.time()
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(value).encode(), now + ttl, now + ttl + stale, now),
+        )
+        # Expired entries first, then least recently read ones over the bound
+        db.execute("DELETE FROM entries WHERE stale_until <= ?", (now,))
+        excess = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+    def lease(self, key, owner, seconds=LEASE_SECONDS):
+        now = time.time()
+        cursor = self._db().execute(
+            """
+            INSERT INTO leases VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+            WHERE leases.expires <= ?
+            """,
+            (key, owner, now + seconds, now),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key, owner):
+        self._db().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+
+class RedisCache:
+    """
+    Same contract on Redis. Keys expire at the end of their stale window;
+    the size bound is Redis' own (set maxmemory-policy allkeys-lru).
+    """
+
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self._release = self.client.register_script(self._RELEASE)
+
+    def get(self, key):
+        raw = self.client.get(f"cache:{key}")
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["value"], entry["fresh_until"], entry["stale_until"]
+
+    def set(self, key, value, ttl, stale):
+        now = time.time()
+        entry = {"value": value, "fresh_until": now + ttl, "stale_until": now + ttl + stale}
+        self.client.set(f"cache:{key}", json.dumps(entry), px=int((ttl + stale) * 1000))
+
+    def lease(self, key, owner, seconds=LEASE_SECONDS):
+        return bool(self.client.set(f"lease:{key}", owner, nx=True, px=int(seconds * 1000)))
+
+    def release(self, key, owner):
+        self._release(keys=[f"lease:{key}"], args=[owner])
+
+
+def _make_cache():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisCache(REDIS_URL)
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        return SQLiteCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES)
+    return None
+
+
+_cache = None
+_cache_ready = False
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache, _cache_ready
+    if not _cache_ready:
+        with _cache_lock:
+            if not _cache_ready:
+                try:
+                    _cache = _make_cache()
+                except Exception as e:
+                    log.error("Response cache unavailable, calling the broker directly: %s", e)
+                _cache_ready = True
+    return _cache
+
+
+def _safe(op, *args):
+    # A broken cache must never break the request; it just stops caching
+    try:
+        return op(*args)
+    except Exception as e:
+        log.warning("Response cache %s failed: %s", op.__name__, e)
+        return None
+
+
+# ---------- fetch coordination ----------
+
+_owner = uuid.uuid4().hex
+# key -> [done event, result, error] for calls in flight in this process
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _single_flight(key, fetch):
+    """Concurrent callers for the same key in this process share one fetch."""
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = [threading.Event(), None, None]
+
+    if leader:
+        try:
+            call[1] = fetch()
+        except Exception as e:
+            call[2] = e
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            call[0].set()
+    else:
+        call[0].wait()
+
+    if call[2] is not None:
+        raise call[2]
+    return call[1]
+
+
+def _cacheable(value):
+    # Broker errors come back as {"status": False, ...}; never pin those
+    return value is not None and not (isinstance(value, dict) and value.get("status") is False)
+
+
+def _fetch_and_store(cache, key, fetch, ttl, stale):
+    """
+    Fetch once across processes: the lease holder calls the broker, the rest
+    wait for its result. A result that can't be cached is left as a short
+    "failed" marker instead, so the waiters don't sit out BROKER_CALL_TIMEOUT.
+    """
+    owner = f"{_owner}:{os.getpid()}:{threading.get_ident()}"
+    failed_key = f"failed:{key}"
+    leased = _safe(cache.lease, key, owner)
+    if leased is None:
+        return fetch()
+    if not leased:
+        deadline = time.monotonic() + BROKER_CALL_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(_LEASE_POLL)
+            hit = _safe(cache.get, key)
+            if hit and hit[1] > time.time():
+                return hit[0]
+            failed = _safe(cache.get, failed_key)
+            if failed:
+                # The broker's error payload is the answer; after an exception we try ourselves
+                if "value" in failed[0]:
+                    return failed[0]["value"]
+                break
+        # The lease holder failed, is slow or is gone; don't leave this request hanging
+        return fetch()
+
+    try:
+        value = fetch()
+    except Exception as e:
+        _safe(cache.set, failed_key, {"error": str(e)}, FAILED_SECONDS, 0)
+        raise
+    else:
+        if _cacheable(value):
+            _safe(cache.set, key, value, ttl, stale)
+        else:
+            _safe(cache.set, failed_key, {"value": value}, FAILED_SECONDS, 0)
+        return value
+    finally:
+        _safe(cache.release, key, owner)
+
+
+def _revalidate(cache, key, fetch, ttl, stale):
+    with _inflight_lock:
+        if key in _inflight:
+            return
+    future = submit(_single_flight, key, lambda: _fetch_and_store(cache, key, fetch, ttl, stale))
+
+    def report(f):
+        if f.exception():
+            log.warning("Revalidating %s failed: %s", key, f.exception())
+
+    future.add_done_callback(report)
+
+
+def cached(endpoint):
+    """
+    Cache a fetch_* function under RESPONSE_CACHE_TTLS[endpoint].
+
+    Fresh hits return straight from the cache. Within the stale window the old
+    value is returned and a refetch runs in the background. Misses are
+    coalesced: one broker call per key, across threads and processes.
+    """
+    ttl, stale = RESPONSE_CACHE_TTLS[endpoint]
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or ttl <= 0:
+                CACHE_REQUESTS.inc(endpoint=endpoint, result="bypass")
+                return fn(*args, **kwargs)
+
+            key = f"{endpoint}:{json.dumps([args, kwargs], sort_keys=True, default=str)}"
+            fetch = functools.partial(fn, *args, **kwargs)
+
+            hit = _safe(cache.get, key)
+            if hit:
+                value, fresh_until, _ = hit
+                if fresh_until <= time.time():
+                    CACHE_REQUESTS.inc(endpoint=endpoint, result="stale")
+                    _revalidate(cache, key, fetch, ttl, stale)
+                else:
+                    CACHE_REQUESTS.inc(endpoint=endpoint, result="hit")
+                return value
+
+            CACHE_REQUESTS.inc(endpoint=endpoint, result="miss")
+            return _single_flight(key, lambda: _fetch_and_store(cache, key, fetch, ttl, stale))
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
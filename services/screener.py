@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config.settings import SCREEN_QUOTE_INTERVAL, SCREEN_INDICATOR_INTERVAL
+from services.candle_store import on_change, peek_series
+from services.quote_stream import quote_table, ensure_feed
+from services.smartapi_service import resolve_symboltoken
+from utils import indicators
+from utils.indicators import COMBINED_INDICATORS
+from utils.logger import get_logger
+from utils.metrics import Histogram
+from utils.screen_query import compile_where, compile_sort, order
+
+log = get_logger(__name__)
+
+SCREEN_REFRESH_SECONDS = Histogram("screener_refresh_seconds", "Screener table refreshes by part (quotes, indicators)", ("part",))
+SCREEN_QUERY_SECONDS = Histogram("screener_query_seconds", "Filter + sort + limit over the screener table")
+
+# Screener column -> indicator spec, from daily candles
+SCREEN_INDICATORS = {**COMBINED_INDICATORS, "RSI_14": "RSI_14"}
+QUOTE_COLUMNS = ("ltp", "close", "changePercent")
+COLUMNS = QUOTE_COLUMNS + tuple(SCREEN_INDICATORS)
+
+# Daily history read per symbol: enough bars for the 250-bar windows
+HISTORY_DAYS = 400
+
+ScreenSnapshot = namedtuple("ScreenSnapshot", "stocks index columns quotes_version indicators_at")
+
+
+class ScreenTable:
+    """
+    Latest quote and indicator values of every tracked symbol, one float
+    column per field (NaN until known), row i being stocks[i].
+
+    Copy-on-write like QuoteTable: readers take snapshot() and never lock;
+    writers copy only the columns they change and swap the snapshot in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = ScreenSnapshot([], {}, {name: np.empty(0) for name in COLUMNS}, 0, None)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def set_stocks(self, stocks):
+        """Track `stocks`; rows of symbols tracked before keep their values."""
+        with self._lock:
+            old = self._snapshot
+            stocks = list({(s["exchange"], s["tradingsymbol"]): s for s in stocks}.values())
+            index = {(s["exchange"], s["tradingsymbol"]): i for i, s in enumerate(stocks)}
+
+            columns = {name: np.full(len(stocks), np.nan) for name in COLUMNS}
+            kept = [(i, old.index[key]) for key, i in index.items() if key in old.index]
+            if kept:
+                new_rows, old_rows = map(np.array, zip(*kept))
+                for name in COLUMNS:
+                    columns[name][new_rows] = old.columns[name][old_rows]
+            self._snapshot = old._replace(stocks=stocks, index=index, columns=columns)
+
+    def write(self, keys, values, **meta):
+        """values: {column: array aligned with keys}; keys no longer tracked are ignored."""
+        with self._lock:
+            snap = self._snapshot
+            rows = np.array([snap.index.get(key, -1) for key in keys], dtype=np.int64)
+            keep = rows >= 0
+            columns = dict(snap.columns)
+            for name, column_values in values.items():
+                column = columns[name].copy()
+                column[rows[keep]] = np.asarray(column_values, dtype=float)[keep]
+                columns[name] = column
+            self._snapshot = snap._replace(columns=columns, **meta)
+
+
+screen_table = ScreenTable()
+
+
+class Screener:
+    """
+    Keeps screen_table current without calling the broker on its own:
+
+    - quotes: every SCREEN_QUOTE_INTERVAL seconds the rows whose quote_table
+      entry changed since the last pass are copied in (quote_table is fed by
+      the websocket stream or the REST poller, see ensure_feed);
+    - indicators: recomputed for the whole table in one batch every
+      SCREEN_INDICATOR_INTERVAL seconds from the local candle store, and for
+      single symbols as soon as this process stores new daily bars for them.
+    """
+
+    def __init__(self, table, stocks):
+        self.table = table
+        self._tokens = {}     # (exchange, tradingsymbol) -> symboltoken
+        self._by_token = {}   # (exchange, symboltoken) -> (exchange, tradingsymbol)
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._quotes_version = -1
+        self._stop = threading.Event()
+        self.set_stocks(stocks)
+        on_change(self._on_candles)
+
+    def set_stocks(self, stocks):
+        self.table.set_stocks(stocks)
+        # Everything is reread on the next pass
+        self._quotes_version = -1
+        self._next_full = 0
+
+    def update(self, added, removed):
+        """Watchlist change: rows for `added` (filled on the next pass), `removed` rows dropped."""
+        gone = {(s["exchange"], s["tradingsymbol"]) for s in removed}
+        stocks = [s for s in self.table.snapshot().stocks if (s["exchange"], s["tradingsymbol"]) not in gone]
+        self.table.set_stocks(stocks + list(added))
+
+        for key in gone:
+            token = self._tokens.pop(key, None)
+            self._by_token.pop((key[0], str(token)), None)
+        with self._dirty_lock:
+            self._dirty -= gone
+            self._dirty.update((s["exchange"], s["tradingsymbol"]) for s in added)
+        # New rows have no quote yet: reread the quote columns, indicators only for the new rows
+        self._quotes_version = -1
+
+    def _resolve(self):
+        for stock in self.table.snapshot().stocks:
+            key = (stock["exchange"], stock["tradingsymbol"])
+            if key in self._tokens:
+                continue
+            try:
+                token = resolve_symboltoken(stock["tradingsymbol"], stock["exchange"])
+            except Exception as e:
+                log.error("Screener can't resolve %s:%s: %s", stock["exchange"], stock["tradingsymbol"], e)
+                continue
+            self._tokens[key] = token
+            self._by_token[(stock["exchange"], str(token))] = key
+
+    def _on_candles(self, exchange, symboltoken, interval):
+        key = self._by_token.get((exchange, str(symboltoken)))
+        if key is not None and interval == "ONE_DAY":
+            with self._dirty_lock:
+                self._dirty.add(key)
+
+    def apply_quotes(self):
+        version, changed = quote_table.changed_since(self._quotes_version)
+        if changed is not None and not changed:
+            return
+
+        with SCREEN_REFRESH_SECONDS.time(part="quotes"):
+            quotes = quote_table.snapshot()
+            tracked = self.table.snapshot().index
+            keys = list(tracked) if changed is None else [key for key in changed if key in tracked]
+
+            ltp = np.array([quotes.get(key, {}).get("ltp", np.nan) for key in keys], dtype=float)
+            close = np.array([quotes.get(key, {}).get("close", np.nan) for key in keys], dtype=float)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                change = np.where(close != 0, (ltp - close) / close * 100, np.nan)
+
+            self.table.write(keys, {"ltp": ltp, "close": close, "changePercent": change}, quotes_version=version)
+            self._quotes_version = version
+
+    def refresh_indicators(self, keys=None):
+        """Recompute the indicator columns for `keys` (default: every tracked symbol) in one batch."""
+        with SCREEN_REFRESH_SECONDS.time(part="indicators"):
+            keys = [key for key in (keys or self.table.snapshot().index) if key in self._tokens]
+            from_ts = int(time.time()) - HISTORY_DAYS * 86400
+
+            series = []
+            for exchange, tradingsymbol in keys:
+                try:
+                    series.append(peek_series(exchange, self._tokens[(exchange, tradingsymbol)], "ONE_DAY", from_ts))
+                except Exception as e:
+                    log.warning("Screener has no candles for %s:%s: %s", exchange, tradingsymbol, e)
+                    series.append(None)
+
+            # Symbols without history yet stay NaN
+            present = [i for i, s in enumerate(series) if s is not None and len(s)]
+            if not present:
+                return
+            keys = [keys[i] for i in present]
+            batch = {
+                field: indicators.stack([series[i] for i in present], field)
+                for field in ("open", "high", "low", "close", "volume")
+            }
+            values = indicators.compute(batch, SCREEN_INDICATORS.values())
+            self.table.write(
+                keys,
+                {column: values[spec] for column, spec in SCREEN_INDICATORS.items()},
+                indicators_at=datetime.now(timezone.utc),
+            )
+
+    def _run(self):
+        while True:
+            try:
+                self._resolve()
+                self.apply_quotes()
+
+                if time.monotonic() >= self._next_full:
+                    with self._dirty_lock:
+                        self._dirty.clear()
+                    self.refresh_indicators()
+                    self._next_full = time.monotonic() + SCREEN_INDICATOR_INTERVAL
+                elif self._dirty:
+                    with self._dirty_lock:
+                        dirty, self._dirty = self._dirty, set()
+                    self.refresh_indicators(dirty)
+            except Exception as e:
+                log.error("Screener refresh failed: %s", e)
+
+            if self._stop.wait(SCREEN_QUOTE_INTERVAL):
+                return
+
+    def start(self):
+        threading.Thread(target=self._run, name="screener", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_screener = None
+_screener_pid = None
+_screener_lock = threading.Lock()
+
+
+def ensure_screener(stocks):
+    """Start filling screen_table for `stocks` once per process (and the quote feed it reads)."""
+    global _screener, _screener_pid
+    ensure_feed(stocks)
+    if _screener_pid == os.getpid():
+        return _screener
+    with _screener_lock:
+        if _screener_pid != os.getpid():
+            _screener = Screener(screen_table, stocks)
+            _screener.start()
+            _screener_pid = os.getpid()
+    return _screener
+
+
+def _columns(names):
+    canonical = {name.lower(): name for name in COLUMNS}
+    unknown = [name for name in names if name.lower() not in canonical]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return [canonical[name.lower()] for name in names]
+
+
+def screen(where=None, sort=None, limit=None, fields=None, stocks=None):
+    """
+    Rows of screen_table matching `where`, ordered by `sort`, at most `limit`
+    of them, with `fields` (default: every column). `stocks` narrows the table
+    to those symbols (one watchlist). Raises ValueError on a bad expression or
+    field name.
+    """
+    with SCREEN_QUERY_SECONDS.time():
+        snap = screen_table.snapshot()
+        columns = snap.columns
+        fields = _columns(fields) if fields else list(COLUMNS)
+
+        rows = np.arange(len(snap.stocks))
+        if stocks is not None:
+            keys = {(s["exchange"], s["tradingsymbol"]) for s in stocks}
+            rows = np.array(sorted(snap.index[key] for key in keys if key in snap.index), dtype=np.int64)
+        total = len(rows)
+        if where:
+            rows = rows[compile_where(where, COLUMNS)(columns)[rows]]
+        if sort:
+            rows = order(columns, rows, compile_sort(sort, COLUMNS))
+        matched = len(rows)
+        if limit is not None:
+            rows = rows[:limit]
+
+        data = []
+        for i in rows:
+            stock = snap.stocks[i]
+            row = {"name": stock.get("name"), "exchange": stock["exchange"], "tradingsymbol": stock["tradingsymbol"]}
+            for field in fields:
+                row[field] = indicators.to_python(columns[field][i], 2)
+            data.append(row)
+
+    return {
+        "count": matched,
+        "total": total,
+        "data": data,
+        "quotesVersion": snap.quotes_version,
+        "indicatorsAt": snap.indicators_at,
+    }
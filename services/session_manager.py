@@ -0,0 +1,168 @@
+import itertools
+import os
+import threading
+import time
+
+from SmartApi.smartConnect import SmartConnect  # Connect to Angel One SmartAPI
+from utils.totp import get_totp_token           # Generate TOTP for login
+from services.rate_limiter import acquire        # Shared per-endpoint rate limits
+from utils.logger import get_logger
+from utils.metrics import Counter, Histogram
+
+log = get_logger(__name__)
+
+LOGINS = Counter("smartapi_logins_total", "SmartAPI logins by outcome", ("outcome",))
+LOGIN_SECONDS = Histogram("smartapi_login_seconds", "SmartAPI login latency (TOTP + generateSession)")
+
+_NO_SESSION = object()
+
+
+class SessionManager:
+    """
+    Holds the logged-in SmartConnect client(s) for this process.
+
+    - Only one thread logs in at a time; threads that hit an expired token while
+      a login is running wait for it instead of starting their own.
+    - A background thread renews the session `refresh_margin` seconds before
+      `ttl`, so request threads normally never pay for a login.
+    - With pool_size > 1 the session is cloned onto several clients, handed out
+      round-robin for parallel calls.
+    """
+
+    def __init__(self, keys, ttl=1200, refresh_margin=120, pool_size=1):
+        self.keys = keys
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.pool_size = max(1, int(pool_size))
+
+        self._clients = []
+        self._login_data = None
+        self._logged_in_at = None
+        self._next = itertools.count()
+        self._refresh_lock = threading.Lock()
+        self._refresher_lock = threading.Lock()
+        self._refresher = None
+        self._refresher_pid = None
+        self._stop = threading.Event()
+
+    # ---------- login ----------
+
+    def _login(self):
+        acquire("login")
+        obj = SmartConnect(api_key=self.keys["API_KEY"])
+        token = get_totp_token(self.keys["QR_CODE_KEY"])
+        login_response = obj.generateSession(self.keys["USERNAME"], self.keys["PASSWORD"], token)
+
+        if not isinstance(login_response, dict) or "data" not in login_response:
+            raise ValueError("Login failed or malformed response.")
+
+        clients = [obj]
+        # Extra pool members share the session instead of logging in again
+        for _ in range(self.pool_size - 1):
+            clone = SmartConnect(api_key=self.keys["API_KEY"])
+            clone.setAccessToken(obj.access_token)
+            clone.setRefreshToken(obj.refresh_token)
+            clone.setFeedToken(obj.feed_token)
+            clone.setUserId(obj.userId)
+            clients.append(clone)
+
+        return clients, login_response["data"]
+
+    def refresh(self, stale=None):
+        """
+        Log in again and swap in the new clients. If `stale` is given and the
+        session was already replaced since that client was handed out, the
+        newer session is returned without another login.
+        """
+        with self._refresh_lock:
+            if stale is not None and self._clients and stale not in self._clients:
+                return self._pick()
+
+            try:
+                with LOGIN_SECONDS.time():
+                    clients, login_data = self._login()
+            except Exception as e:
+                LOGINS.inc(outcome="error")
+                log.error("Error during login: %s", e)
+                raise e
+            LOGINS.inc(outcome="ok")
+
+            self._clients = clients
+            self._login_data = login_data
+            self._logged_in_at = time.monotonic()
+            log.info("Token refreshed")
+            return self._pick()
+
+    # ---------- access ----------
+
+    def _pick(self):
+        clients = self._clients
+        return clients[next(self._next) % len(clients)]
+
+    def _expired(self):
+        return self._logged_in_at is None or time.monotonic() - self._logged_in_at > self.ttl
+
+    def get(self, force_renew=False):
+        self._ensure_refresher()
+
+        if force_renew:
+            return self.refresh()
+
+        if not self._clients or self._expired():
+            # Only reached on the very first call or if background renewal failed
+            stale = self._clients[0] if self._clients else _NO_SESSION
+            return self.refresh(stale=stale)
+
+        return self._pick()
+
+    def ready(self):
+        """True when get() would return straight away, without logging in."""
+        return bool(self._clients) and not self._expired()
+
+    @property
+    def login_data(self):
+        """Data block of the last login response (jwtToken, feedToken, clientcode, ...)."""
+        if not self._clients:
+            self.get()
+        return self._login_data
+
+    # ---------- background renewal ----------
+
+    def _ensure_refresher(self):
+        # Threads don't survive a fork, so each gunicorn worker starts its own
+        if self._refresher_pid == os.getpid():
+            return
+        with self._refresher_lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="smartapi-session", daemon=True)
+            self._refresher_pid = os.getpid()
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        backoff = 5
+        while not self._stop.is_set():
+            if self._logged_in_at is None:
+                wait = 1
+            else:
+                renew_at = self._logged_in_at + self.ttl - self.refresh_margin
+                wait = max(0, renew_at - time.monotonic())
+
+            if self._stop.wait(wait):
+                return
+            if self._logged_in_at is None:
+                continue  # nothing to renew until the first on-demand login
+            if time.monotonic() < self._logged_in_at + self.ttl - self.refresh_margin:
+                continue  # someone renewed while we slept
+
+            try:
+                self.refresh()
+                backoff = 5
+            except Exception:
+                # Retry with backoff; requests fall back to an on-demand login at expiry
+                if self._stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, 60)
+
+    def stop(self):
+        self._stop.set()
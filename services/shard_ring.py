@@ -0,0 +1,124 @@
+import bisect
+import hashlib
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from config.db_config import db
+from config.settings import SHARD_VNODES, SHARD_WORKER_TTL
+from services.rate_limiter import set_rate_share
+from utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring: each member owns `vnodes` points, a key belongs to
+    the first point at or after its hash. Adding or removing one of N members
+    moves only about 1/N of the keys.
+    """
+
+    def __init__(self, members, vnodes=SHARD_VNODES):
+        points = sorted((_hash(f"{member}#{i}"), member) for member in members for i in range(vnodes))
+        self.members = sorted(set(members))
+        self._hashes = [h for h, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        i = bisect.bisect_left(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+
+def stock_key(stock):
+    return f"{stock['exchange']}:{stock['tradingsymbol']}"
+
+
+class ShardMember:
+    """
+    One worker of a sharded job. Membership lives in the Mongo shard_workers
+    collection, one document per worker with a heartbeat that acts as its
+    lease: a background thread renews it every ttl/3 seconds, and a worker
+    not heard from for `ttl` seconds is left out of the ring, so its keys
+    move to the survivors on their next cycle.
+    """
+
+    def __init__(self, group, worker_id=None, ttl=SHARD_WORKER_TTL):
+        self.group = group
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl
+        self._ring = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self):
+        now = datetime.utcnow()
+        db.shard_workers.update_one(
+            {"_id": f"{self.group}|{self.worker_id}"},
+            {
+                "$set": {"group": self.group, "worker": self.worker_id, "heartbeatAt": now},
+                "$setOnInsert": {"joinedAt": now},
+            },
+            upsert=True,
+        )
+
+    def join(self):
+        try:
+            db.shard_workers.create_index([("group", ASCENDING), ("heartbeatAt", ASCENDING)], name="group_heartbeat")
+            # Long-dead workers are cleaned up by Mongo
+            db.shard_workers.create_index("heartbeatAt", expireAfterSeconds=86400, name="heartbeat_ttl")
+        except PyMongoError as e:
+            log.error("Could not create shard_workers indexes: %s", e)
+        self.heartbeat()
+
+        def beat():
+            while not self._stop.wait(self.ttl / 3):
+                try:
+                    self.heartbeat()
+                except PyMongoError as e:
+                    log.warning("Shard heartbeat failed for %s: %s", self.worker_id, e)
+
+        self._thread = threading.Thread(target=beat, name=f"shard-{self.group}", daemon=True)
+        self._thread.start()
+        log.info("%s joined %s", self.worker_id, self.group)
+
+    def leave(self):
+        self._stop.set()
+        try:
+            db.shard_workers.delete_one({"_id": f"{self.group}|{self.worker_id}"})
+        except PyMongoError as e:
+            log.warning("Could not leave %s: %s", self.group, e)
+
+    def live_members(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        docs = db.shard_workers.find({"group": self.group, "heartbeatAt": {"$gte": cutoff}}, {"worker": 1})
+        # Always count ourselves, even if our last heartbeat write failed
+        return sorted({doc["worker"] for doc in docs} | {self.worker_id})
+
+    def shard(self, stocks):
+        """This worker's part of `stocks` under the current membership."""
+        if self._thread is None:
+            self.join()
+        try:
+            members = self.live_members()
+        except PyMongoError as e:
+            # Keep the last known ring rather than grabbing everything
+            log.warning("Shard membership unavailable, keeping the last ring: %s", e)
+            members = self._ring.members if self._ring else [self.worker_id]
+
+        if self._ring is None or self._ring.members != members:
+            self._ring = HashRing(members)
+            set_rate_share(1 / len(members))
+            log.info("%s: %d live workers, rate share 1/%d", self.group, len(members), len(members))
+
+        return [stock for stock in stocks if self._ring.owner(stock_key(stock)) == self.worker_id]
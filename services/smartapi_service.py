@@ -1,52 +1,126 @@
-from SmartApi.smartConnect import SmartConnect  # Connect to Angel One SmartAPI
 from config.settings import load_keys           # Load API credentials
-from utils.totp import get_totp_token           # Generate TOTP for login
-from functools import lru_cache
-from datetime import datetime
+from config.settings import SESSION_TTL, SESSION_REFRESH_MARGIN, SESSION_POOL_SIZE
+from services.rate_limiter import acquire        # Shared per-endpoint rate limits
+from services.session_manager import SessionManager
+from services.instrument_master import lookup_token, lookup_scrip
+from services.response_cache import cached
+from utils.logger import get_logger
+from utils.metrics import Counter, Histogram, lru_cache_collector, register_collector
+from functools import lru_cache, wraps
+from collections import defaultdict
+
+log = get_logger(__name__)
+
+BROKER_CALLS = Counter("smartapi_calls_total", "SmartConnect calls by method and outcome (ok, error, exception)", ("method", "outcome"))
+BROKER_CALL_SECONDS = Histogram("smartapi_call_seconds", "SmartConnect call latency", ("method",))
+RATE_LIMIT_WAIT_SECONDS = Histogram("smartapi_rate_limit_wait_seconds", "Time spent waiting for a rate limit slot", ("endpoint_class",))
+FETCH_SECONDS = Histogram("smartapi_fetch_seconds", "fetch_* latency including cache lookups", ("fetch",))
+TOKEN_RENEWALS = Counter("smartapi_token_renewals_total", "Sessions renewed after an Invalid Token response")
 
 keys = load_keys()
 
-_cached_obj = None
-_cached_time = None   # <-- new variable
+_session = SessionManager(
+    keys,
+    ttl=SESSION_TTL,
+    refresh_margin=SESSION_REFRESH_MARGIN,
+    pool_size=SESSION_POOL_SIZE,
+)
 
 def get_api_object(force_renew=False):
-    global _cached_obj, _cached_time
+    # Logged-in client from the shared session (renewed in the background before expiry)
+    return _session.get(force_renew=force_renew)
+
+
+def get_login_data():
+    # jwtToken/feedToken/clientcode of the current session, for the websocket feed
+    return _session.login_data
+
+
+def session_ready():
+    # True when get_api_object() won't block on a login
+    return _session.ready()
 
-    # Refresh if forced, never logged in, or older than 20 minutes
-    if force_renew or _cached_obj is None or (_cached_time and (datetime.now() - _cached_time).total_seconds() > 1200):
-        try:
-            obj = SmartConnect(api_key=keys["API_KEY"])
-            token = get_totp_token(keys["QR_CODE_KEY"])
-            login_response = obj.generateSession(keys["USERNAME"], keys["PASSWORD"], token)
 
-            if not isinstance(login_response, dict) or "data" not in login_response:
-                raise ValueError("Login failed or malformed response.")
+def renew_session(stale):
+    return _session.refresh(stale=stale)
 
-            _cached_obj = obj
-            _cached_time = datetime.now()  # ✅ store login time
-            print(f"🔑 Token refreshed at {_cached_time}")
 
-        except Exception as e:
-            print(f"❌ Error during login: {e}")
-            _cached_obj = None
-            _cached_time = None
+def _is_invalid_token(error_or_response):
+    if isinstance(error_or_response, dict):
+        return error_or_response.get("status") is False and "Invalid Token" in str(error_or_response.get("message"))
+    return "Invalid Token" in str(error_or_response)
+
+
+def _call_api(endpoint_class, method, *args, **kwargs):
+    """
+    Call a SmartConnect method under the endpoint class's rate limit.
+    An "Invalid Token" failure (raised or returned) renews the session once and retries.
+    """
+    _acquire(endpoint_class)
+    obj = get_api_object()
+    try:
+        response = _timed_call(obj, method, args, kwargs)
+        if not _is_invalid_token(response):
+            return response
+    except Exception as e:
+        if not _is_invalid_token(e):
             raise e
 
-    return _cached_obj
+    log.warning("Token expired, re-authenticating", extra={"method": method})
+    TOKEN_RENEWALS.inc()
+    obj = renew_session(obj)
+    _acquire(endpoint_class)
+    return _timed_call(obj, method, args, kwargs)
+
+
+def _acquire(endpoint_class):
+    with RATE_LIMIT_WAIT_SECONDS.time(endpoint_class=endpoint_class):
+        acquire(endpoint_class)
+
+
+def _timed_call(obj, method, args, kwargs):
+    with BROKER_CALL_SECONDS.time(method=method):
+        try:
+            response = getattr(obj, method)(*args, **kwargs)
+        except Exception:
+            BROKER_CALLS.inc(method=method, outcome="exception")
+            raise
+    failed = isinstance(response, dict) and response.get("status") is False
+    BROKER_CALLS.inc(method=method, outcome="error" if failed else "ok")
+    return response
+
+
+def _timed(fn):
+    # Outermost decorator of every fetch_*: includes cache hits and rate limit waits
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with FETCH_SECONDS.time(fetch=fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
 
 
 
 
 @lru_cache(maxsize=1000)  # ✅ Cache up to 1000 unique searches to reduce API load
 def search_scrip_and_extract(search_str, exchange):
-    print(f"🔍 Searching for scrip: {search_str} on {exchange}")
-    obj = get_api_object()
-
+    if not exchange or not search_str:
+        raise ValueError("exchange and search_str are required")
+
+    # Local instrument master first (exact symbol only): no broker call at all
+    scrip_data = lookup_scrip(exchange, search_str)
+    if scrip_data:
+        return {
+            "exchange": scrip_data["exchange"],
+            "tradingsymbol": scrip_data["tradingsymbol"],
+            "symboltoken": scrip_data["symboltoken"]
+        }
+
+    log.info("Searching for scrip %s on %s", search_str, exchange)
     try:
-        result = obj.searchScrip(exchange, search_str)
-        print("📦 Raw search result:", result)
+        result = _call_api("search", "searchScrip", exchange, search_str)
+        log.debug("Raw search result: %s", result)
     except Exception as e:
-        print("❌ Exception from SmartAPI searchScrip:", str(e))
+        log.error("searchScrip failed for %s on %s: %s", search_str, exchange, e)
         raise e
 
     if not result or 'data' not in result or not result['data']:
@@ -72,17 +146,52 @@ def search_scrip_and_extract(search_str, exchange):
 
 
 # Fetch LTP
+@_timed
 def fetch_ltp(exchange, tradingsymbol, symboltoken):
-    try:
-        obj = get_api_object()
-        return obj.ltpData(exchange=exchange, tradingsymbol=tradingsymbol, symboltoken=symboltoken)
-    except Exception as e:
-        if "Invalid Token" in str(e):
-            print("🔁 Token expired. Re-authenticating...")
-            obj = get_api_object(force_renew=True)
-            return obj.ltpData(exchange=exchange, tradingsymbol=tradingsymbol, symboltoken=symboltoken)
-        raise e
+    return _call_api("ltp", "ltpData", exchange=exchange, tradingsymbol=tradingsymbol, symboltoken=symboltoken)
+
+
+
+# Max tokens the broker accepts in one getMarketData call
+MARKET_DATA_BATCH_SIZE = 50
+
 
+# Fetch quotes for many instruments with as few getMarketData calls as possible
+@_timed
+def fetch_quotes_batch(instruments, mode="OHLC"):
+    """
+    instruments: iterable of (exchange, tradingsymbol, symboltoken).
+    Tokens are grouped by exchange and sent in chunks of MARKET_DATA_BATCH_SIZE.
+    Returns {(exchange, tradingsymbol): quote} for every instrument the broker fetched.
+    """
+    # 1) Group tokens by exchange and remember which tradingsymbol each token belongs to
+    tokens_by_exchange = defaultdict(list)
+    symbol_by_token = {}
+    for exchange, tradingsymbol, symboltoken in instruments:
+        symboltoken = str(symboltoken)
+        if (exchange, symboltoken) in symbol_by_token:
+            continue
+        tokens_by_exchange[exchange].append(symboltoken)
+        symbol_by_token[(exchange, symboltoken)] = tradingsymbol
+
+    quotes = {}
+    for exchange, tokens in tokens_by_exchange.items():
+        # 2) One round-trip per chunk instead of one per symbol
+        for i in range(0, len(tokens), MARKET_DATA_BATCH_SIZE):
+            chunk = tokens[i:i + MARKET_DATA_BATCH_SIZE]
+            response = _call_api("quote", "getMarketData", mode, {exchange: chunk})
+
+            data = (response or {}).get("data") or {}
+            for quote in data.get("fetched") or []:
+                token = str(quote.get("symbolToken"))
+                tradingsymbol = symbol_by_token.get((exchange, token))
+                if tradingsymbol:
+                    quotes[(exchange, tradingsymbol)] = quote
+
+            for miss in data.get("unfetched") or []:
+                log.warning("Quote not fetched for %s: %s", exchange, miss)
+
+    return quotes
 
 
 # services/smartapi_service.py
@@ -94,7 +203,11 @@ def resolve_symboltoken(tradingsymbol: str, exchange: str = "NSE") -> str:
     Look up the latest symboltoken for a given tradingsymbol+exchange.
     Cached for the life of the process to avoid rate limits.
     """
-    print(f"🔍 Resolving token for {exchange}:{tradingsymbol} (cache MISS)")
+    token = lookup_token(exchange, tradingsymbol)
+    if token:
+        return token
+
+    log.info("Resolving token for %s:%s (cache miss)", exchange, tradingsymbol)
 
     scrip = search_scrip_and_extract(tradingsymbol, exchange)
     token = scrip.get("symboltoken")
@@ -102,75 +215,72 @@ def resolve_symboltoken(tradingsymbol: str, exchange: str = "NSE") -> str:
     if not token:
         raise ValueError(f"Could not resolve symboltoken for {exchange}:{tradingsymbol}")
 
-    print(f"✅ Token resolved for {exchange}:{tradingsymbol} → {token}")
+    log.info("Token resolved for %s:%s -> %s", exchange, tradingsymbol, token)
     return str(token)
 
 
 
 # Fetch Candlestick Data
+@_timed
 def fetch_candle_data(exchange, symboltoken, interval, from_date, to_date):
-    try:
-        obj = get_api_object()
-        return obj.getCandleData(
-            exchange=exchange,
-            symboltoken=symboltoken,
-            interval=interval,
-            fromdate=from_date,
-            todate=to_date
-        )
-    except Exception as e:
-        if "Invalid Token" in str(e):
-            print("🔁 Token expired. Re-authenticating...")
-            obj = get_api_object(force_renew=True)
-            return obj.getCandleData(
-                exchange=exchange,
-                symboltoken=symboltoken,
-                interval=interval,
-                fromdate=from_date,
-                todate=to_date
-            )
-        raise e
+    params = {
+        "exchange": exchange,
+        "symboltoken": symboltoken,
+        "interval": interval,
+        "fromdate": from_date,
+        "todate": to_date
+    }
+    return _call_api("candle", "getCandleData", params)
 
 
-# Fetch Security Info
+# Fetch Security Info (not a SmartConnect 1.5.5 method, so never cached)
+@_timed
 def fetch_security_info(exchange, tradingsymbol, symboltoken):
-    obj = get_api_object()
-    return obj.getSecurityInfo(
+    return _call_api(
+        "default",
+        "getSecurityInfo",
         exchange=exchange,
         tradingsymbol=tradingsymbol,
         symboltoken=symboltoken
     )
 
-# Fetch Market Data
+# Fetch Market Data (full quote of one instrument; getMarketData takes a mode and {exchange: [tokens]})
+@_timed
+@cached("market_data")
 def fetch_market_data(exchange, tradingsymbol, symboltoken):
-    obj = get_api_object()
-    params = {
-        "tradingsymbol": tradingsymbol,
-        "symboltoken": symboltoken
-    }
-    return obj.getMarketData(params)
+    return _call_api("quote", "getMarketData", "FULL", {exchange: [str(symboltoken)]})
 
 
 
-# Fetch Option Chain
+# Fetch Option Chain (not a SmartConnect 1.5.5 method, so never cached)
+@_timed
 def fetch_option_chain(exchange, tradingsymbol, symboltoken):
-    obj = get_api_object()
-    return obj.getOptionChain(
+    return _call_api(
+        "default",
+        "getOptionChain",
         exchange=exchange,
         tradingsymbol=tradingsymbol,
         symboltoken=symboltoken
     )
 
-# Fetch Expiry List
+# Fetch Expiry List (not a SmartConnect 1.5.5 method, so never cached)
+@_timed
 def fetch_expiry_list(exchange, tradingsymbol, symboltoken):
-    obj = get_api_object()
-    return obj.getExpiryList(
+    return _call_api(
+        "default",
+        "getExpiryList",
         exchange=exchange,
         tradingsymbol=tradingsymbol,
         symboltoken=symboltoken
     )
 
-# Fetch Master Contract (no symboltoken needed)
+# Fetch Master Contract (no symboltoken needed; not a SmartConnect 1.5.5 method, so never cached)
+@_timed
 def fetch_master_contract(exchange):
-    obj = get_api_object()
-    return obj.getMasterContract(exchange=exchange)
+    return _call_api("default", "getMasterContract", exchange=exchange)
+
+
+register_collector(lru_cache_collector({
+    "resolve_symboltoken": resolve_symboltoken,
+    "search_scrip_and_extract": search_scrip_and_extract,
+}))
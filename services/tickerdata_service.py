@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+from config.db_config import db
+from config.settings import TICKER_HISTORY_TTL, TICKER_ROLLUP_TTL, TICKER_ROLLUPS
+from utils.logger import get_logger
+from utils.metrics import Counter, Histogram
+
+log = get_logger(__name__)
+
+MONGO_WRITE_SECONDS = Histogram("mongo_write_seconds", "Mongo write latency", ("collection", "op"))
+MONGO_WRITE_DOCS = Counter("mongo_write_docs_total", "Documents sent to Mongo by outcome (ok, failed, unchanged)", ("collection", "outcome"))
+
+# Duplicate key: an upsert whose document exists but didn't match the filter
+_DUPLICATE_KEY = 11000
+
+
+def ensure_indexes():
+    # One document per instrument; also what the bulk upserts match on
+    try:
+        db.tickerdata.create_index(
+            [("exchange", ASCENDING), ("tradingsymbol", ASCENDING)],
+            unique=True,
+            name="exchange_tradingsymbol",
+        )
+    except PyMongoError as e:
+        log.error("Could not create tickerdata index: %s", e)
+
+    ensure_history_collections()
+
+
+def ensure_history_collections():
+    # Raw snapshots: time-series collection, one series per instrument
+    try:
+        db.create_collection(
+            "tickerhistory",
+            timeseries={"timeField": "updatedAt", "metaField": "meta", "granularity": "seconds"},
+            expireAfterSeconds=TICKER_HISTORY_TTL,
+        )
+    except CollectionInvalid:
+        # Already there; keep its expiry in sync with the setting
+        try:
+            db.command("collMod", "tickerhistory", expireAfterSeconds=TICKER_HISTORY_TTL)
+        except PyMongoError as e:
+            log.error("Could not update tickerhistory expiry: %s", e)
+    except PyMongoError as e:
+        log.error("Could not create tickerhistory collection: %s", e)
+
+    # Rollups: one document per instrument, resolution and bucket
+    try:
+        db.tickerrollups.create_index(
+            [("meta.exchange", ASCENDING), ("meta.tradingsymbol", ASCENDING), ("resolution", ASCENDING), ("bucket", ASCENDING)],
+            unique=True,
+            name="meta_resolution_bucket",
+        )
+        db.tickerrollups.create_index("bucket", expireAfterSeconds=TICKER_ROLLUP_TTL, name="bucket_ttl")
+    except PyMongoError as e:
+        log.error("Could not create tickerrollups indexes: %s", e)
+
+
+def write_ticker_snapshot(snapshot):
+    """
+    Upsert a full watchlist snapshot with one unordered bulk_write.
+    Symbols whose stored ltp and close are already the same are skipped. Mongo
+    decides that, not this process: other writers (the scheduler, the route,
+    other shard workers) may have stored something newer since our last write.
+    Returns per-symbol counts and errors.
+    """
+    report = {"total": len(snapshot), "written": 0, "skipped": 0, "failed": 0, "errors": {}}
+    if not snapshot:
+        return report
+
+    # The filter only matches a changed document. An unchanged one fails the match,
+    # and the insert the upsert falls back to hits the unique index: that's a skip
+    ops = [
+        UpdateOne(
+            {
+                "exchange": doc["exchange"],
+                "tradingsymbol": doc["tradingsymbol"],
+                "$or": [{"ltp": {"$ne": doc["ltp"]}}, {"close": {"$ne": doc["close"]}}],
+            },
+            {"$set": doc},
+            upsert=True,
+        )
+        for doc in snapshot
+    ]
+
+    try:
+        with MONGO_WRITE_SECONDS.time(collection="tickerdata", op="bulk_write"):
+            db.tickerdata.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every other op was still applied
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") == _DUPLICATE_KEY:
+                report["skipped"] += 1
+                continue
+            report["failed"] += 1
+            report["errors"][snapshot[error["index"]]["tradingsymbol"]] = error.get("errmsg", "write failed")
+    except PyMongoError as e:
+        for doc in snapshot:
+            report["errors"][doc["tradingsymbol"]] = str(e)
+        report["failed"] = len(snapshot)
+        MONGO_WRITE_DOCS.inc(len(snapshot), collection="tickerdata", outcome="failed")
+        return report
+
+    report["written"] = len(snapshot) - report["skipped"] - report["failed"]
+    MONGO_WRITE_DOCS.inc(report["written"], collection="tickerdata", outcome="ok")
+    MONGO_WRITE_DOCS.inc(report["failed"], collection="tickerdata", outcome="failed")
+    MONGO_WRITE_DOCS.inc(report["skipped"], collection="tickerdata", outcome="unchanged")
+    return report
+
+
+def remove_tickers(stocks):
+    """
+    Drop the tickerdata documents of symbols that left every watchlist (their
+    history expires on its own). Returns the number of documents deleted.
+    """
+    keys_ = {(stock["exchange"], stock["tradingsymbol"]) for stock in stocks}
+    if not keys_:
+        return 0
+    result = db.tickerdata.delete_many(
+        {"$or": [{"exchange": exchange, "tradingsymbol": tradingsymbol} for exchange, tradingsymbol in keys_]}
+    )
+    return result.deleted_count
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _bucket_start(ts, seconds):
+    # updatedAt is naive UTC; floor it to the bucket boundary
+    elapsed = (ts - _EPOCH).total_seconds()
+    return _EPOCH + timedelta(seconds=elapsed // seconds * seconds)
+
+
+def append_history(snapshot):
+    """
+    Append a snapshot to the tickerhistory time series and fold it into the
+    1m/5m rollups. Returns counts of history rows and rollup updates written.
+    """
+    report = {"history": 0, "rollups": 0, "errors": []}
+    if not snapshot:
+        return report
+
+    rows, rollups = [], []
+    for doc in snapshot:
+        meta = {"exchange": doc["exchange"], "tradingsymbol": doc["tradingsymbol"]}
+        updated_at = doc["updatedAt"]
+        rows.append({
+            "meta": meta,
+            "updatedAt": updated_at,
+            "ltp": doc["ltp"],
+            "close": doc["close"],
+            "changePercent": doc["changePercent"],
+        })
+
+        # OHLC of the ltp within each bucket, built up one snapshot at a time
+        for resolution, seconds in TICKER_ROLLUPS.items():
+            rollups.append(UpdateOne(
+                {
+                    "meta.exchange": doc["exchange"],
+                    "meta.tradingsymbol": doc["tradingsymbol"],
+                    "resolution": resolution,
+                    "bucket": _bucket_start(updated_at, seconds),
+                },
+                {
+                    "$setOnInsert": {"open": doc["ltp"]},
+                    "$max": {"high": doc["ltp"]},
+                    "$min": {"low": doc["ltp"]},
+                    "$set": {"close": doc["ltp"], "updatedAt": updated_at},
+                    "$inc": {"count": 1},
+                },
+                upsert=True,
+            ))
+
+    try:
+        with MONGO_WRITE_SECONDS.time(collection="tickerhistory", op="insert_many"):
+            db.tickerhistory.insert_many(rows, ordered=False)
+        report["history"] = len(rows)
+        MONGO_WRITE_DOCS.inc(len(rows), collection="tickerhistory", outcome="ok")
+    except PyMongoError as e:
+        MONGO_WRITE_DOCS.inc(len(rows), collection="tickerhistory", outcome="failed")
+        report["errors"].append(f"history: {e}")
+
+    try:
+        with MONGO_WRITE_SECONDS.time(collection="tickerrollups", op="bulk_write"):
+            db.tickerrollups.bulk_write(rollups, ordered=False)
+        report["rollups"] = len(rollups)
+        MONGO_WRITE_DOCS.inc(len(rollups), collection="tickerrollups", outcome="ok")
+    except PyMongoError as e:
+        MONGO_WRITE_DOCS.inc(len(rollups), collection="tickerrollups", outcome="failed")
+        report["errors"].append(f"rollups: {e}")
+
+    return report
+
+
+def get_history(exchange, tradingsymbol, minutes=60, resolution="raw"):
+    """Recent history for one instrument, oldest first, straight from Mongo."""
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    meta = {"meta.exchange": exchange, "meta.tradingsymbol": tradingsymbol}
+
+    if resolution == "raw":
+        cursor = db.tickerhistory.find(
+            {**meta, "updatedAt": {"$gte": since}},
+            {"_id": 0, "meta": 0},
+        ).sort("updatedAt", ASCENDING)
+    elif resolution in TICKER_ROLLUPS:
+        cursor = db.tickerrollups.find(
+            {**meta, "resolution": resolution, "bucket": {"$gte": since}},
+            {"_id": 0, "meta": 0, "resolution": 0},
+        ).sort("bucket", ASCENDING)
+    else:
+        raise ValueError(f"Unknown resolution '{resolution}', expected raw or one of {list(TICKER_ROLLUPS)}")
+
+    return list(cursor)
@@ -0,0 +1,369 @@
+import os
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config.db_config import db
+from config.settings import WATCHLIST_DEFAULT, WATCHLIST_SYNC, WATCHLIST_POLL_INTERVAL
+from services.instrument_master import get_master, lookup_scrip
+from services.smartapi_service import resolve_symboltoken, search_scrip_and_extract
+from utils.logger import get_logger
+from utils.metrics import Counter, Gauge
+from utils.stock_list import WATCHSTOCKLIST
+
+log = get_logger(__name__)
+
+WATCHLIST_CHANGES = Counter("watchlist_changes_total", "Symbols added to / removed from the tracked universe", ("change",))
+WATCHLIST_SYMBOLS = Gauge("watchlist_symbols", "Symbols in the tracked universe (every list combined)")
+
+# One document per (list, symbol): the _id carries both, so a change stream
+# delete (which only has the _id) still says what was removed
+ENTRY_FIELDS = ("list", "name", "exchange", "tradingsymbol", "symboltoken")
+
+
+def entry_id(list_name, exchange, tradingsymbol):
+    return f"{list_name}|{exchange}:{tradingsymbol}"
+
+
+def _parse_id(_id):
+    list_name, _, symbol = _id.rpartition("|")
+    exchange, _, tradingsymbol = symbol.partition(":")
+    return list_name, (exchange, tradingsymbol)
+
+
+def ensure_watchlist_indexes():
+    try:
+        db.watchlists.create_index(
+            [("list", ASCENDING), ("exchange", ASCENDING), ("tradingsymbol", ASCENDING)],
+            unique=True,
+            name="list_exchange_tradingsymbol",
+        )
+    except PyMongoError as e:
+        log.error("Could not create watchlists index: %s", e)
+
+    try:
+        _seed_default()
+    except PyMongoError as e:
+        log.error("Could not seed the default watchlist: %s", e)
+
+
+def _seed_default():
+    # First start against an empty collection: the hard-coded list becomes the default watchlist
+    if not db.watchlists.count_documents({}, limit=1):
+        add_symbols(WATCHLIST_DEFAULT, WATCHSTOCKLIST, resolve=False)
+        log.info("Seeded watchlist %s with %d symbols", WATCHLIST_DEFAULT, len(WATCHSTOCKLIST))
+
+
+# ---------- CRUD ----------
+
+def list_watchlists():
+    counts = {}
+    for doc in db.watchlists.find({}, {"list": 1}):
+        counts[doc["list"]] = counts.get(doc["list"], 0) + 1
+    return [{"name": name, "count": count} for name, count in sorted(counts.items())]
+
+
+def get_watchlist(list_name):
+    docs = db.watchlists.find({"list": list_name}, {field: 1 for field in ENTRY_FIELDS})
+    return [{field: doc.get(field) for field in ENTRY_FIELDS if field != "list"} for doc in docs]
+
+
+def _normalize(item, exchange):
+    """
+    A watchlist entry from "SBIN-EQ", "SBIN" (its -EQ series) or
+    {"exchange", "tradingsymbol", "name"}, with its token resolved. Only that
+    exact symbol is accepted; a near miss raises ValueError.
+    """
+    if isinstance(item, dict):
+        exchange = item.get("exchange") or exchange
+        tradingsymbol, name = item.get("tradingsymbol"), item.get("name")
+    else:
+        tradingsymbol, name = item, None
+    if not isinstance(tradingsymbol, str) or not tradingsymbol.strip():
+        raise ValueError("tradingsymbol is required")
+    tradingsymbol = tradingsymbol.strip().upper()
+
+    # The master knows it exactly; otherwise the search has to come back with it, not a neighbour
+    scrip = lookup_scrip(exchange, tradingsymbol) or search_scrip_and_extract(tradingsymbol, exchange)
+    if scrip["tradingsymbol"].upper() not in (tradingsymbol, f"{tradingsymbol}-EQ"):
+        raise ValueError(f"No exact match for {exchange}:{tradingsymbol} (closest: {scrip['tradingsymbol']})")
+    tradingsymbol, token = scrip["tradingsymbol"], str(scrip["symboltoken"])
+
+    if not name:
+        master = get_master()
+        row = master.by_symbol(exchange, tradingsymbol) if master is not None else None
+        name = (row or {}).get("name") or tradingsymbol.rsplit("-", 1)[0]
+    return {"name": name, "exchange": exchange, "tradingsymbol": tradingsymbol, "symboltoken": token}
+
+
+def add_symbols(list_name, items, exchange="NSE", resolve=True):
+    """
+    Add symbols to a list (created on first use). Every symbol is resolved
+    first, so a typo is reported instead of stored. Returns
+    {"added": [...], "existing": [...], "errors": {symbol: message}}.
+    """
+    entries, errors = [], {}
+    for item in items:
+        try:
+            entries.append(_normalize(item, exchange) if resolve else dict(item))
+        except Exception as e:
+            label = item.get("tradingsymbol") if isinstance(item, dict) else item
+            errors[str(label)] = str(e)
+
+    report = {"added": [], "existing": [], "errors": errors}
+    if not entries:
+        return report
+
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"_id": entry_id(list_name, entry["exchange"], entry["tradingsymbol"])},
+            {"$setOnInsert": {
+                "list": list_name,
+                "name": entry.get("name"),
+                "exchange": entry["exchange"],
+                "tradingsymbol": entry["tradingsymbol"],
+                "symboltoken": entry.get("symboltoken"),
+                "addedAt": now,
+            }},
+            upsert=True,
+        )
+        for entry in entries
+    ]
+    result = db.watchlists.bulk_write(ops, ordered=False)
+    inserted = set((result.upserted_ids or {}).keys())
+    for i, entry in enumerate(entries):
+        report["added" if i in inserted else "existing"].append(entry["tradingsymbol"])
+    return report
+
+
+def remove_symbol(list_name, exchange, tradingsymbol):
+    return db.watchlists.delete_one({"_id": entry_id(list_name, exchange, tradingsymbol)}).deleted_count
+
+
+def delete_watchlist(list_name):
+    return db.watchlists.delete_many({"list": list_name}).deleted_count
+
+
+# ---------- live view ----------
+
+class WatchlistSync:
+    """
+    Every watchlist entry, kept in step with Mongo in the background, and the
+    universe they make up (each symbol once, whichever lists hold it).
+
+    Changes arrive through a change stream where the deployment has one
+    (replica set / Atlas) and through a periodic diff otherwise; after a
+    stream error a full diff catches up on anything missed. Subscribers get
+    update(added, removed) with only the symbols that entered or left the
+    universe, after the tokens of the added ones were resolved.
+    """
+
+    def __init__(self, mode=WATCHLIST_SYNC, poll_interval=WATCHLIST_POLL_INTERVAL):
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self._entries = {}   # _id -> entry
+        self._lists = {}     # (exchange, tradingsymbol) -> {list names}
+        self._stocks = {}    # (exchange, tradingsymbol) -> stock
+        # Held while a change is applied and handed to subscribers, and while a
+        # subscriber is built from the universe: none misses or repeats a change
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self._stop = threading.Event()
+
+    # ---------- reads ----------
+
+    def universe(self):
+        return list(self._stocks.values())
+
+    def lists(self):
+        with self._lock:
+            return {entry["list"] for entry in self._entries.values()}
+
+    def members(self, list_name):
+        with self._lock:
+            return [
+                self._stocks[(entry["exchange"], entry["tradingsymbol"])]
+                for entry in self._entries.values()
+                if entry["list"] == list_name
+            ]
+
+    def track(self, ensure):
+        """
+        ensure(stocks) -> a consumer with update(added, removed), built from the
+        universe as it is now and handed every later change of it. Returns the
+        consumer; one that is already tracked isn't subscribed twice.
+        """
+        with self._lock:
+            consumer = ensure(self.universe())
+            if all(s is not consumer for s in self._subscribers):
+                self._subscribers.append(consumer)
+            return consumer
+
+    # ---------- changes ----------
+
+    def _apply(self, upserts, deletes):
+        # upserts: {_id: entry}, deletes: [_id] -> (added, removed) stocks of the universe
+        added, removed = [], []
+        # Upserts first: a symbol moved from one list to another in the same diff never leaves the universe
+        for _id, entry in upserts.items():
+            key = (entry["exchange"], entry["tradingsymbol"])
+            self._entries[_id] = entry
+            if key not in self._stocks:
+                self._stocks[key] = {field: entry.get(field) for field in ("name", "exchange", "tradingsymbol")}
+                added.append(self._stocks[key])
+            self._lists.setdefault(key, set()).add(entry["list"])
+        for _id in deletes:
+            entry = self._entries.pop(_id, None)
+            list_name, key = _parse_id(_id)
+            lists = self._lists.get(key)
+            if lists is None:
+                continue
+            lists.discard(entry["list"] if entry else list_name)
+            if not lists:
+                del self._lists[key]
+                removed.append(self._stocks.pop(key))
+
+        WATCHLIST_SYMBOLS.set(len(self._stocks))
+        return added, removed
+
+    def _change(self, upserts, deletes):
+        # Pre-warm token lookups of new symbols before anyone is told about them,
+        # so subscribers (and the next request) don't wait on a search
+        for entry in upserts.values():
+            if (entry["exchange"], entry["tradingsymbol"]) in self._stocks:
+                continue
+            try:
+                resolve_symboltoken(entry["tradingsymbol"], entry["exchange"])
+            except Exception as e:
+                log.error("Can't resolve watchlist symbol %s:%s: %s", entry["exchange"], entry["tradingsymbol"], e)
+
+        with self._lock:
+            added, removed = self._apply(upserts, deletes)
+            if not added and not removed:
+                return
+            WATCHLIST_CHANGES.inc(len(added), change="added")
+            WATCHLIST_CHANGES.inc(len(removed), change="removed")
+            log.info("Watchlists changed: %d symbols added, %d removed", len(added), len(removed))
+
+            for subscriber in self._subscribers:
+                try:
+                    subscriber.update(added, removed)
+                except Exception as e:
+                    log.error("Watchlist subscriber %s failed: %s", type(subscriber).__name__, e)
+
+    def sync(self):
+        """Full read of the collection, applied as a diff against what we hold."""
+        current = {
+            doc["_id"]: {field: doc.get(field) for field in ENTRY_FIELDS}
+            for doc in db.watchlists.find({}, {field: 1 for field in ENTRY_FIELDS})
+        }
+        with self._lock:
+            known = dict(self._entries)
+        upserts = {_id: entry for _id, entry in current.items() if known.get(_id) != entry}
+        deletes = [_id for _id in known if _id not in current]
+        self._change(upserts, deletes)
+
+    def _watch(self):
+        # Blocks until the stream fails or stop() is called
+        with db.watchlists.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+            self.sync()  # anything changed between the last diff and the stream opening
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                if change["operationType"] in ("drop", "rename", "dropDatabase", "invalidate"):
+                    # The stream ends here (invalidate follows the others): take what is
+                    # there now and let _run open a new one
+                    self.sync()
+                    return
+                if "documentKey" not in change:
+                    continue
+                _id = change["documentKey"]["_id"]
+                if change["operationType"] == "delete":
+                    self._change({}, [_id])
+                elif change.get("fullDocument"):
+                    doc = change["fullDocument"]
+                    self._change({_id: {field: doc.get(field) for field in ENTRY_FIELDS}}, [])
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            if self.mode in ("auto", "stream"):
+                try:
+                    self._watch()
+                    backoff = 1
+                    continue
+                except (OperationFailure, AttributeError, NotImplementedError) as e:
+                    # No change streams here (standalone server, or the benchmark's in-memory db)
+                    if self.mode == "auto":
+                        log.info("Watchlist change stream unavailable, polling every %ss: %s", self.poll_interval, e)
+                        self.mode = "poll"
+                        continue
+                    log.error("Watchlist change stream failed: %s", e)
+                except PyMongoError as e:
+                    log.error("Watchlist change stream failed: %s", e)
+                except Exception as e:
+                    # Never let the thread die quietly: watchlist edits would stop reaching anyone
+                    log.error("Watchlist change stream crashed: %r", e)
+                if self._stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, 60)
+                continue
+
+            if self._stop.wait(self.poll_interval):
+                return
+            try:
+                self.sync()
+            except PyMongoError as e:
+                log.error("Watchlist poll failed: %s", e)
+            except Exception as e:
+                log.error("Watchlist poll crashed: %r", e)
+
+    def start(self):
+        try:
+            _seed_default()
+            self.sync()
+        except PyMongoError as e:
+            # Serve the hard-coded list until Mongo answers; the next sync diffs against it
+            log.error("Could not load watchlists, using the built-in list: %s", e)
+            with self._lock:
+                self._apply({
+                    entry_id(WATCHLIST_DEFAULT, s["exchange"], s["tradingsymbol"]): {**s, "list": WATCHLIST_DEFAULT}
+                    for s in WATCHSTOCKLIST
+                }, [])
+        threading.Thread(target=self._run, name="watchlist-sync", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+_watchlists = None
+_watchlists_pid = None
+_watchlists_lock = threading.Lock()
+
+
+def get_watchlists():
+    """The process's WatchlistSync, loaded and following Mongo from the first call on."""
+    global _watchlists, _watchlists_pid
+    if _watchlists_pid == os.getpid():
+        return _watchlists
+    with _watchlists_lock:
+        if _watchlists_pid != os.getpid():
+            _watchlists = WatchlistSync()
+            _watchlists.start()
+            _watchlists_pid = os.getpid()
+    return _watchlists
+
+
+def tracked_stocks(list_name=None):
+    """Every tracked symbol, or one list's (LookupError if there is no such list)."""
+    watchlists = get_watchlists()
+    if list_name is None:
+        return watchlists.universe()
+    stocks = watchlists.members(list_name)
+    if not stocks:
+        raise LookupError(f"No watchlist named {list_name}")
+    return stocks
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+IST = timezone(timedelta(hours=5, minutes=30))
+_IST_SECONDS = 5 * 3600 + 30 * 60
+
+FIELDS = ("ts", "open", "high", "low", "close", "volume")
+
+
+def parse_timestamps(values):
+    """
+    ISO-8601 strings ("2024-01-02T09:15:00+05:30") -> int64 epoch seconds, vectorized.
+
+    The first 19 characters go through NumPy's datetime64 parser; the
+    "+HH:MM"/"-HH:MM" offset is read from the raw bytes. "Z" means UTC and a
+    missing offset means exchange time (IST).
+    """
+    raw = np.asarray(values, dtype="S25")
+    if not len(raw):
+        return np.empty(0, dtype=np.int64)
+    local = raw.astype("S19").astype("datetime64[s]").astype(np.int64)
+
+    tail = raw.view(np.uint8).reshape(len(raw), 25)[:, 19:].astype(np.int64)
+    sign = np.where(tail[:, 0] == ord("+"), 1, np.where(tail[:, 0] == ord("-"), -1, 0))
+    digits = tail - ord("0")
+    offset = sign * ((digits[:, 1] * 10 + digits[:, 2]) * 3600 + (digits[:, 4] * 10 + digits[:, 5]) * 60)
+    offset = np.where(tail[:, 0] == 0, _IST_SECONDS, offset)
+    return local - offset
+
+
+class CandleSeries:
+    """
+    Candles as one contiguous array per field: ts (int64 epoch seconds of the
+    bar start), open/high/low/close (float64) and volume (int64), sorted by ts.
+
+    Slicing by position or time returns views, not copies. Indexing with a
+    field name returns that column, so a series can be passed straight to
+    utils.indicators.compute(). Dicts only appear in to_rows(), for JSON.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, ts, open, high, low, close, volume):
+        self.ts = ts
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty(0, np.int64), np.empty(0), np.empty(0), np.empty(0), np.empty(0), np.empty(0, np.int64),
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Broker rows [[iso datetime, o, h, l, c, v], ...] -> series, without a dict per row."""
+        if not rows:
+            return cls.empty()
+        ts, o, h, l, c, v = zip(*rows)
+        series = cls(
+            parse_timestamps(ts),
+            np.array(o, dtype=np.float64),
+            np.array(h, dtype=np.float64),
+            np.array(l, dtype=np.float64),
+            np.array(c, dtype=np.float64),
+            np.array(v, dtype=np.int64),
+        )
+        return series.sorted()
+
+    @classmethod
+    def from_array(cls, arr):
+        """From a structured array with the same field names (the candle store format)."""
+        return cls(*(np.ascontiguousarray(arr[field]) for field in FIELDS))
+
+    def to_array(self, dtype):
+        arr = np.empty(len(self), dtype=dtype)
+        for field in FIELDS:
+            arr[field] = getattr(self, field)
+        return arr
+
+    def sorted(self):
+        if len(self.ts) < 2 or np.all(self.ts[1:] >= self.ts[:-1]):
+            return self
+        order = np.argsort(self.ts, kind="stable")
+        return CandleSeries(*(getattr(self, field)[order] for field in FIELDS))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return getattr(self, item)
+        if isinstance(item, slice):
+            return CandleSeries(*(getattr(self, field)[item] for field in FIELDS))
+        raise TypeError("CandleSeries supports field names and slices")
+
+    def between(self, from_ts=None, to_ts=None):
+        """Bars with from_ts <= ts <= to_ts, as views (binary search on ts)."""
+        lo = 0 if from_ts is None else int(np.searchsorted(self.ts, from_ts, side="left"))
+        hi = len(self) if to_ts is None else int(np.searchsorted(self.ts, to_ts, side="right"))
+        return self[lo:hi]
+
+    def to_rows(self):
+        """List of dicts in the shape get_candle_data has always returned."""
+        return [
+            {
+                "datetime": datetime.fromtimestamp(ts, IST).isoformat(),
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "volume": v,
+            }
+            for ts, o, h, l, c, v in zip(*(getattr(self, field).tolist() for field in FIELDS))
+        ]
@@ -0,0 +1,155 @@
+import warnings
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Every function works on the last axis, so the same call handles one symbol
+# (1-D arrays) or a batch of symbols (2-D arrays, one row per symbol). Batches
+# are right-aligned and left-padded with NaN (see stack()); a value that needs
+# bars before the start of a row's history comes out as NaN.
+
+
+def stack(series_list, field):
+    """Right-align one field of several candle arrays into a NaN-padded 2-D array."""
+    length = max((len(s) for s in series_list), default=0)
+    out = np.full((len(series_list), length), np.nan)
+    for row, series in enumerate(series_list):
+        if len(series):
+            out[row, length - len(series):] = series[field]
+    return out
+
+
+def _windows(x, window):
+    # Pad on the left so output lines up with the input (first window-1 values NaN)
+    pad = [(0, 0)] * (x.ndim - 1) + [(window - 1, 0)]
+    return sliding_window_view(np.pad(x, pad, constant_values=np.nan), window, axis=-1)
+
+
+def sma(x, window):
+    # Exact window sums (a cumsum difference drifts on long series); NaN in a window -> NaN
+    return _windows(np.asarray(x, dtype=float), window).mean(axis=-1)
+
+
+def _ewm(x, alpha, window):
+    """Exponential smoothing seeded with the SMA of the first full window."""
+    x = np.asarray(x, dtype=float)
+    seed = sma(x, window)
+    out = np.full(x.shape, np.nan)
+    prev = np.full(x.shape[:-1], np.nan)
+    # Sequential in time, vectorized across symbols
+    for t in range(x.shape[-1]):
+        start = np.isnan(prev) & np.isfinite(seed[..., t])
+        prev = np.where(start, seed[..., t], alpha * x[..., t] + (1 - alpha) * prev)
+        out[..., t] = prev
+    return out
+
+
+def ema(x, window):
+    return _ewm(x, 2.0 / (window + 1), window)
+
+
+def rsi(close, window=14):
+    close = np.asarray(close, dtype=float)
+    delta = np.diff(close, axis=-1, prepend=np.nan)
+    gain = np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0.0))
+    loss = np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0.0))
+
+    avg_gain = _ewm(gain, 1.0 / window, window)
+    avg_loss = _ewm(loss, 1.0 / window, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        out = 100 - 100 / (1 + rs)
+    return np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), out)
+
+
+def atr(high, low, close, window=14):
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+    prev_close = np.concatenate([np.full(close.shape[:-1] + (1,), np.nan), close[..., :-1]], axis=-1)
+
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return _ewm(true_range, 1.0 / window, window)
+
+
+def rolling_high(high, window):
+    """Highest high over the last `window` bars (fewer if the history is shorter)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN windows
+        return np.nanmax(_windows(np.asarray(high, dtype=float), window), axis=-1)
+
+
+def rolling_low(low, window):
+    """Lowest low over the last `window` bars (fewer if the history is shorter)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmin(_windows(np.asarray(low, dtype=float), window), axis=-1)
+
+
+def returns(close, periods):
+    """Percent change of close over `periods` bars."""
+    close = np.asarray(close, dtype=float)
+    out = np.full(close.shape, np.nan)
+    if close.shape[-1] > periods:
+        past = close[..., :-periods]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[..., periods:] = np.where(past != 0, (close[..., periods:] - past) / past * 100, np.nan)
+    return out
+
+
+# Indicator spec "NAME_WINDOW" -> function of the OHLCV columns
+INDICATORS = {
+    "SMA": lambda c, w: sma(c["close"], w),
+    "EMA": lambda c, w: ema(c["close"], w),
+    "RSI": lambda c, w: rsi(c["close"], w),
+    "ATR": lambda c, w: atr(c["high"], c["low"], c["close"], w),
+    "HIGH": lambda c, w: rolling_high(c["high"], w),
+    "LOW": lambda c, w: rolling_low(c["low"], w),
+    "RET": lambda c, w: returns(c["close"], w),
+}
+
+
+# combined_data (and screener) field -> indicator spec
+COMBINED_INDICATORS = {
+    "DMA_5": "SMA_5",
+    "DMA_30": "SMA_30",
+    "DMA_50": "SMA_50",
+    "DMA_200": "SMA_200",
+    "1D%": "RET_1",
+    "5D%": "RET_5",
+    "30D%": "RET_30",
+    "1Y%": "RET_250",
+    "52W-High": "HIGH_250",
+    "52W-Low": "LOW_250",
+}
+
+
+def parse_spec(spec):
+    name, _, window = spec.upper().partition("_")
+    if name not in INDICATORS or not window.isdigit() or int(window) < 1:
+        raise ValueError(f"Unknown indicator '{spec}'")
+    return name, int(window)
+
+
+def compute(ohlcv, specs, latest=True):
+    """
+    Compute every indicator in `specs` (e.g. ["SMA_50", "RSI_14", "RET_5"]).
+
+    ohlcv maps "open"/"high"/"low"/"close"/"volume" to 1-D or 2-D arrays; a
+    candle structured array works as is. With latest=True only the value at the
+    last bar is returned (a float, or one value per row for a batch).
+    """
+    out = {}
+    for spec in specs:
+        name, window = parse_spec(spec)
+        series = INDICATORS[name](ohlcv, window)
+        out[spec] = series[..., -1] if latest and series.shape[-1] else series
+    return out
+
+
+def to_python(value, digits=None):
+    """NaN -> None and NumPy scalar -> float, optionally rounded, for JSON output."""
+    if value is None or not np.isfinite(value):
+        return None
+    value = float(value)
+    return round(value, digits) if digits is not None else value
@@ -0,0 +1,108 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from flask import Response, request
+
+from config.settings import JSON_ENCODER, COMPRESS_MIN_BYTES, COMPRESS_LEVEL
+
+
+def _default(value):
+    # Types the encoders don't know natively; same output whichever encoder is in use
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(obj):
+    # sort_keys like Flask's default provider, so key order doesn't change
+    return json.dumps(obj, default=_default, sort_keys=True, separators=(",", ":")).encode()
+
+
+def _make_dumps():
+    if JSON_ENCODER in ("auto", "orjson"):
+        try:
+            import orjson
+
+            options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+            def dumps(obj):
+                return orjson.dumps(obj, default=_default, option=options)
+
+            return "orjson", dumps
+        except ImportError:
+            pass
+
+    if JSON_ENCODER in ("auto", "msgspec"):
+        try:
+            import msgspec
+
+            encoder = msgspec.json.Encoder(enc_hook=_default, order="sorted")
+            return "msgspec", encoder.encode
+        except ImportError:
+            pass
+
+    return "stdlib", _stdlib_dumps
+
+
+# dumps(obj) -> bytes
+ENCODER_NAME, dumps = _make_dumps()
+
+
+def jsonify(*args, **kwargs):
+    """Drop-in for flask.jsonify that serializes with the fastest available encoder."""
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = list(args) if args else kwargs
+    return Response(dumps(data), mimetype="application/json")
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def compress_response(response):
+    """
+    after_request hook: brotli or gzip for large, buffered bodies the client
+    accepts. Streamed responses (SSE, NDJSON) handle their own encoding.
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code != 200
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body, encoding = compress(response.get_data(), request.accept_encodings)
+    if encoding:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def compress(body, accepted):
+    """(body, Content-Encoding or None) for an Accept-Encoding header parsed by werkzeug."""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=COMPRESS_LEVEL), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=COMPRESS_LEVEL), "gzip"
+    return body, None
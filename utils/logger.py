@@ -0,0 +1,66 @@
+import json
+import logging
+import sys
+
+from config.settings import LOG_FORMAT, LOG_LEVEL
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def _configure():
+    root = logging.getLogger("finbiznet")
+    root.propagate = False
+    if LOG_LEVEL == "OFF":
+        # Above CRITICAL: isEnabledFor() is False everywhere, nothing is formatted
+        root.setLevel(logging.CRITICAL + 1)
+        root.addHandler(logging.NullHandler())
+        return root
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    return root
+
+
+_root = _configure()
+
+
+def get_logger(name):
+    """
+    Logger under the "finbiznet" tree, e.g. get_logger(__name__). Pass values
+    as %-args or extra={...} fields rather than f-strings, so a disabled level
+    costs nothing.
+    """
+    return _root.getChild(name)
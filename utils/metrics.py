@@ -0,0 +1,189 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+from config.settings import METRICS_ENABLED
+
+# Seconds; covers a cache hit (sub-millisecond) up to a slow broker call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._lines(key, value))
+        return lines
+
+    def _lines(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with HISTOGRAM.time(method="ltpData"): ... observes the block's wall time, even when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _lines(self, key, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "smartapi_bp request latency (streamed bodies: until the response object)", ("route", "method", "status"),
+)
+
+
+def start_request_timer():
+    g._request_started = time.perf_counter()
+
+
+def observe_request(response):
+    started = g.get("_request_started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+    return response
+
+
+def register_collector(collect):
+    """
+    collect() is called at scrape time and returns [(name, kind, help,
+    [(labels dict, value), ...]), ...], for values that already live
+    elsewhere (lru_cache statistics, queue sizes).
+    """
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+def lru_cache_collector(functions):
+    """Collector for the hit/miss/size statistics of {"name": lru_cached_function}."""
+    def collect():
+        infos = {name: fn.cache_info() for name, fn in functions.items()}
+        return [
+            ("lru_cache_hits_total", "counter", "lru_cache hits", [({"cache": n}, i.hits) for n, i in infos.items()]),
+            ("lru_cache_misses_total", "counter", "lru_cache misses", [({"cache": n}, i.misses) for n, i in infos.items()]),
+            ("lru_cache_size", "gauge", "Entries in the lru_cache", [({"cache": n}, i.currsize) for n, i in infos.items()]),
+        ]
+    return collect
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (0.0.4)."""
+    with _registry_lock:
+        metrics, collectors = list(_metrics), list(_collectors)
+
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+
+    # Collectors may report the same family (e.g. several lru_cache groups)
+    families = {}
+    for collect in collectors:
+        for name, kind, help, samples in collect():
+            family = families.setdefault(name, (kind, help, []))
+            family[2].extend(samples)
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,208 @@
+import numpy as np
+
+# Every function takes NumPy arrays (one element per option) and works on the
+# whole chain at once; scalars broadcast. Times are in years, rates and
+# volatilities as decimals (0.065, 0.18).
+
+_SQRT2 = np.sqrt(2.0)
+_INV_SQRT_2PI = 1.0 / np.sqrt(2.0 * np.pi)
+
+
+# W. J. Cody's rational approximations for erfc (SPECFUN CALERF), accurate to
+# double precision. A low-order erf is not enough here: deep in-the-money prices
+# are mostly intrinsic, and a 1e-7 error in N(d) times the spot swamps the time value.
+_A = (3.16112374387056560e00, 1.13864154151050156e02, 3.77485237685302021e02, 3.20937758913846947e03, 1.85777706184603153e-1)
+_B = (2.36012909523441209e01, 2.44024637934444173e02, 1.28261652607737228e03, 2.84423683343917062e03)
+_C = (5.64188496988670089e-1, 8.88314979438837594e00, 6.61191906371416295e01, 2.98635138197400131e02,
+      8.81952221241769090e02, 1.71204761263407058e03, 2.05107837782607147e03, 1.23033935479799725e03,
+      2.15311535474403846e-8)
+_D = (1.57449261107098347e01, 1.17693950891312499e02, 5.37181101862009858e02, 1.62138957456669019e03,
+      3.29079923573345963e03, 4.36261909014324716e03, 3.43936767414372164e03, 1.23033935480374942e03)
+_P = (3.05326634961232344e-1, 3.60344899949804439e-1, 1.25781726111229246e-1, 1.60837851487422766e-2,
+      6.58749161529837803e-4, 1.63153871373020978e-2)
+_Q = (2.56852019228982242e00, 1.87295284992346725e00, 5.27905102951428412e-1, 6.05183413124413191e-2,
+      2.33520497626869185e-3)
+_INV_SQRT_PI = 5.6418958354775628695e-1
+
+
+def _exp_sq(y):
+    # exp(-y*y) split in two so the large part is exact
+    head = np.trunc(y * 16) / 16
+    return np.exp(-head * head) * np.exp(-(y - head) * (y + head))
+
+
+def erfc(x):
+    x = np.asarray(x, dtype=float)
+    y = np.abs(x)
+
+    # |x| <= 0.46875: erf series
+    ysq = y * y
+    num, den = _A[4] * ysq, ysq
+    for a, b in zip(_A[:3], _B[:3]):
+        num, den = (num + a) * ysq, (den + b) * ysq
+    small = 1 - x * (num + _A[3]) / (den + _B[3])
+
+    # 0.46875 < |x| <= 4
+    num, den = _C[8] * y, y
+    for c, d in zip(_C[:7], _D[:7]):
+        num, den = (num + c) * y, (den + d) * y
+    mid = _exp_sq(y) * (num + _C[7]) / (den + _D[7])
+
+    # |x| > 4
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        inv = 1 / (y * y)
+        num, den = _P[5] * inv, inv
+        for p, q in zip(_P[:4], _Q[:4]):
+            num, den = (num + p) * inv, (den + q) * inv
+        tail = _exp_sq(y) * (_INV_SQRT_PI - inv * (num + _P[4]) / (den + _Q[4])) / y
+    tail = np.where(y < 26.543, tail, 0.0)
+
+    upper = np.where(y <= 4, mid, tail)
+    upper = np.where(x < 0, 2 - upper, upper)
+    return np.where(y <= 0.46875, small, upper)
+
+
+def norm_cdf(x):
+    return 0.5 * erfc(-np.asarray(x, dtype=float) / _SQRT2)
+
+
+def norm_pdf(x):
+    return _INV_SQRT_2PI * np.exp(-0.5 * x * x)
+
+
+def _d1_d2(spot, strike, t, rate, sigma):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol_t = sigma * np.sqrt(t)
+        d1 = (np.log(spot / strike) + (rate + 0.5 * sigma * sigma) * t) / vol_t
+    return d1, d1 - vol_t
+
+
+def bs_price(spot, strike, t, rate, sigma, is_call):
+    d1, d2 = _d1_d2(spot, strike, t, rate, sigma)
+    discount = strike * np.exp(-rate * t)
+    call = spot * norm_cdf(d1) - discount * norm_cdf(d2)
+    put = discount * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+
+def _vega_raw(spot, strike, t, rate, sigma):
+    d1, _ = _d1_d2(spot, strike, t, rate, sigma)
+    return spot * norm_pdf(d1) * np.sqrt(t)
+
+
+def implied_vol(price, spot, strike, t, rate, is_call, tol=1e-6, max_iter=50, lo=1e-4, hi=5.0):
+    """
+    Black-Scholes implied volatility for a whole chain.
+
+    Newton steps on every option at once, each kept inside a per-option
+    bracket [lo, hi] that shrinks every iteration; a step that leaves the
+    bracket (or has no vega to work with) falls back to bisection, so every
+    option converges even deep in or out of the money. Prices outside the
+    no-arbitrage bounds come back NaN.
+    """
+    price, spot, strike, t, is_call = np.broadcast_arrays(
+        np.asarray(price, float), np.asarray(spot, float), np.asarray(strike, float),
+        np.asarray(t, float), np.asarray(is_call, bool),
+    )
+    discount = strike * np.exp(-rate * t)
+    intrinsic = np.where(is_call, np.maximum(spot - discount, 0), np.maximum(discount - spot, 0))
+    upper = np.where(is_call, spot, discount)
+    valid = np.isfinite(price) & (price > intrinsic) & (price < upper) & (t > 0)
+
+    lo = np.full(price.shape, lo)
+    hi = np.full(price.shape, hi)
+    # Brenner-Subrahmanyam start, good near the money
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.clip(np.sqrt(2 * np.pi / t) * price / spot, lo, hi)
+    sigma = np.where(np.isfinite(sigma), sigma, 0.3)
+
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        diff = bs_price(spot, strike, t, rate, sigma, is_call) - price
+        active &= np.abs(diff) > tol
+
+        # Price is increasing in sigma: shrink the bracket around the root
+        hi = np.where(active & (diff > 0), sigma, hi)
+        lo = np.where(active & (diff < 0), sigma, lo)
+
+        vega = _vega_raw(spot, strike, t, rate, sigma)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = sigma - diff / vega
+        use_newton = np.isfinite(newton) & (newton > lo) & (newton < hi) & (vega > 1e-8)
+        sigma = np.where(active, np.where(use_newton, newton, 0.5 * (lo + hi)), sigma)
+
+    return np.where(valid, sigma, np.nan)
+
+
+def greeks(spot, strike, t, rate, sigma, is_call):
+    """Delta, gamma, theta (per calendar day) and vega (per 1 vol point)."""
+    d1, d2 = _d1_d2(spot, strike, t, rate, sigma)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(t)
+    discount = np.exp(-rate * t)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma = pdf / (spot * sigma * sqrt_t)
+        decay = -spot * pdf * sigma / (2 * sqrt_t)
+    call_theta = decay - rate * strike * discount * norm_cdf(d2)
+    put_theta = decay + rate * strike * discount * norm_cdf(-d2)
+
+    return {
+        "delta": np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1),
+        "gamma": gamma,
+        "theta": np.where(is_call, call_theta, put_theta) / 365,
+        "vega": spot * pdf * sqrt_t / 100,
+    }
+
+
+def max_pain(strikes, call_oi, put_oi):
+    """
+    Expiry price (among the strikes) at which option writers pay out the least,
+    weighting each strike's intrinsic value by its open interest.
+    """
+    strikes = np.asarray(strikes, float)
+    if not len(strikes):
+        return None
+    settle = strikes[:, None]  # candidate expiry prices down the rows
+    payout = (
+        np.nan_to_num(call_oi) * np.maximum(settle - strikes, 0)
+        + np.nan_to_num(put_oi) * np.maximum(strikes - settle, 0)
+    ).sum(axis=1)
+    return float(strikes[np.argmin(payout)])
+
+
+def put_call_ratio(put_values, call_values):
+    calls = np.nansum(call_values)
+    return float(np.nansum(put_values) / calls) if calls else None
+
+
+def analyze(chain, spot, t, rate):
+    """
+    chain: dict of equal-length arrays, one element per option:
+      strike, is_call, ltp, oi, volume
+    Returns IV and Greeks per option plus chain-level max pain and PCRs.
+    """
+    strike = np.asarray(chain["strike"], float)
+    is_call = np.asarray(chain["is_call"], bool)
+    ltp = np.asarray(chain["ltp"], float)
+    oi = np.asarray(chain["oi"], float)
+    volume = np.asarray(chain["volume"], float)
+
+    iv = implied_vol(ltp, spot, strike, t, rate, is_call)
+    per_option = {"iv": iv, **greeks(spot, strike, t, rate, iv, is_call)}
+
+    # Strike grid for max pain: call and put OI summed per strike
+    strikes, inverse = np.unique(strike, return_inverse=True)
+    call_oi = np.bincount(inverse, weights=np.where(is_call, oi, 0), minlength=len(strikes))
+    put_oi = np.bincount(inverse, weights=np.where(is_call, 0, oi), minlength=len(strikes))
+
+    return {
+        "options": per_option,
+        "maxPain": max_pain(strikes, call_oi, put_oi),
+        "pcr": {
+            "oi": put_call_ratio(oi[~is_call], oi[is_call]),
+            "volume": put_call_ratio(volume[~is_call], volume[is_call]),
+        },
+    }
@@ -0,0 +1,239 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Filter and sort expressions for the screener, compiled once into functions of
+# the table's columns ({name: 1-D array}) that evaluate every row at once:
+#
+#   where:  above DMA_200 and 5D% > 3 and not (RSI_14 >= 70 or ltp < 100)
+#   sort:   -5D%, ltp / 52W-High          (ascending; a leading "-" sorts descending)
+#
+# Operands are numbers, column names (case-insensitive) and + - * / with
+# parentheses; comparisons are > >= < <= == != (= is ==). "above X" / "below X"
+# are short for ltp > X / ltp < X. A comparison with a missing value (NaN) is
+# unknown, so neither it nor its "not" matches (SQL's three-valued logic).
+# Nothing is ever passed to eval.
+
+_OPERATORS = re.compile(r"\s*(>=|<=|==|!=|>|<|=|\+|-|\*|/|\(|\)|,)")
+_NUMBER = re.compile(r"\s*(\d+(?:\.\d+)?|\.\d+)")
+_WORD = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_]*)")
+_KEYWORDS = {"and", "or", "not", "above", "below"}
+
+_COMPARE = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "=": np.equal,
+    "!=": np.not_equal,
+}
+_ARITHMETIC = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+
+
+def _tokenize(text, fields):
+    # Column names go first so "5D%" or "52W-High" aren't read as numbers and operators
+    names = sorted(fields, key=len, reverse=True)
+    field_re = re.compile(
+        r"\s*(" + "|".join(re.escape(name) for name in names) + r")(?![A-Za-z0-9_%])", re.IGNORECASE,
+    )
+    canonical = {name.lower(): name for name in fields}
+
+    tokens, pos = [], 0
+    while pos < len(text):
+        if not text[pos:].strip():
+            break
+        for kind, pattern in (("field", field_re), ("num", _NUMBER), ("op", _OPERATORS), ("word", _WORD)):
+            match = pattern.match(text, pos)
+            if match:
+                value = match.group(1)
+                start = match.start(1)
+                if kind == "field":
+                    value = canonical[value.lower()]
+                elif kind == "num":
+                    value = float(value)
+                elif kind == "word":
+                    if value.lower() not in _KEYWORDS:
+                        raise ValueError(f"Unknown field '{value}' at position {start}")
+                    kind, value = "op", value.lower()
+                tokens.append((kind, value, start))
+                pos = match.end()
+                break
+        else:
+            raise ValueError(f"Unexpected '{text[pos:].strip()[:10]}' at position {pos}")
+    tokens.append(("end", None, len(text)))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent; every rule returns (type, fn) with type "num" or "bool".
+    A "bool" fn returns two masks, (true, false): rows where the condition
+    certainly holds and where it certainly doesn't. Rows in neither are unknown.
+    """
+
+    def __init__(self, text, fields):
+        self.tokens = _tokenize(text, fields)
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i]
+
+    def take(self, *ops):
+        kind, value, _ = self.peek()
+        if kind == "op" and value in ops:
+            self.i += 1
+            return value
+        return None
+
+    def expect(self, op):
+        if not self.take(op):
+            self.fail(f"Expected '{op}'")
+
+    def fail(self, message):
+        kind, value, pos = self.peek()
+        found = "end of expression" if kind == "end" else f"'{value}'"
+        raise ValueError(f"{message}, found {found} at position {pos}")
+
+    def done(self):
+        if self.peek()[0] != "end":
+            self.fail("Unexpected token")
+
+    @staticmethod
+    def need(node, kind, what):
+        if node[0] != kind:
+            raise ValueError(f"{what} needs a {'condition' if kind == 'bool' else 'number'}")
+        return node[1]
+
+    # condition := and_expr ("or" and_expr)*
+    def condition(self):
+        node = self.conjunction()
+        while self.take("or"):
+            left, right = self.need(node, "bool", "'or'"), self.need(self.conjunction(), "bool", "'or'")
+            node = ("bool", lambda cols, l=left, r=right: _or(l(cols), r(cols)))
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.take("and"):
+            left, right = self.need(node, "bool", "'and'"), self.need(self.negation(), "bool", "'and'")
+            node = ("bool", lambda cols, l=left, r=right: _and(l(cols), r(cols)))
+        return node
+
+    def negation(self):
+        if self.take("not"):
+            inner = self.need(self.negation(), "bool", "'not'")
+            return ("bool", lambda cols: _not(inner(cols)))
+        return self.comparison()
+
+    def comparison(self):
+        side = self.take("above", "below")
+        if side:
+            bound = self.need(self.sum(), "num", f"'{side}'")
+            compare = np.greater if side == "above" else np.less
+            return ("bool", lambda cols: _compare(compare, cols["ltp"], bound(cols)))
+
+        node = self.sum()
+        op = self.take(*_COMPARE)
+        if not op:
+            return node
+        left, right = self.need(node, "num", f"'{op}'"), self.need(self.sum(), "num", f"'{op}'")
+        compare = _COMPARE[op]
+        return ("bool", lambda cols: _compare(compare, left(cols), right(cols)))
+
+    def sum(self):
+        node = self.product()
+        while True:
+            op = self.take("+", "-")
+            if not op:
+                return node
+            left, right = self.need(node, "num", f"'{op}'"), self.need(self.product(), "num", f"'{op}'")
+            node = ("num", lambda cols, f=_ARITHMETIC[op], l=left, r=right: f(l(cols), r(cols)))
+
+    def product(self):
+        node = self.unary()
+        while True:
+            op = self.take("*", "/")
+            if not op:
+                return node
+            left, right = self.need(node, "num", f"'{op}'"), self.need(self.unary(), "num", f"'{op}'")
+            node = ("num", lambda cols, f=_ARITHMETIC[op], l=left, r=right: f(l(cols), r(cols)))
+
+    def unary(self):
+        if self.take("-"):
+            inner = self.need(self.unary(), "num", "'-'")
+            return ("num", lambda cols: -inner(cols))
+        return self.atom()
+
+    def atom(self):
+        if self.take("("):
+            node = self.condition()
+            self.expect(")")
+            return node
+        kind, value, _ = self.peek()
+        if kind == "num":
+            self.i += 1
+            return ("num", lambda cols: value)
+        if kind == "field":
+            self.i += 1
+            return ("num", lambda cols: cols[value])
+        self.fail("Expected a field, number or '('")
+
+
+def _compare(compare, left, right):
+    known = ~(np.isnan(left) | np.isnan(right))
+    result = compare(left, right)
+    return result & known, ~result & known
+
+
+def _not(masks):
+    return masks[1], masks[0]
+
+
+def _and(left, right):
+    return left[0] & right[0], left[1] | right[1]
+
+
+def _or(left, right):
+    return left[0] | right[0], left[1] & right[1]
+
+
+def _quiet(fn):
+    # NaN and division by zero are expected in a screen; they just don't match
+    def run(cols):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return fn(cols)
+    return run
+
+
+@lru_cache(maxsize=256)
+def compile_where(text, fields):
+    """`where` expression -> fn(columns) returning a boolean mask. fields: tuple of column names."""
+    parser = _Parser(text, fields)
+    node = parser.condition()
+    parser.done()
+    fn = parser.need(node, "bool", "A filter")
+    return _quiet(lambda cols: np.asarray(fn(cols)[0], dtype=bool) & np.ones(len(cols["ltp"]), dtype=bool))
+
+
+@lru_cache(maxsize=256)
+def compile_sort(text, fields):
+    """`sort` expression list -> [fn(columns) returning a float key], primary key first."""
+    parser = _Parser(text, fields)
+    keys = []
+    while True:
+        keys.append(_quiet(parser.need(parser.sum(), "num", "A sort key")))
+        if not parser.take(","):
+            break
+    parser.done()
+    return keys
+
+
+def order(columns, rows, sort_keys):
+    """Positions `rows` (an index array) sorted by sort_keys, ascending with NaN last."""
+    if not sort_keys or not len(rows):
+        return rows
+    keys = [np.broadcast_to(np.asarray(key(columns), dtype=float), (len(columns["ltp"]),))[rows] for key in sort_keys]
+    # lexsort takes the primary key last
+    return rows[np.lexsort(keys[::-1])]